@@ -1,12 +1,37 @@
 # app.py (Versão Leve - SEM PANDAS)
 import gradio as gr
+import asyncio
 import os
 import time
 from services.ai_service import ai_service
-from services.sheets_service import sheets_service
+from services.storage import storage_service
 from models.schemas import CheckinContext, DrilldownRequest, CheckinFinal, GeminiResponse
 from fastapi import UploadFile # (Simulação)
-# import pandas as pd # <-- REMOVIDO
+from fastapi.responses import JSONResponse, PlainTextResponse
+from services.metrics import registro, medir_handler, CHECKINS_REPETIDOS
+from services.idempotencia import EnviosIdempotentes, chave_do_envio
+from services.enriquecimento import EnriquecedorCheckins, ANALISE_PENDENTE
+from services.supersessao import UltimoPedidoPorSessao, PedidoSuperado
+from services.circuit_breaker import FECHADO, ABERTO, MEIO_ABERTO
+
+# --- NOVO: Serviços montados em segundo plano enquanto a UI sobe ---
+storage_service.iniciar_em_segundo_plano()
+ai_service.iniciar_em_segundo_plano()
+
+# --- NOVO: Tamanho das páginas do histórico ---
+HISTORICO_PAGINA_PACIENTE = int(os.getenv("HISTORICO_PAGINA_PACIENTE", "20"))
+HISTORICO_PAGINA_PSICOLOGA = int(os.getenv("HISTORICO_PAGINA_PSICOLOGA", "50"))
+# --- NOVO: Resultados por página na busca da psicóloga ---
+BUSCA_PAGINA_PSICOLOGA = int(os.getenv("BUSCA_PAGINA_PSICOLOGA", "20"))
+# --- NOVO: Caixa de entrada de recados ---
+RECADOS_POLL_SECONDS = float(os.getenv("RECADOS_POLL_SECONDS", "30"))
+RECADOS_NA_CAIXA = 20
+# --- NOVO: Duplo clique / reenvio do mesmo check-in reaproveita o envio original ---
+envios_checkin = EnviosIdempotentes()
+# --- NOVO: O check-in é salvo antes da análise; a IA preenche a linha depois ---
+enriquecedor = EnriquecedorCheckins(ai_service, storage_service)
+# --- NOVO: Slider/recarregar em sequência: só o último pedido de sugestões da sessão segue vivo ---
+pedidos_sugestoes = UltimoPedidoPorSessao("sugestoes")
 
 # --- Lista de Áreas (Alfabética) ---
 areas_de_vida = [
@@ -27,22 +52,31 @@ areas_de_vida = [
 # --- Funções de Lógica ---
 # (fn_on_app_load, fn_toggle_signup_form, fn_login, fn_handle_role, fn_create_user - Sem mudanças)
 # ... (Omitido para encurtar) ...
-def fn_on_app_load():
+_aquecimento_sugestoes = None
+@medir_handler
+async def fn_on_app_load():
+    # --- NOVO --- Na primeira carga de página, aquece o cache de sugestões (uma vez só)
+    global _aquecimento_sugestoes
+    if _aquecimento_sugestoes is None:
+        _aquecimento_sugestoes = asyncio.create_task(ai_service.aquecer_sugestoes(areas_de_vida))
     print("Carregando lista de psicólogas...")
-    lista_psicologas = sheets_service.get_psicologas_list_for_signup()
+    lista_psicologas = await storage_service.get_psicologas_list_for_signup()
     return gr.update(choices=lista_psicologas)
+@medir_handler
 def fn_toggle_signup_form(is_novo_usuario_check):
     return gr.update(visible=is_novo_usuario_check), gr.update(visible=is_novo_usuario_check)
-def fn_login(username, password):
+@medir_handler
+async def fn_login(username, password):
     if not username or not password:
         return None, gr.update(value="Usuário ou senha não podem estar em branco.", visible=True)
-    login_valido, role, psicologa_associada = sheets_service.check_user(username, password)
+    login_valido, role, psicologa_associada = await storage_service.check_user(username, password)
     if login_valido:
         user_data = {"username": username, "role": role, "psicologa_associada": psicologa_associada}
         return user_data, gr.update(value="", visible=False)
     else:
         return None, gr.update(value="Login falhou. Verifique seu usuário e senha.", visible=True)
-def fn_handle_role(user_data, request: gr.Request):
+@medir_handler
+async def fn_handle_role(user_data, request: gr.Request):
     if not user_data: 
         return gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), \
                gr.update(value=""), gr.update(choices=[]), gr.update(choices=[]), gr.update(choices=[])
@@ -54,35 +88,42 @@ def fn_handle_role(user_data, request: gr.Request):
                gr.update(value=psicologa_associada), gr.update(choices=[]), gr.update(choices=[]), gr.update(choices=[])
     elif role == "Psicóloga":
         print(f"Mostrando UI de Psicóloga para {user_data.get('username')}")
-        lista_pacientes = sheets_service.get_pacientes_da_psicologa(user_data.get("username"))
+        lista_pacientes = await storage_service.get_pacientes_da_psicologa(user_data.get("username"))
         return gr.update(visible=False), gr.update(visible=False), gr.update(visible=True), \
                gr.update(value="N/A"), gr.update(choices=lista_pacientes), gr.update(choices=lista_pacientes), gr.update(choices=lista_pacientes)
     else: # Fallback
         return gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), \
                gr.update(value=""), gr.update(choices=[]), gr.update(choices=[]), gr.update(choices=[])
-def fn_create_user(username, password, psicologa_selecionada):
-    success, message = sheets_service.create_user(username, password, psicologa_selecionada)
+@medir_handler
+async def fn_create_user(username, password, psicologa_selecionada):
+    success, message = await storage_service.create_user(username, password, psicologa_selecionada)
     return gr.update(value=message, visible=True)
 
 
 # --- Funções do Paciente ---
-async def fn_get_suggestions_paciente(area, sentimento_float):
-    # (Sem mudanças)
+@medir_handler
+async def fn_get_suggestions_paciente(area, sentimento_float, request: gr.Request = None):
     try:
         contexto_data = CheckinContext(area=area, sentimento=sentimento_float)
-        response_data = await ai_service.get_suggestions(contexto_data)
+        # --- ATUALIZADO: um pedido mais novo da mesma sessão cancela este (e a chamada ao Gemini) ---
+        sessao = getattr(request, "session_hash", None)
+        response_data = await pedidos_sugestoes.executar(sessao, lambda: ai_service.get_suggestions(contexto_data))
         sugestoes = response_data.get("sugestoes", [])
         return (
             gr.update(choices=sugestoes, value=None, visible=True), 
             gr.update(visible=True), gr.update(visible=False), 
             gr.update(visible=False), gr.update(visible=False) 
         )
+    except PedidoSuperado:
+        # A tela fica com o que o pedido mais novo mostrar
+        return tuple(gr.skip() for _ in range(5))
     except Exception as e:
         print(f"Erro ao chamar ai_service.get_suggestions: {e}")
         return (
             gr.update(choices=[], value=None, visible=False), gr.update(visible=False),
             gr.update(visible=False), gr.update(visible=False), gr.update(visible=False)
         )
+@medir_handler
 async def fn_get_drilldown_paciente(topicos_selecionados):
     # (Sem mudanças)
     if not topicos_selecionados:
@@ -97,6 +138,7 @@ async def fn_get_drilldown_paciente(topicos_selecionados):
     except Exception as e:
         print(f"Erro ao chamar ai_service.get_drilldown_questions: {e}")
         return gr.update(visible=False), gr.update(label="Meu Diário"), gr.update(value=None), gr.update(visible=False), gr.update(visible=False)
+@medir_handler
 def fn_update_diario_from_outro(outro_topico_texto):
     # (Sem mudanças)
     if not outro_topico_texto:
@@ -109,16 +151,19 @@ def fn_update_diario_from_outro(outro_topico_texto):
         gr.update(visible=True), gr.update(label=f"Sobre: '{outro_topico_texto}'"),
         gr.update(value=markdown_text), gr.update(visible=True), gr.update(visible=True)
     )
-async def fn_submit_checkin_paciente(user_data_do_state, area, sentimento_float, topicos_selecionados, outro_topico_texto, diaro_texto, compartilhado_bool):
-    # (Sem mudanças)
+# --- FUNÇÃO ATUALIZADA (Streaming) ---
+@medir_handler
+async def fn_submit_checkin_paciente(user_data_do_state, area, sentimento_float, topicos_selecionados, outro_topico_texto, diaro_texto, compartilhado_bool, request: gr.Request = None):
+    # Gerador: mostra o insight enquanto o Gemini escreve e só salva a análise final validada
     if not user_data_do_state or "username" not in user_data_do_state:
-        return gr.update(value="### ❌ Erro: Usuário não autenticado.", visible=True), gr.update(visible=False)
+        yield gr.update(value="### ❌ Erro: Usuário não autenticado.", visible=True), gr.update(visible=False), None
+        return
     paciente_id = user_data_do_state["username"]
     role = user_data_do_state["role"]
     psicologa_id = user_data_do_state["psicologa_associada"] if role == "Paciente" else user_data_do_state["username"]
     if not psicologa_id: psicologa_id = "N/A" 
     try:
-        topicos_finais = topicos_selecionados
+        topicos_finais = list(topicos_selecionados or [])
         diario_para_salvar = diaro_texto
         diario_para_analise = diaro_texto
         if outro_topico_texto:
@@ -126,13 +171,58 @@ async def fn_submit_checkin_paciente(user_data_do_state, area, sentimento_float,
             diario_para_analise = f"Tópico principal escrito pelo usuário: {outro_topico_texto}.\n\nDiário: {diaro_texto}"
         checkin_data = CheckinFinal(area=area, sentimento=sentimento_float,
                                     topicos_selecionados=topicos_finais, diario_texto=diario_para_salvar)
-        gemini_data = await ai_service.process_final_checkin(checkin_data, diario_para_analise)
-        sheets_service.write_checkin(checkin_data, gemini_data, paciente_id, psicologa_id, compartilhado_bool)
+
+        async def executar(envio):
+            # Roda fora do handler: um reenvio acompanha esta mesma tarefa
+            if not diario_para_analise:
+                # Sem diário não há o que analisar (a resposta sai na hora, sem o Gemini)
+                gemini_data = await ai_service.process_final_checkin(checkin_data, diario_para_analise)
+                return gemini_data, await storage_service.write_checkin(checkin_data, gemini_data, paciente_id, psicologa_id, compartilhado_bool)
+            # --- ATUALIZADO: salvo na hora com a análise pendente; a análise chega depois, na mesma linha ---
+            registro_id = await storage_service.write_checkin(checkin_data, ANALISE_PENDENTE, paciente_id, psicologa_id, compartilhado_bool)
+            envio.publicar({"registro_id": registro_id})
+            analise = enriquecedor.iniciar(registro_id, paciente_id, checkin_data, diario_para_analise)
+            async for parcial in analise.acompanhar():
+                envio.publicar({**parcial, "registro_id": registro_id})
+            return await analise.resultado(), registro_id
+
+        # --- NOVO: mesma sessão + mesmo conteúdo = mesmo envio (sem nova análise nem nova linha) ---
+        sessao = getattr(request, "session_hash", None) or paciente_id
+        chave = chave_do_envio(sessao, paciente_id, psicologa_id, checkin_data, diario_para_analise, compartilhado_bool)
+        envio, repetido = envios_checkin.iniciar(chave, executar)
+        if repetido:
+            CHECKINS_REPETIDOS.inc(estado="concluido" if envio.tarefa.done() else "em_andamento")
+            print(f"Check-in repetido de {paciente_id}: respondendo com o envio original.")
         msg = f"Check-in de {paciente_id} salvo com sucesso!"
         if compartilhado_bool:
             msg_compartilhado = f"Este registro **foi compartilhado** com {psicologa_id}."
         else:
             msg_compartilhado = "Este registro **NÃO** foi compartilhado (privado)."
+        async for parcial in envio.acompanhar():
+            # Já salvo: o descarte fica disponível enquanto a análise chega
+            parcial_md = f"""
+        ### ✅ {msg}
+        **Status:** {msg_compartilhado}
+        ### ⏳ Analisando seu diário...
+        """
+            if parcial.get("insight"):
+                parcial_md += f"""**Insight Rápido:** {parcial["insight"]}
+        """
+            if parcial.get("acao"):
+                parcial_md += f"""---
+        **Uma Pequena Ação para Agora:** {parcial["acao"]}
+        """
+            yield gr.update(value=parcial_md, visible=True), gr.update(visible=True), parcial["registro_id"]
+        gemini_data, registro_id = await envio.resultado()
+        if gemini_data is None:
+            feedback = f"""
+        ### ✅ {msg}
+        **Status:** {msg_compartilhado}
+        ---
+        A análise do seu diário não ficou pronta agora. Ela continua em segundo plano e vai aparecer no seu histórico.
+        """
+            yield gr.update(value=feedback, visible=True), gr.update(visible=True), registro_id
+            return
         feedback = f"""
         ### ✅ {msg}
         **Status:** {msg_compartilhado}
@@ -145,41 +235,58 @@ async def fn_submit_checkin_paciente(user_data_do_state, area, sentimento_float,
         * **Temas Principais:** {", ".join(gemini_data.temas)}
         * **Resumo:** {gemini_data.resumo}
         """
-        return gr.update(value=feedback, visible=True), gr.update(visible=True)
+        # O registro_id vai para o state: o botão de descarte age só sobre este registro
+        yield gr.update(value=feedback, visible=True), gr.update(visible=True), registro_id
     except Exception as e:
         print(f"Erro no fn_submit_checkin: {e}")
-        return gr.update(value=f"Erro ao processar o check-in: {e}", visible=True), gr.update(visible=False)
-def fn_delete_last_record_paciente(user_data_do_state):
-    # (Sem mudanças)
-    if not user_data_do_state: return gr.update(visible=False), gr.update(value="Erro: Usuário não logado.")
+        yield gr.update(value=f"Erro ao processar o check-in: {e}", visible=True), gr.update(visible=False), None
+# --- FUNÇÃO ATUALIZADA: descarta pelo registro_id do check-in recém-salvo ---
+@medir_handler
+async def fn_delete_last_record_paciente(user_data_do_state, registro_id):
+    if not user_data_do_state: return gr.update(visible=False), gr.update(value="Erro: Usuário não logado."), None
     paciente_id = user_data_do_state["username"]
-    sheets_service.delete_last_record(paciente_id)
-    return gr.update(visible=False), gr.update(value="### ✅ Registro descartado com sucesso.", visible=True)
+    if not registro_id or not await storage_service.discard_checkin(paciente_id, registro_id):
+        return gr.update(visible=False), gr.update(value="### ❌ Não foi possível descartar o registro.", visible=True), None
+    # Descartado: enviar o mesmo check-in de novo volta a gravar, e a análise pendente não é mais escrita
+    # (também se a análise ainda está chegando: o envio publica o registro_id logo depois de gravar)
+    envios_checkin.esquecer(lambda resultado: resultado[1] == registro_id,
+                            lambda parcial: parcial.get("registro_id") == registro_id)
+    enriquecedor.cancelar(registro_id)
+    return gr.update(visible=False), gr.update(value="### ✅ Registro descartado com sucesso.", visible=True), None
+
+# --- NOVO: Navegação entre páginas do histórico ---
+def _controles_paginacao(paginacao, mais_antigos, mais_recentes):
+    """Guarda os cursores no estado e habilita só os botões que têm página para mostrar."""
+    paginacao = {**(paginacao or {}), "antigos": mais_antigos, "recentes": mais_recentes}
+    return (paginacao,
+            gr.update(visible=True, interactive=mais_recentes is not None),
+            gr.update(visible=True, interactive=mais_antigos is not None))
+
+def _sem_paginacao():
+    return None, gr.update(visible=False), gr.update(visible=False)
 
-# --- FUNÇÃO ATUALIZADA (SEM PANDAS) ---
-def fn_load_history_paciente(user_data_do_state):
-    if not user_data_do_state: return gr.update(value=None), gr.update(value="Erro: Usuário não logado.", visible=True)
+# --- FUNÇÃO ATUALIZADA: uma página por vez, navegando por cursor ---
+@medir_handler
+async def fn_load_history_paciente(user_data_do_state, cursor=None):
+    if not user_data_do_state: return gr.update(value=None), gr.update(value="Erro: Usuário não logado.", visible=True), *_sem_paginacao()
     paciente_id = user_data_do_state["username"]
-    headers, all_rows = sheets_service.get_all_checkin_data()
+    # Busca só as linhas da página pedida (via índice), já em ordem decrescente
+    headers, user_history, mais_antigos, mais_recentes = await storage_service.get_pagina_checkins_paciente(
+        paciente_id, tamanho=HISTORICO_PAGINA_PACIENTE, cursor=cursor
+    )
     if not headers:
-        return gr.update(value=None), gr.update(value="Nenhum dado encontrado na planilha.", visible=True)
-    try:
-        id_col_index = headers.index('paciente_id')
-    except ValueError:
-        return gr.update(value=None), gr.update(value="Erro: Coluna 'paciente_id' não encontrada.", visible=True)
-    user_history = [row for row in all_rows if len(row) > id_col_index and row[id_col_index] == paciente_id]
+        return gr.update(value=None), gr.update(value="Nenhum dado encontrado na planilha.", visible=True), *_sem_paginacao()
     if not user_history:
-        return gr.update(value=None), gr.update(value="Nenhum histórico encontrado para este usuário.", visible=True)
-    user_history.reverse()
+        return gr.update(value=None), gr.update(value="Nenhum histórico encontrado para este usuário.", visible=True), *_sem_paginacao()
     
     colunas_db = ['timestamp', 'area', 'sentimento', 'topicos_selecionados', 'diario_texto', 'insight_ia', 'acao_proposta', 'sentimento_texto', 'temas_gemini', 'resumo_psicologa', 'psicologa_id', 'compartilhado']
     # colunas_display já estava definida
     try:
         col_indices = [headers.index(col) for col in colunas_db]
     except ValueError as e:
-        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True)
+        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True), *_sem_paginacao()
     
-    display_data = [[row[i] for i in col_indices] for row in user_history[:20]]
+    display_data = [[row[i] for i in col_indices] for row in user_history]
     
     try:
         compartilhado_index = colunas_db.index('compartilhado') # Usa o índice da lista colunas_db
@@ -192,86 +299,130 @@ def fn_load_history_paciente(user_data_do_state):
         print(f"Erro ao formatar coluna 'compartilhado': {e}")
         
     # --- MUDANÇA: Em vez de um DataFrame, retorna os dados puros ---
-    return gr.update(value=display_data, visible=True), gr.update(visible=False)
+    return gr.update(value=display_data, visible=True), gr.update(visible=False), *_controles_paginacao(None, mais_antigos, mais_recentes)
 
-def fn_load_recados_paciente(user_data_do_state):
-    # (Sem mudanças)
-    if not user_data_do_state: return gr.update(value=None), gr.update(value="Erro: Usuário não logado.", visible=True)
+@medir_handler
+async def fn_history_paciente_antigos(user_data_do_state, paginacao):
+    return await fn_load_history_paciente(user_data_do_state, (paginacao or {}).get("antigos"))
+
+@medir_handler
+async def fn_history_paciente_recentes(user_data_do_state, paginacao):
+    return await fn_load_history_paciente(user_data_do_state, (paginacao or {}).get("recentes"))
+
+# --- FUNÇÃO ATUALIZADA: busca só os recados que chegaram desde a última verificação ---
+@medir_handler
+async def fn_load_recados_paciente(user_data_do_state, caixa):
+    if not user_data_do_state: return gr.update(value=None), gr.update(value="Erro: Usuário não logado.", visible=True), caixa, gr.update()
     paciente_id = user_data_do_state["username"]
-    headers, recados = sheets_service.get_recados_paciente(paciente_id)
-    if not recados:
-        return gr.update(value=None), gr.update(value="Nenhum recado encontrado.", visible=True)
+    caixa = caixa or {"cursor": None, "recados": []}
+    headers, novos, cursor, _ = await storage_service.get_recados_desde(paciente_id, caixa["cursor"], limite=RECADOS_NA_CAIXA)
+    if cursor != caixa["cursor"]:
+        # O último visto fica no armazenamento: vale para o próximo login e para o aviso de não lidos
+        await storage_service.marcar_recados_vistos(paciente_id, cursor)
+    if not headers and not caixa["recados"]:
+        return gr.update(value=None), gr.update(value="Nenhum recado encontrado.", visible=True), caixa, gr.update()
     colunas_db = ['timestamp', 'psicologa_id', 'mensagem_texto']
     # colunas_display já estava definida
     try:
-        col_indices = [headers.index(col) for col in colunas_db]
+        col_indices = [headers.index(col) for col in colunas_db] if novos else []
     except ValueError as e:
-        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True)
-    display_data = [[row[i] for i in col_indices] for row in recados]
+        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True), caixa, gr.update()
+    # Os já vistos ficam no estado da sessão; só os novos vêm do armazenamento
+    recados = ([[row[i] for i in col_indices] for row in novos] + caixa["recados"])[:RECADOS_NA_CAIXA]
+    caixa = {"cursor": cursor, "recados": recados}
+    rotulo = gr.update(label="Recados da Psicóloga")
+    if not recados:
+        return gr.update(value=None), gr.update(value="Nenhum recado encontrado.", visible=True), caixa, rotulo
     
     # --- MUDANÇA: Em vez de um DataFrame, retorna os dados puros ---
-    return gr.update(value=display_data, visible=True), gr.update(visible=False)
+    return gr.update(value=recados, visible=True), gr.update(visible=False), caixa, rotulo
+
+# --- NOVO: Aviso de recados não lidos (gr.Timer) ---
+@medir_handler
+async def fn_poll_recados_paciente(user_data_do_state, caixa):
+    """Só conta o que chegou depois do último recado visto (em qualquer sessão); não marca nada como lido."""
+    if not user_data_do_state or user_data_do_state.get("role") != "Paciente":
+        return gr.update()
+    paciente_id = user_data_do_state["username"]
+    cursor = await storage_service.get_recados_vistos(paciente_id) or (caixa or {}).get("cursor")
+    _, _, _, nao_lidos = await storage_service.get_recados_desde(paciente_id, cursor, limite=0)
+    if not nao_lidos:
+        return gr.update(label="Recados da Psicóloga")
+    return gr.update(label=f"Recados da Psicóloga (📬 {nao_lidos} novo{'s' if nao_lidos > 1 else ''})")
+
+@medir_handler
+def fn_ativar_poll_recados(user_data):
+    # Outro login na mesma aba começa com a caixa vazia
+    return gr.Timer(active=bool(user_data) and user_data.get("role") == "Paciente"), None
 
 
 # --- Funções da Psicóloga ---
 
-# --- FUNÇÃO ATUALIZADA (SEM PANDAS) ---
-def fn_load_history_psicologa(paciente_selecionado):
+# --- FUNÇÃO ATUALIZADA: uma página por vez, navegando por cursor ---
+@medir_handler
+async def fn_load_history_psicologa(paciente_selecionado, cursor=None):
     if not paciente_selecionado or "Nenhum" in paciente_selecionado:
-        return gr.update(value=None), gr.update(value="Por favor, selecione um paciente.", visible=True)
+        return gr.update(value=None), gr.update(value="Por favor, selecione um paciente.", visible=True), *_sem_paginacao()
     print(f"Psicóloga carregando histórico de: {paciente_selecionado}")
-    headers, all_rows = sheets_service.get_all_checkin_data()
+    headers, paciente_history, mais_antigos, mais_recentes = await storage_service.get_pagina_checkins_paciente(
+        paciente_selecionado, apenas_compartilhados=True, tamanho=HISTORICO_PAGINA_PSICOLOGA, cursor=cursor
+    )
     if not headers:
-        return gr.update(value=None), gr.update(value="Nenhum dado encontrado.", visible=True)
-    try:
-        id_col_index = headers.index('paciente_id')
-        share_col_index = headers.index('compartilhado')
-    except ValueError as e:
-        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True)
-    paciente_history = [
-        row for row in all_rows 
-        if len(row) > id_col_index and len(row) > share_col_index
-        and row[id_col_index] == paciente_selecionado
-        and str(row[share_col_index]).upper() == 'TRUE'
-    ]
+        return gr.update(value=None), gr.update(value="Nenhum dado encontrado.", visible=True), *_sem_paginacao()
     if not paciente_history:
-        return gr.update(value=None), gr.update(value=f"Nenhum registro *compartilhado* encontrado para {paciente_selecionado}.", visible=True)
-    paciente_history.reverse()
+        return gr.update(value=None), gr.update(value=f"Nenhum registro *compartilhado* encontrado para {paciente_selecionado}.", visible=True), *_sem_paginacao()
     
     colunas_db = ['timestamp', 'area', 'sentimento', 'topicos_selecionados', 'diario_texto', 'sentimento_texto', 'temas_gemini', 'resumo_psicologa']
     # colunas_display já estava definida
     try:
         col_indices = [headers.index(col) for col in colunas_db]
     except ValueError as e:
-        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True)
+        return gr.update(value=None), gr.update(value=f"Erro: A coluna {e} não foi encontrada.", visible=True), *_sem_paginacao()
     
-    display_data = [[row[i] for i in col_indices] for row in paciente_history[:50]]
+    display_data = [[row[i] for i in col_indices] for row in paciente_history]
     
     # --- MUDANÇA: Em vez de um DataFrame, retorna os dados puros ---
-    return gr.update(value=display_data, visible=True), gr.update(visible=False)
+    # O paciente fica no estado: trocar o dropdown não mistura cursores de pacientes diferentes
+    return gr.update(value=display_data, visible=True), gr.update(visible=False), *_controles_paginacao(
+        {"paciente": paciente_selecionado}, mais_antigos, mais_recentes
+    )
+
+@medir_handler
+async def fn_history_psicologa_antigos(paginacao):
+    paginacao = paginacao or {}
+    return await fn_load_history_psicologa(paginacao.get("paciente"), paginacao.get("antigos"))
+
+@medir_handler
+async def fn_history_psicologa_recentes(paginacao):
+    paginacao = paginacao or {}
+    return await fn_load_history_psicologa(paginacao.get("paciente"), paginacao.get("recentes"))
 
-def fn_load_ultimo_diario_psicologa(paciente_selecionado):
+@medir_handler
+async def fn_load_ultimo_diario_psicologa(paciente_selecionado):
     # (Sem mudanças)
     if not paciente_selecionado or "Nenhum" in paciente_selecionado:
         return gr.update(value=""), gr.update(value="Selecione um paciente para carregar o diário.", visible=True)
-    diario, msg = sheets_service.get_ultimo_diario_paciente(paciente_selecionado)
+    diario, msg = await storage_service.get_ultimo_diario_paciente(paciente_selecionado)
     if not diario:
         return gr.update(value=""), gr.update(value=msg, visible=True)
     return gr.update(value=diario), gr.update(visible=False)
 
+# --- FUNÇÃO ATUALIZADA (Streaming) ---
+@medir_handler
 async def fn_gerar_sugestao_recado_psicologa(diario_do_paciente, rascunho_atual):
-    # (Sem mudanças)
+    # Gerador: o recado sugerido vai aparecendo no campo enquanto o Gemini escreve
     if not diario_do_paciente:
-        return gr.update(value="Carregue o diário do paciente primeiro.")
+        yield gr.update(value="Carregue o diário do paciente primeiro.")
+        return
     try:
-        response_data = await ai_service.get_sugestao_recado_psicologa(diario_do_paciente, rascunho_atual)
-        recado_sugerido = response_data.get("recado", "Não foi possível gerar sugestão.")
-        return gr.update(value=recado_sugerido)
+        async for recado_sugerido in ai_service.stream_sugestao_recado(diario_do_paciente, rascunho_atual):
+            yield gr.update(value=recado_sugerido)
     except Exception as e:
         print(f"Erro na fn_gerar_sugestao_recado: {e}")
-        return gr.update(value=f"Erro: {e}")
+        yield gr.update(value=f"Erro: {e}")
 
-def fn_send_recado_psicologa(user_data_do_state, paciente_selecionado, mensagem_texto):
+@medir_handler
+async def fn_send_recado_psicologa(user_data_do_state, paciente_selecionado, mensagem_texto):
     # (Sem mudanças)
     if not user_data_do_state or "username" not in user_data_do_state:
         return gr.update(value="Erro: Usuário não autenticado.", visible=True)
@@ -280,22 +431,107 @@ def fn_send_recado_psicologa(user_data_do_state, paciente_selecionado, mensagem_
     if not mensagem_texto:
         return gr.update(value="Erro: A mensagem não pode estar vazia.", visible=True)
     psicologa_id = user_data_do_state["username"]
-    success, message = sheets_service.send_recado(psicologa_id, paciente_selecionado, mensagem_texto)
+    success, message = await storage_service.send_recado(psicologa_id, paciente_selecionado, mensagem_texto)
     if success:
         return gr.update(value=message, visible=True)
     else:
         return gr.update(value=f"Erro: {message}", visible=True)
 
-def get_tableau_html():
-    # (Sem mudanças)
-    tableau_url = "https://public.tableau.com/views/RegionalSampleWorkbook/Storms"
-    html_embed = f"""
-    <iframe src="{tableau_url}?:showVizHome=no&:embed=true"
-            width="100%" height="800px" frameborder="0" 
-            allowtransparency="true" allowfullscreen="true">
-    </iframe>
-    """
-    return html_embed
+# --- NOVO: Aba Analytics (substitui o painel de exemplo do Tableau) ---
+def _pacientes_reais(lista_pacientes):
+    # get_pacientes_da_psicologa devolve mensagens ("Nenhum paciente...", "Erro ...") no lugar da lista
+    return [p for p in lista_pacientes if not p.startswith(("Nenhum", "Erro"))]
+
+def _formatar_tendencia(tendencia):
+    if tendencia is None:
+        return "—"
+    return f"{round(tendencia, 2) or 0.0:+.2f}"  # evita '-0.00'
+
+def _graficos_analise(relatorios, paciente_selecionado):
+    """Gráficos e tabela por área do paciente escolhido, a partir dos relatórios já calculados."""
+    # O app continua sem pandas: só os gráficos nativos do Gradio (LinePlot/BarPlot) exigem DataFrame
+    import pandas as pd
+    relatorio = next((r for r in relatorios or [] if r["paciente"] == paciente_selecionado), None)
+    if relatorio is None:
+        semanal, areas, temas, sentimentos = [], [], [], []
+    else:
+        semanal, areas, temas, sentimentos = relatorio["semanal"], relatorio["areas"], relatorio["temas"], relatorio["sentimentos"]
+    # Só o nome da área ("Emoções: Gestão, ..." -> "Emoções") para a legenda caber
+    df_semanal = pd.DataFrame(
+        [(pd.Timestamp(semana), area.split(":")[0], media) for semana, area, media, _ in semanal],
+        columns=["Semana", "Área", "Média"]
+    )
+    tabela_areas = [[area.split(":")[0], n, media, _formatar_tendencia(tendencia)] for area, n, media, tendencia in areas]
+    df_temas = pd.DataFrame(temas, columns=["Tema", "Check-ins"])
+    df_sentimentos = pd.DataFrame(sentimentos, columns=["Sentimento", "Check-ins"])
+    return gr.update(value=df_semanal), gr.update(value=tabela_areas), gr.update(value=df_temas), gr.update(value=df_sentimentos)
+
+@medir_handler
+async def fn_load_analytics_psicologa(user_data, paciente_selecionado):
+    if not user_data or user_data.get("role") != "Psicóloga":
+        return None, gr.update(value=None), gr.update(value="Faça login como psicóloga.", visible=True), \
+               gr.update(choices=[]), *_graficos_analise(None, None)
+    pacientes = _pacientes_reais(await storage_service.get_pacientes_da_psicologa(user_data["username"]))
+    if not pacientes:
+        return None, gr.update(value=None), gr.update(value="Nenhum paciente vinculado a você.", visible=True), \
+               gr.update(choices=[]), *_graficos_analise(None, None)
+    relatorios = await storage_service.get_analise_pacientes(pacientes)
+    if not relatorios:
+        return None, gr.update(value=None), gr.update(value="Não foi possível calcular a análise agora.", visible=True), \
+               gr.update(choices=pacientes), *_graficos_analise(None, None)
+    resumo = [
+        [r["paciente"], r["checkins"], r["media"], _formatar_tendencia(r["tendencia"]),
+         f"{r['adesao']:.0%}", r["ultimo"] or "—"]
+        for r in relatorios
+    ]
+    selecionado = paciente_selecionado if paciente_selecionado in pacientes else pacientes[0]
+    return relatorios, gr.update(value=resumo, visible=True), gr.update(visible=False), \
+           gr.update(choices=pacientes, value=selecionado), *_graficos_analise(relatorios, selecionado)
+
+@medir_handler
+def fn_analytics_paciente(relatorios, paciente_selecionado):
+    # Trocar de paciente só redesenha: os relatórios já estão no estado
+    return _graficos_analise(relatorios, paciente_selecionado)
+
+# --- NOVO: Busca nos diários e temas compartilhados por todos os pacientes da psicóloga ---
+@medir_handler
+async def fn_buscar_psicologa(user_data, consulta, inicio=0):
+    if not user_data or user_data.get("role") != "Psicóloga":
+        return gr.update(value=None, visible=False), gr.update(value="Faça login como psicóloga.", visible=True), *_sem_paginacao()
+    consulta = (consulta or "").strip()
+    if not consulta:
+        return gr.update(value=None, visible=False), gr.update(value="Digite o que procurar (ex: insônia).", visible=True), *_sem_paginacao()
+    pacientes = _pacientes_reais(await storage_service.get_pacientes_da_psicologa(user_data["username"]))
+    if not pacientes:
+        return gr.update(value=None, visible=False), gr.update(value="Nenhum paciente vinculado a você.", visible=True), *_sem_paginacao()
+    inicio_busca = time.perf_counter()
+    headers, resultados, total = await storage_service.buscar_checkins(pacientes, consulta, inicio, BUSCA_PAGINA_PSICOLOGA)
+    duracao_ms = (time.perf_counter() - inicio_busca) * 1000
+    if not headers:
+        return gr.update(value=None, visible=False), gr.update(value="Não foi possível buscar agora.", visible=True), *_sem_paginacao()
+    if not resultados:
+        return gr.update(value=None, visible=False), gr.update(value=f"Nenhum registro compartilhado menciona **{consulta}**.", visible=True), *_sem_paginacao()
+    colunas_db = ['timestamp', 'paciente_id', 'area', 'sentimento', 'topicos_selecionados', 'diario_texto', 'temas_gemini', 'resumo_psicologa']
+    col_indices = [headers.index(col) for col in colunas_db]
+    display_data = [[row[i] for i in col_indices] for row in resultados]
+    mensagem = (f"**{total}** registro(s) para **{consulta}**, dos mais relevantes para os menos "
+                f"(mostrando {inicio + 1}–{inicio + len(resultados)}; {duracao_ms:.0f} ms).")
+    # Páginas por deslocamento: o ranking não tem uma ordem estável por data para um cursor
+    proximos = inicio + BUSCA_PAGINA_PSICOLOGA if inicio + len(resultados) < total else None
+    anteriores = max(0, inicio - BUSCA_PAGINA_PSICOLOGA) if inicio > 0 else None
+    return gr.update(value=display_data, visible=True), gr.update(value=mensagem, visible=True), *_controles_paginacao(
+        {"consulta": consulta}, proximos, anteriores
+    )
+
+@medir_handler
+async def fn_busca_psicologa_proximos(user_data, paginacao):
+    paginacao = paginacao or {}
+    return await fn_buscar_psicologa(user_data, paginacao.get("consulta"), paginacao.get("antigos") or 0)
+
+@medir_handler
+async def fn_busca_psicologa_anteriores(user_data, paginacao):
+    paginacao = paginacao or {}
+    return await fn_buscar_psicologa(user_data, paginacao.get("consulta"), paginacao.get("recentes") or 0)
 
 # --- Interface Gráfica (Gradio Blocks) ---
 with gr.Blocks(
@@ -304,6 +540,12 @@ with gr.Blocks(
 ) as app: 
     
     state_user = gr.State(None)
+    state_ultimo_registro = gr.State(None) # <-- NOVO: registro_id do último check-in salvo
+    state_paginacao_paciente = gr.State(None) # <-- NOVO: cursores da página atual do histórico
+    state_paginacao_psicologa = gr.State(None)
+    state_caixa_recados = gr.State(None) # <-- NOVO: recados já mostrados nesta sessão (o último visto fica no armazenamento)
+    state_analise = gr.State(None) # <-- NOVO: relatórios da aba Analytics (um por paciente)
+    state_paginacao_busca = gr.State(None) # <-- NOVO: consulta e deslocamentos da página atual da busca
     gr.Markdown("# 🧠 Painel de Bem-Estar 360°")
     
     with gr.Row(visible=True) as login_view:
@@ -367,10 +609,15 @@ with gr.Blocks(
                         "Psicóloga", "Compartilhado?"
                     ]
                 )
+                # --- NOVO: Navegação por páginas ---
+                with gr.Row():
+                    btn_history_recentes_paciente = gr.Button("◀ Mais recentes", visible=False)
+                    btn_history_antigos_paciente = gr.Button("Mais antigos ▶", visible=False)
 
             with gr.Tab("Recados da Psicóloga", id=2) as recados_tab_paciente:
                 gr.Markdown("Veja os últimos recados enviados pela sua psicóloga.")
                 btn_load_recados_paciente = gr.Button("Verificar novos recados")
+                timer_recados_paciente = gr.Timer(RECADOS_POLL_SECONDS, active=False) # <-- NOVO: aviso de não lidos
                 out_recados_message_paciente = gr.Markdown(visible=False)
                 # --- MUDANÇA: Define os cabeçalhos do DataFrame ---
                 out_recados_df_paciente = gr.DataFrame(
@@ -383,10 +630,29 @@ with gr.Blocks(
     # --- VISÃO DA PSICÓLOGA (Começa Oculta) ---
     with gr.Row(visible=False) as psicologa_view:
         with gr.Tabs() as psicologa_tabs:
-            with gr.Tab("Analytics (Tableau)", id=0) as analytics_tab_psicologa:
-                # (Sem mudanças)
+            with gr.Tab("Analytics", id=0) as analytics_tab_psicologa:
+                # --- ATUALIZADO: números calculados dos check-ins compartilhados, sem BI externo ---
                 gr.Markdown("## Dashboard de Análise de Pacientes")
-                gr.HTML(value=get_tableau_html())
+                gr.Markdown("Calculado só com os check-ins que seus pacientes compartilharam. Tendência: variação da nota média por semana.")
+                btn_load_analytics = gr.Button("Atualizar análise")
+                out_analytics_message = gr.Markdown(visible=False)
+                out_analytics_resumo = gr.DataFrame(
+                    label="Resumo por Paciente",
+                    visible=False,
+                    headers=["Paciente", "Check-ins", "Média (1-5)", "Tendência (/semana)", "Adesão (semanas)", "Último check-in"]
+                )
+                in_paciente_dropdown_analise = gr.Dropdown(label="Detalhar Paciente", choices=[])
+                out_analytics_semanal = gr.LinePlot(
+                    x="Semana", y="Média", color="Área", title="Nota média por semana e área",
+                    y_lim=[1, 5], x_title="Semana", y_title="Nota média"
+                )
+                out_analytics_areas = gr.DataFrame(
+                    label="Por Área",
+                    headers=["Área", "Check-ins", "Média (1-5)", "Tendência (/semana)"]
+                )
+                with gr.Row():
+                    out_analytics_temas = gr.BarPlot(x="Tema", y="Check-ins", title="Temas mais frequentes (IA)", sort="-y")
+                    out_analytics_sentimentos = gr.BarPlot(x="Sentimento", y="Check-ins", title="Sentimentos mais frequentes (IA)", sort="-y")
 
             with gr.Tab("Ver Histórico (Paciente)", id=1) as history_tab_psicologa:
                 gr.Markdown("Selecione um paciente para ver seu histórico de check-ins (apenas registros compartilhados).")
@@ -403,6 +669,10 @@ with gr.Blocks(
                         "Diário do Paciente", "Sentimento (IA)", "Temas (IA)", "Resumo (IA)"
                     ]
                 )
+                # --- NOVO: Navegação por páginas ---
+                with gr.Row():
+                    btn_history_recentes_psicologa = gr.Button("◀ Mais recentes", visible=False)
+                    btn_history_antigos_psicologa = gr.Button("Mais antigos ▶", visible=False)
 
             with gr.Tab("Enviar Recado", id=2) as recado_tab_psicologa:
                 # (Sem mudanças)
@@ -418,6 +688,26 @@ with gr.Blocks(
                     btn_enviar_recado = gr.Button("Enviar Recado", variant="primary")
                 out_feedback_recado_psicologa = gr.Markdown(visible=False)
 
+            with gr.Tab("Buscar nos Diários", id=3) as busca_tab_psicologa:
+                # --- NOVO: busca em todos os registros compartilhados dos seus pacientes ---
+                gr.Markdown("Procure uma palavra ou assunto (ex: *insônia*, *briga no trabalho*) nos diários, tópicos, temas e resumos da IA de todos os seus pacientes (apenas registros compartilhados). Acentos e plurais não importam.")
+                with gr.Row():
+                    in_busca_psicologa = gr.Textbox(label="Buscar", placeholder="ex: insônia", scale=4)
+                    btn_buscar_psicologa = gr.Button("Buscar", variant="primary", scale=1)
+                out_busca_message_psicologa = gr.Markdown(visible=False)
+                out_busca_df_psicologa = gr.DataFrame(
+                    label="Registros encontrados",
+                    visible=False,
+                    wrap=True,
+                    headers=[
+                        "Data", "Paciente", "Área", "Nota (1-5)", "Tópicos",
+                        "Diário do Paciente", "Temas (IA)", "Resumo (IA)"
+                    ]
+                )
+                with gr.Row():
+                    btn_busca_anteriores_psicologa = gr.Button("◀ Anteriores", visible=False)
+                    btn_busca_proximos_psicologa = gr.Button("Próximos ▶", visible=False)
+
     # --- Conexões (Event Listeners) ---
     
     app.load(fn=fn_on_app_load, inputs=None, outputs=[in_signup_psicologa])
@@ -454,23 +744,30 @@ with gr.Blocks(
     )
     
     # --- Conexões do Paciente ---
-    in_sentimento_paciente.release(
+    # --- ATUALIZADO: cada soltura/clique chega ao servidor ("multiple"), que mantém só o último
+    # pedido da sessão vivo (pedidos_sugestoes); sem limite de concorrência no Gradio, senão o
+    # pedido novo esperaria o velho terminar em vez de cancelá-lo (o limite real é o GeminiScheduler) ---
+    ev_sugestoes_slider = in_sentimento_paciente.release(
         fn=fn_get_suggestions_paciente,
         inputs=[in_area_paciente, in_sentimento_paciente], 
         outputs=[
             out_sugestoes_paciente, in_outro_topico_paciente, components_n3_paciente, 
             btn_submit_paciente, out_feedback_paciente
-        ]
+        ],
+        trigger_mode="multiple", concurrency_limit=None
     )
-    btn_reload_paciente.click(
+    ev_sugestoes_botao = btn_reload_paciente.click(
         fn=fn_get_suggestions_paciente,
         inputs=[in_area_paciente, in_sentimento_paciente],
         outputs=[
             out_sugestoes_paciente, in_outro_topico_paciente, components_n3_paciente, 
             btn_submit_paciente, out_feedback_paciente
         ],
-        show_progress="full"
+        show_progress="full",
+        trigger_mode="multiple", concurrency_limit=None,
+        cancels=[ev_sugestoes_slider]
     )
+    in_sentimento_paciente.release(fn=None, cancels=[ev_sugestoes_botao])
     out_sugestoes_paciente.select(
         fn=fn_get_drilldown_paciente,
         inputs=[out_sugestoes_paciente],
@@ -502,34 +799,116 @@ with gr.Blocks(
             out_sugestoes_paciente, in_outro_topico_paciente, in_diario_texto_paciente,
             in_compartilhar_paciente
         ],
-        outputs=[out_feedback_paciente, btn_discard_paciente],
+        outputs=[out_feedback_paciente, btn_discard_paciente, state_ultimo_registro],
         show_progress="full"
     )
     btn_discard_paciente.click(
         fn=fn_delete_last_record_paciente,
-        inputs=[state_user],
-        outputs=[btn_discard_paciente, out_feedback_paciente]
+        inputs=[state_user, state_ultimo_registro],
+        outputs=[btn_discard_paciente, out_feedback_paciente, state_ultimo_registro]
     )
+    saidas_history_paciente = [
+        out_history_df_paciente, out_history_message_paciente, state_paginacao_paciente,
+        btn_history_recentes_paciente, btn_history_antigos_paciente
+    ]
     btn_load_history_paciente.click(
         fn=fn_load_history_paciente,
         inputs=[state_user],
-        outputs=[out_history_df_paciente, out_history_message_paciente],
+        outputs=saidas_history_paciente,
         show_progress="full"
     )
+    btn_history_antigos_paciente.click(
+        fn=fn_history_paciente_antigos,
+        inputs=[state_user, state_paginacao_paciente],
+        outputs=saidas_history_paciente
+    )
+    btn_history_recentes_paciente.click(
+        fn=fn_history_paciente_recentes,
+        inputs=[state_user, state_paginacao_paciente],
+        outputs=saidas_history_paciente
+    )
     btn_load_recados_paciente.click(
         fn=fn_load_recados_paciente,
-        inputs=[state_user],
-        outputs=[out_recados_df_paciente, out_recados_message_paciente],
+        inputs=[state_user, state_caixa_recados],
+        outputs=[out_recados_df_paciente, out_recados_message_paciente, state_caixa_recados, recados_tab_paciente],
         show_progress="full"
     )
+    timer_recados_paciente.tick(
+        fn=fn_poll_recados_paciente,
+        inputs=[state_user, state_caixa_recados],
+        outputs=[recados_tab_paciente],
+        show_progress="hidden"
+    )
+    state_user.change(fn=fn_ativar_poll_recados, inputs=[state_user], outputs=[timer_recados_paciente, state_caixa_recados])
 
     # --- Conexões da Psicóloga ---
+    saidas_graficos_analise = [out_analytics_semanal, out_analytics_areas, out_analytics_temas, out_analytics_sentimentos]
+    btn_load_analytics.click(
+        fn=fn_load_analytics_psicologa,
+        inputs=[state_user, in_paciente_dropdown_analise],
+        outputs=[state_analise, out_analytics_resumo, out_analytics_message, in_paciente_dropdown_analise, *saidas_graficos_analise],
+        show_progress="full"
+    )
+    analytics_tab_psicologa.select(
+        fn=fn_load_analytics_psicologa,
+        inputs=[state_user, in_paciente_dropdown_analise],
+        outputs=[state_analise, out_analytics_resumo, out_analytics_message, in_paciente_dropdown_analise, *saidas_graficos_analise]
+    )
+    # A aba Analytics é a primeira da psicóloga: já abre calculada depois do login
+    state_user.change(
+        fn=fn_load_analytics_psicologa,
+        inputs=[state_user, in_paciente_dropdown_analise],
+        outputs=[state_analise, out_analytics_resumo, out_analytics_message, in_paciente_dropdown_analise, *saidas_graficos_analise]
+    )
+    in_paciente_dropdown_analise.input(
+        fn=fn_analytics_paciente,
+        inputs=[state_analise, in_paciente_dropdown_analise],
+        outputs=saidas_graficos_analise
+    )
+    saidas_history_psicologa = [
+        out_history_df_psicologa, out_history_message_psicologa, state_paginacao_psicologa,
+        btn_history_recentes_psicologa, btn_history_antigos_psicologa
+    ]
     btn_load_history_psicologa.click(
         fn=fn_load_history_psicologa,
         inputs=[in_paciente_dropdown_hist],
-        outputs=[out_history_df_psicologa, out_history_message_psicologa],
+        outputs=saidas_history_psicologa,
         show_progress="full"
     )
+    btn_history_antigos_psicologa.click(
+        fn=fn_history_psicologa_antigos,
+        inputs=[state_paginacao_psicologa],
+        outputs=saidas_history_psicologa
+    )
+    btn_history_recentes_psicologa.click(
+        fn=fn_history_psicologa_recentes,
+        inputs=[state_paginacao_psicologa],
+        outputs=saidas_history_psicologa
+    )
+    saidas_busca_psicologa = [
+        out_busca_df_psicologa, out_busca_message_psicologa, state_paginacao_busca,
+        btn_busca_anteriores_psicologa, btn_busca_proximos_psicologa
+    ]
+    btn_buscar_psicologa.click(
+        fn=fn_buscar_psicologa,
+        inputs=[state_user, in_busca_psicologa],
+        outputs=saidas_busca_psicologa
+    )
+    in_busca_psicologa.submit(
+        fn=fn_buscar_psicologa,
+        inputs=[state_user, in_busca_psicologa],
+        outputs=saidas_busca_psicologa
+    )
+    btn_busca_proximos_psicologa.click(
+        fn=fn_busca_psicologa_proximos,
+        inputs=[state_user, state_paginacao_busca],
+        outputs=saidas_busca_psicologa
+    )
+    btn_busca_anteriores_psicologa.click(
+        fn=fn_busca_psicologa_anteriores,
+        inputs=[state_user, state_paginacao_busca],
+        outputs=saidas_busca_psicologa
+    )
     btn_load_ultimo_diario.click(
         fn=fn_load_ultimo_diario_psicologa,
         inputs=[in_paciente_dropdown_recado],
@@ -552,6 +931,44 @@ with gr.Blocks(
         show_progress="full"
     )
 
+# --- NOVO: Rota de prontidão para operadores ---
+def fn_status():
+    """GET /status: prontidão dos serviços e, com a IA pronta, o disjuntor e o scheduler do Gemini."""
+    servicos = {"storage": storage_service.prontidao(), "ia": ai_service.prontidao()}
+    corpo = {"pronto": storage_service.pronto and ai_service.pronto, "servicos": servicos}
+    if ai_service.pronto:
+        corpo["gemini"] = ai_service.estado()
+    return JSONResponse(corpo, status_code=200 if corpo["pronto"] else 503)
+
+# --- NOVO: Métricas no formato do Prometheus ---
+def _medir_servicos_prontos():
+    return {(nome,): int(servico.pronto) for nome, servico in (("storage", storage_service), ("ia", ai_service))}
+
+def _medir_escritas_pendentes():
+    # Só o backend do Sheets tem fila de escrita
+    fila = getattr(storage_service, "write_queue", None) if storage_service.pronto else None
+    return {(): len(fila.pendentes)} if fila is not None else {}
+
+def _medir_circuito_gemini():
+    if not ai_service.pronto:
+        return {}
+    atual = ai_service.circuito.situacao
+    return {(situacao,): int(situacao == atual) for situacao in (FECHADO, ABERTO, MEIO_ABERTO)}
+
+registro.medidor("painel_servico_pronto", "1 quando o serviço terminou de montar.", ("servico",), funcao=_medir_servicos_prontos)
+registro.medidor("painel_sheets_escritas_pendentes", "Linhas na fila de escrita ainda não gravadas no Sheets.", funcao=_medir_escritas_pendentes)
+registro.medidor("painel_checkins_analises_em_segundo_plano", "Check-ins salvos cuja análise da IA ainda está sendo tentada.",
+                 funcao=lambda: {(): enriquecedor.em_segundo_plano})
+registro.medidor("painel_gemini_circuito", "Situação do disjuntor do Gemini (1 na situação atual).", ("situacao",), funcao=_medir_circuito_gemini)
+
+def fn_metrics():
+    """GET /metrics: contadores e histogramas de handlers, storage, Sheets e Gemini."""
+    return PlainTextResponse(registro.renderizar(), media_type="text/plain; version=0.0.4")
+
 # --- Lançar a Aplicação ---
 if __name__ == "__main__":
-    app.launch(debug=True)
\ No newline at end of file
+    # prevent_thread_lock para registrar as rotas extras antes de travar a thread principal
+    app.launch(prevent_thread_lock=True, show_error=True)
+    app.app.add_api_route("/status", fn_status, methods=["GET"])
+    app.app.add_api_route("/metrics", fn_metrics, methods=["GET"])
+    app.block_thread()
\ No newline at end of file
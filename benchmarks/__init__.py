@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Benchmark offline dos handlers (ver benchmarks/run.py): Sheets e Gemini simulados em benchmarks/fakes.py.
@@ -0,0 +1,295 @@
+# benchmarks/fakes.py
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+import httpx
+from google.api_core import exceptions as google_exceptions
+from services.sheets_async import AsyncSheetsClient
+from services.storage_base import CHECKINS_HEADERS, USUARIOS_HEADERS, RECADOS_HEADERS
+from services.write_queue import como_celula
+
+"""
+Substitutos em processo do Google Sheets (gspread.Worksheet + API v4) e do
+Gemini (genai.GenerativeModel), com latência, erros de cota (429) e volume de
+linhas configuráveis. Cada chamada é contada no `Contador`, para o benchmark
+medir quantas chamadas ao Sheets/Gemini cada handler custa.
+"""
+
+SENHA_PADRAO = "123"
+TEXTOS_DIARIO = [
+    "Hoje foi um dia difícil no trabalho, discuti com meu gestor sobre o prazo.",
+    "Consegui caminhar de manhã e me senti com mais energia o resto do dia.",
+    "Dormi mal de novo, fiquei pensando nas contas do mês.",
+    "Almocei com minha irmã e conversamos como há muito tempo não fazíamos.",
+]
+
+class Contador:
+    """Contagem das chamadas simuladas, por operação (ex: 'sheets.batchGet', 'gemini.stream')."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chamadas = Counter()
+        self.linhas_lidas = 0
+
+    def registrar(self, operacao, linhas=0):
+        with self._lock:
+            self.chamadas[operacao] += 1
+            self.linhas_lidas += linhas
+
+    def total(self, prefixo):
+        with self._lock:
+            return sum(n for op, n in self.chamadas.items() if op.startswith(prefixo))
+
+def _erro_de_cota(url):
+    """O mesmo erro que o httpx levanta num 429 da API do Sheets."""
+    requisicao = httpx.Request("GET", url)
+    return httpx.HTTPStatusError("429 Too Many Requests (simulado)", request=requisicao,
+                                 response=httpx.Response(429, request=requisicao))
+
+# --- Google Sheets ---
+class FakeWorksheet:
+    """O que o app usa de um gspread.Worksheet. Latência e erros valem para cada chamada."""
+    def __init__(self, title, rows, sheet_id, contador, latencia=0.0, taxa_erro_cota=0.0):
+        self.title = title
+        self.id = sheet_id
+        self.rows = rows  # rows[0] é o cabeçalho, como na planilha
+        self.col_count = max(26, len(rows[0]) if rows else 0)
+        self.contador = contador
+        self.latencia = latencia
+        self.taxa_erro_cota = taxa_erro_cota
+        self.lock = threading.Lock()
+
+    def _chamada(self, operacao, linhas=0):
+        self.contador.registrar(f"sheets.{operacao}", linhas)
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.taxa_erro_cota and random.random() < self.taxa_erro_cota:
+            raise _erro_de_cota(f"fake://{self.title}/{operacao}")
+
+    def get_all_values(self):
+        self._chamada("get_all_values", len(self.rows))
+        with self.lock:
+            return list(self.rows)
+
+    def batch_get(self, ranges):
+        with self.lock:
+            respostas = [self.ler_range(r) for r in ranges]
+        self._chamada("batch_get", sum(len(r) for r in respostas))
+        return respostas
+
+    def append_rows(self, values, value_input_option="RAW"):
+        self._chamada("append_rows")
+        with self.lock:
+            self.rows.extend([como_celula(v) for v in row] for row in values)
+
+    def update(self, values, range_name):
+        self._chamada("update")
+        with self.lock:
+            self.escrever_range(range_name, values)
+
+    def add_cols(self, quantidade):
+        self._chamada("add_cols")
+        self.col_count += quantidade
+
+    # --- Ranges A1 (usados também pelo cliente assíncrono) ---
+    def ler_range(self, a1=None):
+        if not a1:
+            return [list(row) for row in self.rows]
+        c1, l1, c2, l2 = _faixa_a1(a1)
+        fim = len(self.rows) if l2 is None else min(l2, len(self.rows))
+        return [row[c1 - 1:c2] for row in self.rows[l1 - 1:fim]]
+
+    def escrever_range(self, a1, values):
+        c1, l1, _, _ = _faixa_a1(a1)
+        for i, valores in enumerate(values):
+            linha = l1 - 1 + i
+            while len(self.rows) <= linha:
+                self.rows.append([])
+            row = self.rows[linha]
+            row += [""] * (c1 - 1 + len(valores) - len(row))
+            row[c1 - 1:c1 - 1 + len(valores)] = [como_celula(v) for v in valores]
+
+    def apagar_linhas(self, inicio_zero, fim_exclusivo):
+        del self.rows[inicio_zero:fim_exclusivo]
+
+def _numero_coluna(letras):
+    numero = 0
+    for letra in letras:
+        numero = numero * 26 + ord(letra) - ord("A") + 1
+    return numero
+
+def _faixa_a1(a1):
+    """'A2:O' -> (col_inicio, linha_inicio, col_fim, linha_fim | None), numeração a partir de 1."""
+    m = re.fullmatch(r"([A-Z]+)(\d+)?(?::([A-Z]+)(\d+)?)?", a1)
+    if not m:
+        raise ValueError(f"Range não suportado pelo fake: {a1}")
+    c1, l1, c2, l2 = m.groups()
+    return _numero_coluna(c1), int(l1 or 1), _numero_coluna(c2 or c1), int(l2) if l2 else (int(l1) if l1 and not c2 else None)
+
+class FakePlanilha:
+    """O que o app usa de um gspread.Spreadsheet."""
+    def __init__(self, abas):
+        self.abas = {aba.title: aba for aba in abas}
+
+    def worksheet(self, titulo):
+        return self.abas[titulo]
+
+class FakeAsyncSheetsClient(AsyncSheetsClient):
+    """
+    AsyncSheetsClient com a camada HTTP trocada: `_requisitar` responde como a API v4,
+    lendo e escrevendo nas FakeWorksheet. O resto do cliente é o código de produção.
+    """
+    def __init__(self, planilha, contador, latencia=0.0, taxa_erro_cota=0.0):
+        super().__init__(creds=None, spreadsheet_id="fake")
+        self.planilha = planilha
+        self.contador = contador
+        self.latencia = latencia
+        self.taxa_erro_cota = taxa_erro_cota
+
+    async def _requisitar(self, metodo, sufixo, **kwargs):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        if self.taxa_erro_cota and random.random() < self.taxa_erro_cota:
+            self.contador.registrar(f"sheets.api{sufixo}")
+            raise _erro_de_cota(f"fake://api{sufixo}")
+        if sufixo == "/values:batchGet":
+            ranges = [valor for chave, valor in kwargs["params"] if chave == "ranges"]
+            value_ranges = [{"values": self._aba(r)[0].ler_range(self._aba(r)[1])} for r in ranges]
+            self.contador.registrar(f"sheets.api{sufixo}", sum(len(v["values"]) for v in value_ranges))
+            return {"valueRanges": value_ranges}
+        self.contador.registrar(f"sheets.api{sufixo}")
+        if sufixo == "/values:batchUpdate":
+            for item in kwargs["json"]["data"]:
+                aba, a1 = self._aba(item["range"])
+                with aba.lock:
+                    aba.escrever_range(a1, item["values"])
+            return {}
+        if sufixo == ":batchUpdate":
+            abas_por_id = {aba.id: aba for aba in self.planilha.abas.values()}
+            for pedido in kwargs["json"]["requests"]:
+                faixa = pedido["deleteDimension"]["range"]
+                aba = abas_por_id[faixa["sheetId"]]
+                with aba.lock:
+                    aba.apagar_linhas(faixa["startIndex"], faixa["endIndex"])
+            return {}
+        raise ValueError(f"Endpoint não suportado pelo fake: {metodo} {sufixo}")
+
+    def _aba(self, range_qualificado):
+        """"'Checkins'!A1:O1" -> (FakeWorksheet, 'A1:O1')."""
+        titulo, _, a1 = range_qualificado.partition("!")
+        return self.planilha.worksheet(titulo.strip("'").replace("''", "'")), a1 or None
+
+# --- Gemini ---
+class _Resposta:
+    def __init__(self, text, tokens_prompt=0, tokens_resposta=0):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=tokens_prompt, candidates_token_count=tokens_resposta)
+
+class _Stream:
+    def __init__(self, texto, pedacos, intervalo, tokens_prompt=0):
+        self.texto = texto
+        self.tokens_prompt = tokens_prompt
+        self.pedacos = max(1, pedacos)
+        self.intervalo = intervalo
+
+    async def __aiter__(self):
+        tamanho = -(-len(self.texto) // self.pedacos)
+        for inicio in range(0, len(self.texto), tamanho):
+            if self.intervalo:
+                await asyncio.sleep(self.intervalo)
+            # Como na API, o uso acumulado vem em cada pedaço
+            fim = inicio + tamanho
+            yield _Resposta(self.texto[inicio:fim], self.tokens_prompt, len(self.texto[:fim]) // 4)
+
+class FakeGenerativeModel:
+    """
+    Responde pelo formato pedido no prompt (sugestões, perguntas, análise, reanálise, recado, sonda)
+    depois de `latencia` segundos; com `taxa_erro_cota`, levanta ResourceExhausted como a API.
+    """
+    def __init__(self, contador, latencia=0.0, taxa_erro_cota=0.0, pedacos=4):
+        self.contador = contador
+        self.latencia = latencia
+        self.taxa_erro_cota = taxa_erro_cota
+        self.pedacos = pedacos
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.contador.registrar("gemini.stream" if stream else "gemini.generate")
+        if self.taxa_erro_cota and random.random() < self.taxa_erro_cota:
+            raise google_exceptions.ResourceExhausted("Quota exceeded (simulado)")
+        texto = json.dumps(self._resposta_para(prompt), ensure_ascii=False)
+        if stream:
+            # O primeiro pedaço chega depois de metade da latência; o resto vem aos poucos
+            await asyncio.sleep(self.latencia / 2)
+            return _Stream(texto, self.pedacos, self.latencia / 2 / self.pedacos, len(prompt) // 4)
+        await asyncio.sleep(self.latencia)
+        return _Resposta(texto, len(prompt) // 4, len(texto) // 4)
+
+    @staticmethod
+    def _resposta_para(prompt):
+        if '"sugestoes"' in prompt:
+            itens = ["Prazo apertado", "Conversa difícil", "Noite mal dormida", "Falta de tempo"]
+            return {"sugestoes": itens, "perguntas": [[f"{item}: aconteceu hoje? (ex: sim, não)"] * 4 for item in itens]}
+        if '"perguntas"' in prompt:
+            return {"perguntas": ["Foi hoje? (ex: sim, não)", "Com quem? (ex: chefe, família)",
+                                  "Como reagiu? (ex: calei, discuti)", "Já aconteceu antes? (ex: sim, não)"]}
+        if '"analises"' in prompt:
+            # Reanálise em lote: uma análise para cada registro "[n]" do prompt
+            analise = FakeGenerativeModel._resposta_para('"insight"')
+            return {"analises": [{"n": int(n), **analise} for n in re.findall(r"^\s*\[(\d+)\]", prompt, re.M)]}
+        if '"recado"' in prompt:
+            return {"recado": "Obrigada por compartilhar. Vamos conversar sobre isso na próxima sessão."}
+        if '"insight"' in prompt:
+            return {"insight": "Faz sentido se sentir assim depois de um dia desses.",
+                    "acao": "Reserve dez minutos hoje para uma caminhada.",
+                    "sentimento_texto": "Cansaço", "temas": ["Trabalho", "Sono"],
+                    "resumo": "Paciente relata sobrecarga. Sono prejudicado."}
+        return {"ok": True}
+
+# --- Dados sintéticos ---
+def nomes_pacientes(pacientes):
+    return [f"paciente{i}" for i in range(pacientes)]
+
+def nomes_psicologas(psicologas):
+    return [f"psicologa{i}" for i in range(psicologas)]
+
+def gerar_planilha(linhas, pacientes, psicologas, recados_por_paciente, contador, latencia=0.0, taxa_erro_cota=0.0, semente=42):
+    """Abas Checkins/Usuarios/Recados com `linhas` check-ins espalhados entre os pacientes, em ordem de data."""
+    aleatorio = random.Random(semente)
+    lista_pacientes = nomes_pacientes(pacientes)
+    lista_psicologas = nomes_psicologas(psicologas)
+    psicologa_de = {p: lista_psicologas[i % psicologas] for i, p in enumerate(lista_pacientes)}
+    inicio = datetime(2020, 1, 1)
+    passo = timedelta(days=5 * 365) / max(1, linhas)
+
+    usuarios = [list(USUARIOS_HEADERS)]
+    usuarios += [[psi, SENHA_PADRAO, "Psicóloga", ""] for psi in lista_psicologas]
+    usuarios += [[p, SENHA_PADRAO, "Paciente", psicologa_de[p]] for p in lista_pacientes]
+
+    checkins = [list(CHECKINS_HEADERS)]
+    for i in range(linhas):
+        paciente = lista_pacientes[aleatorio.randrange(pacientes)]
+        checkins.append([
+            (inicio + passo * i).isoformat(), "Emoções: Gestão, sentimentos, equilíbrio.", str(aleatorio.randint(1, 5)),
+            "Prazo apertado, Conversa difícil", TEXTOS_DIARIO[i % len(TEXTOS_DIARIO)],
+            "Insight", "Ação", "Cansaço", "Trabalho, Sono", "Resumo", paciente, psicologa_de[paciente],
+            "TRUE" if aleatorio.random() < 0.7 else "FALSE", f"{i:032x}", "FALSE",
+        ])
+
+    recados = [list(RECADOS_HEADERS)]
+    total_recados = pacientes * recados_por_paciente
+    passo_recados = timedelta(days=5 * 365) / max(1, total_recados)
+    for i in range(total_recados):
+        paciente = lista_pacientes[i % pacientes]
+        recados.append([(inicio + passo_recados * i).isoformat(), psicologa_de[paciente], paciente, "Como você está?"])
+
+    abas = [
+        FakeWorksheet("Checkins", checkins, 1, contador, latencia, taxa_erro_cota),
+        FakeWorksheet("Usuarios", usuarios, 2, contador, latencia, taxa_erro_cota),
+        FakeWorksheet("Recados", recados, 3, contador, latencia, taxa_erro_cota),
+    ]
+    return FakePlanilha(abas), psicologa_de
@@ -0,0 +1,250 @@
+# benchmarks/run.py
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Benchmark offline dos handlers do app.py, sem tocar no Google.
+Cada tamanho de planilha roda num processo próprio (o pico de RSS é do processo):
+    python -m benchmarks.run                                  # 10k, 100k e 1M check-ins
+    python -m benchmarks.run --linhas 10000 --requisicoes 50  # rodada curta (CI)
+    python -m benchmarks.run --linhas 10000 --json atual.json --comparar base.json
+Para cada handler: latência p50/p95/p99, chamadas ao Sheets e ao Gemini por
+requisição e exceções; por tamanho: tempo de carga e pico de RSS.
+Com --comparar, sai com código 1 se algum p95 piorar mais que --tolerancia.
+"""
+
+LINHAS_PADRAO = [10_000, 100_000, 1_000_000]
+AREA = "Emoções: Gestão, sentimentos, equilíbrio."
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline dos handlers (Sheets e Gemini simulados).")
+    parser.add_argument("--linhas", type=int, nargs="+", default=LINHAS_PADRAO, help="Tamanhos da aba Checkins.")
+    parser.add_argument("--pacientes", type=int, default=None, help="Pacientes (padrão: 1 a cada 1000 check-ins, mínimo 10).")
+    parser.add_argument("--psicologas", type=int, default=5)
+    parser.add_argument("--recados-por-paciente", type=int, default=20)
+    parser.add_argument("--requisicoes", type=int, default=200, help="Requisições por handler.")
+    parser.add_argument("--concorrencia", type=int, default=20, help="Requisições simultâneas.")
+    parser.add_argument("--latencia-sheets", type=float, default=0.05, help="Segundos por chamada ao Sheets.")
+    parser.add_argument("--latencia-gemini", type=float, default=0.3, help="Segundos por chamada ao Gemini.")
+    parser.add_argument("--erro-cota-sheets", type=float, default=0.0, help="Fração de chamadas ao Sheets que recebem 429.")
+    parser.add_argument("--erro-cota-gemini", type=float, default=0.0, help="Fração de chamadas ao Gemini que recebem 429.")
+    parser.add_argument("--handlers", nargs="+", default=None, help="Só estes handlers (padrão: todos).")
+    parser.add_argument("--json", dest="saida_json", default=None, help="Grava os resultados neste arquivo.")
+    parser.add_argument("--comparar", default=None, help="JSON de uma rodada anterior para comparar os p95.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora aceita no p95 (0.2 = 20%%).")
+    parser.add_argument("--saida-filho", default=None, help=argparse.SUPPRESS)  # processo filho: um tamanho só
+    return parser.parse_args(argv)
+
+# --- Métricas ---
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def _pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes no macOS, KB no Linux
+
+async def _medir(nome, chamada, args, contador):
+    """Roda `chamada()` `requisicoes` vezes com `concorrencia` em paralelo."""
+    latencias, erros = [], 0
+    sheets_antes, gemini_antes = contador.total("sheets."), contador.total("gemini.")
+    fila = iter(range(args.requisicoes))
+    async def trabalhador():
+        nonlocal erros
+        for _ in fila:
+            inicio = time.perf_counter()
+            try:
+                await chamada()
+            except Exception as e:
+                erros += 1
+                print(f"[{nome}] {type(e).__name__}: {e}", file=sys.stderr)
+            latencias.append(time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(max(1, args.concorrencia))))
+    duracao = time.perf_counter() - inicio
+    em_ms = lambda s: round(s * 1000, 2) if s is not None else None
+    return {
+        "p50_ms": em_ms(_percentil(latencias, 50)), "p95_ms": em_ms(_percentil(latencias, 95)),
+        "p99_ms": em_ms(_percentil(latencias, 99)), "req_por_s": round(len(latencias) / duracao, 1),
+        "sheets_por_req": round((contador.total("sheets.") - sheets_antes) / len(latencias), 3),
+        "gemini_por_req": round((contador.total("gemini.") - gemini_antes) / len(latencias), 3),
+        "erros": erros,
+    }
+
+async def _esgotar(gerador):
+    """Handlers em streaming: consome até o último yield, como o Gradio faria."""
+    ultimo = None
+    async for ultimo in gerador:
+        pass
+    return ultimo
+
+# --- Um tamanho de planilha (processo filho) ---
+def _preparar_ambiente(diretorio):
+    # Nada de credenciais reais: o benchmark nunca pode falar com o Google
+    for variavel in ("GOOGLE_SHEETS_CREDENTIALS", "GOOGLE_API_KEY"):
+        os.environ.pop(variavel, None)
+    os.environ["STORAGE_BACKEND"] = "sheets"
+    os.environ["SHEETS_JOURNAL_PATH"] = os.path.join(diretorio, "journal.jsonl")
+    os.environ["SHEETS_RECADOS_VISTOS_PATH"] = os.path.join(diretorio, "recados_vistos.json")
+    os.environ.setdefault("SHEETS_COMPACTION_INTERVAL", "0")
+    # O orçamento de cota do Gemini é da conta, não do app: sem ele o benchmark mede só a fila.
+    # Para medir com o scheduler de produção, defina estas variáveis antes de rodar.
+    os.environ.setdefault("GEMINI_QPS", "1000")
+    os.environ.setdefault("GEMINI_BURST", "1000")
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "100")
+
+async def _rodar_tamanho(linhas, args):
+    from benchmarks.fakes import Contador, FakeAsyncSheetsClient, FakeGenerativeModel, gerar_planilha, SENHA_PADRAO
+    import app
+    from services.ai_service import AIService
+    from services.sheets_service import SheetsService
+
+    contador = Contador()
+    pacientes = args.pacientes or max(10, linhas // 1000)
+    planilha, psicologa_de = gerar_planilha(linhas, pacientes, args.psicologas, args.recados_por_paciente,
+                                            contador, args.latencia_sheets, args.erro_cota_sheets)
+    rss_base_mb = _pico_rss_mb()
+    inicio = time.perf_counter()
+    sheets = await asyncio.to_thread(SheetsService, planilha,
+                                     FakeAsyncSheetsClient(planilha, contador, args.latencia_sheets, args.erro_cota_sheets))
+    carga_s = round(time.perf_counter() - inicio, 2)
+    app.storage_service.usar(sheets)
+    app.ai_service.usar(AIService(modelo=FakeGenerativeModel(contador, args.latencia_gemini, args.erro_cota_gemini)))
+
+    aleatorio = random.Random(7)
+    lista_pacientes = list(psicologa_de)
+    usuario = lambda p: {"username": p, "role": "Paciente", "psicologa_associada": psicologa_de[p]}
+    paciente = lambda: aleatorio.choice(lista_pacientes)
+    # Cursores prontos para medir a segunda página sem contar a primeira
+    paginas = {}
+    for p in lista_pacientes[:50]:
+        paginas[p] = (await app.fn_load_history_paciente(usuario(p)))[2]
+
+    async def segunda_pagina():
+        p = aleatorio.choice(list(paginas))
+        await app.fn_history_paciente_antigos(usuario(p), paginas[p])
+
+    envios = itertools.count()
+    async def checkin():
+        # Texto diferente a cada envio: um check-in repetido não passaria pelo Gemini nem pela fila
+        p = paciente()
+        diario = f"Dia pesado no trabalho ({next(envios)})."
+        await _esgotar(app.fn_submit_checkin_paciente(usuario(p), AREA, 2, ["Prazo apertado"], "", diario, True))
+
+    # Monta o índice de busca antes de medir (a primeira busca lê todas as linhas compartilhadas)
+    psicologa = lambda: {"username": psicologa_de[paciente()], "role": "Psicóloga"}
+    await app.fn_buscar_psicologa(psicologa(), "difícil")
+    consultas_busca = ["difícil", "dormir contas", "energia de manhã", "irmã", "prazo no trabalho"]
+
+    async def sugestao_recado():
+        diario, _ = await app.fn_load_ultimo_diario_psicologa(paciente())
+        await _esgotar(app.fn_gerar_sugestao_recado_psicologa(diario.get("value") or "Dia pesado.", ""))
+
+    handlers = {
+        "fn_login": lambda: app.fn_login(paciente(), SENHA_PADRAO),
+        "fn_load_history_paciente": lambda: app.fn_load_history_paciente(usuario(paciente())),
+        "fn_history_paciente_antigos": segunda_pagina,
+        "fn_load_history_psicologa": lambda: app.fn_load_history_psicologa(paciente()),
+        "fn_load_ultimo_diario_psicologa": lambda: app.fn_load_ultimo_diario_psicologa(paciente()),
+        "fn_get_suggestions_paciente": lambda: app.fn_get_suggestions_paciente(AREA, aleatorio.randint(1, 5)),
+        "fn_get_drilldown_paciente": lambda: app.fn_get_drilldown_paciente([aleatorio.choice(["Prazo apertado", "Conversa difícil", "Um tópico novo"])]),
+        "fn_submit_checkin_paciente": checkin,
+        "fn_load_recados_paciente": lambda: app.fn_load_recados_paciente(usuario(paciente()), None),
+        "fn_poll_recados_paciente": lambda: app.fn_poll_recados_paciente(usuario(paciente()), None),
+        "fn_send_recado_psicologa": lambda: (lambda p: app.fn_send_recado_psicologa(
+            {"username": psicologa_de[p], "role": "Psicóloga"}, p, "Como foi a semana?"))(paciente()),
+        "fn_gerar_sugestao_recado_psicologa": sugestao_recado,
+        "fn_buscar_psicologa": lambda: app.fn_buscar_psicologa(psicologa(), aleatorio.choice(consultas_busca)),
+    }
+    resultados = {}
+    for nome, chamada in handlers.items():
+        if args.handlers and nome not in args.handlers:
+            continue
+        resultados[nome] = await _medir(nome, chamada, args, contador)
+        print(f"  {nome}: p95 {resultados[nome]['p95_ms']} ms", file=sys.stderr)
+    return {
+        "linhas": linhas, "pacientes": pacientes, "carga_inicial_s": carga_s,
+        "rss_base_mb": rss_base_mb, "pico_rss_mb": _pico_rss_mb(),
+        "chamadas": dict(contador.chamadas), "handlers": resultados,
+    }
+
+# --- Orquestração (processo pai) ---
+def _rodar_em_processo(linhas, args):
+    """Um processo por tamanho: o pico de RSS não mistura os tamanhos."""
+    with tempfile.TemporaryDirectory() as diretorio:
+        saida = os.path.join(diretorio, "resultado.json")
+        comando = [
+            sys.executable, "-m", "benchmarks.run", "--linhas", str(linhas), "--saida-filho", saida,
+            "--psicologas", str(args.psicologas), "--recados-por-paciente", str(args.recados_por_paciente),
+            "--requisicoes", str(args.requisicoes), "--concorrencia", str(args.concorrencia),
+            "--latencia-sheets", str(args.latencia_sheets), "--latencia-gemini", str(args.latencia_gemini),
+            "--erro-cota-sheets", str(args.erro_cota_sheets), "--erro-cota-gemini", str(args.erro_cota_gemini),
+        ]
+        if args.pacientes:
+            comando += ["--pacientes", str(args.pacientes)]
+        if args.handlers:
+            comando += ["--handlers", *args.handlers]
+        print(f"Rodando {linhas:,} check-ins...", file=sys.stderr)
+        # Os prints do app vão para o stdout do filho; o progresso vem pelo stderr
+        subprocess.run(comando, stdout=subprocess.DEVNULL, check=True)
+        with open(saida, encoding="utf-8") as f:
+            return json.load(f)
+
+def _imprimir(resultados):
+    for tamanho in resultados:
+        print(f"\n## {tamanho['linhas']:,} check-ins ({tamanho['pacientes']} pacientes) | carga {tamanho['carga_inicial_s']}s"
+              f" | RSS base {tamanho['rss_base_mb']} MB, pico {tamanho['pico_rss_mb']} MB")
+        print(f"{'handler':38} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'sheets/req':>11} {'gemini/req':>11} {'erros':>6}")
+        for nome, m in tamanho["handlers"].items():
+            print(f"{nome:38} {m['p50_ms']:>9} {m['p95_ms']:>9} {m['p99_ms']:>9} {m['req_por_s']:>8}"
+                  f" {m['sheets_por_req']:>11} {m['gemini_por_req']:>11} {m['erros']:>6}")
+
+def _comparar(resultados, caminho_base, tolerancia):
+    """Lista as regressões de p95 em relação a uma rodada anterior."""
+    with open(caminho_base, encoding="utf-8") as f:
+        base = {t["linhas"]: t for t in json.load(f)}
+    regressoes = []
+    for tamanho in resultados:
+        anterior = base.get(tamanho["linhas"])
+        if not anterior:
+            continue
+        for nome, m in tamanho["handlers"].items():
+            p95_antes = anterior["handlers"].get(nome, {}).get("p95_ms")
+            if p95_antes and m["p95_ms"] > p95_antes * (1 + tolerancia):
+                regressoes.append(f"{tamanho['linhas']} linhas, {nome}: p95 {p95_antes} -> {m['p95_ms']} ms")
+    return regressoes
+
+def main(argv=None):
+    args = _argumentos(argv)
+    if args.saida_filho:
+        with tempfile.TemporaryDirectory() as diretorio:
+            _preparar_ambiente(diretorio)
+            resultado = asyncio.run(_rodar_tamanho(args.linhas[0], args))
+        with open(args.saida_filho, "w", encoding="utf-8") as f:
+            json.dump(resultado, f)
+        return 0
+    resultados = [_rodar_em_processo(linhas, args) for linhas in args.linhas]
+    _imprimir(resultados)
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        regressoes = _comparar(resultados, args.comparar, args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO: {regressao}")
+        return 1 if regressoes else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,106 @@
 # services/ai_service.py (Versão Leve)
 import os
 import json
+import asyncio
+import time
+from contextlib import contextmanager
 # from transformers import pipeline # <-- REMOVIDO
-import google.generativeai as genai
 from models.schemas import CheckinContext, DrilldownRequest, CheckinFinal, GeminiResponse
+from services.suggestion_cache import SuggestionCache, DrilldownCache, normalizar_topico
+from services.json_stream import parse_json_parcial
+from services.gemini_scheduler import GeminiScheduler, estimar_tokens, ERROS_DE_COTA, PRIORIDADE_INTERATIVA, PRIORIDADE_NORMAL, PRIORIDADE_BACKGROUND
+from services.circuit_breaker import CircuitBreaker, CircuitoAberto
+from services.shared_cache import cache_compartilhado
+from services.lazy_service import ServicoPreguicoso
+from services.metrics import GEMINI_CHAMADAS, GEMINI_LATENCIA, GEMINI_TOKENS
 from fastapi import UploadFile
 
 """
 (Atualizado) 
 1. REMOVIDO o Whisper (transformers) para deixar o app mais leve.
+2. Sugestões de Nível 1 servidas de um cache por (area, sentimento), aquecido em segundo plano.
+3. Perguntas de Nível 2 geradas junto com as sugestões (ou buscadas em paralelo) e guardadas por tópico.
+4. Análise final e sugestão de recado em streaming, para a UI mostrar o texto enquanto chega.
+5. Toda chamada ao Gemini passa pelo GeminiScheduler (concorrência, cota, prioridade, 429).
+6. Cada método tem um prazo; um disjuntor compartilhado serve os fallbacks na hora quando o Gemini cai.
+7. O serviço é montado em segundo plano; o google.generativeai (import lento) só é importado nessa hora.
 """
 
+# Quantas chamadas simultâneas ao Gemini o aquecimento do cache pode fazer
+SUGGESTIONS_WARM_CONCURRENCY = int(os.getenv("SUGGESTIONS_WARM_CONCURRENCY", "4"))
+
+# Prazos (em segundos) de cada tipo de chamada, contando a espera na fila do scheduler
+GEMINI_DEADLINE_SUGESTOES = float(os.getenv("GEMINI_DEADLINE_SUGESTOES", "8"))
+GEMINI_DEADLINE_PERGUNTAS = float(os.getenv("GEMINI_DEADLINE_PERGUNTAS", "8"))
+GEMINI_DEADLINE_ANALISE = float(os.getenv("GEMINI_DEADLINE_ANALISE", "30"))
+GEMINI_DEADLINE_RECADO = float(os.getenv("GEMINI_DEADLINE_RECADO", "30"))
+GEMINI_DEADLINE_SONDA = float(os.getenv("GEMINI_DEADLINE_SONDA", "10"))
+GEMINI_DEADLINE_REANALISE = float(os.getenv("GEMINI_DEADLINE_REANALISE", "120"))
+
+# Insight salvo quando a análise falha; a reanálise em lote procura por ele
+INSIGHT_DE_ERRO = "Houve um erro ao analisar seu diário."
+# Insight do check-in salvo antes da análise (services/enriquecimento.py preenche a linha depois)
+INSIGHT_PENDENTE = "Análise do diário em andamento."
+
+# Chaves da análise do diário, compartilhadas pela análise final e pela reanálise em lote
+INSTRUCOES_ANALISE = """
+        1. "insight": (String) 1 frase empática que valide o sentimento. Não dê conselhos.
+        2. "acao": (String) 1 ação concreta e imediata (máx 2 frases) baseada no diário.
+        3. "sentimento_texto": (String) Uma única palavra que descreva a emoção principal (ex: "Frustração").
+        4. "temas": (Lista de Strings) Uma lista com 2 ou 3 temas principais (ex: ["Conflito", "Prazo"]).
+        5. "resumo": (String) Um resumo de 2 frases para uma psicóloga.
+"""
+
+@contextmanager
+def _medir_gemini(operacao):
+    """Conta a chamada (ok, cota ou erro) e a latência, já dentro da vaga do scheduler."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except ERROS_DE_COTA:
+        GEMINI_CHAMADAS.inc(operacao=operacao, resultado="cota")
+        raise
+    except Exception:
+        GEMINI_CHAMADAS.inc(operacao=operacao, resultado="erro")
+        raise
+    else:
+        GEMINI_CHAMADAS.inc(operacao=operacao, resultado="ok")
+    finally:
+        GEMINI_LATENCIA.observar(time.perf_counter() - inicio, operacao=operacao)
+
+def _contar_tokens(operacao, resposta):
+    uso = getattr(resposta, "usage_metadata", None)
+    if uso is None:
+        return
+    GEMINI_TOKENS.inc(getattr(uso, "prompt_token_count", 0) or 0, operacao=operacao, tipo="prompt")
+    GEMINI_TOKENS.inc(getattr(uso, "candidates_token_count", 0) or 0, operacao=operacao, tipo="resposta")
+
 class AIService:
-    def __init__(self):
+    def __init__(self, modelo=None, scheduler=None):
+        """
+        `modelo` substitui o GenerativeModel do Gemini (ex: benchmarks/fakes.py);
+        `scheduler`, o GeminiScheduler padrão (ex: a reanálise em lote, com orçamento próprio).
+        """
         print("Carregando serviços de IA...")
         # self.transcriber = self._load_whisper() # <-- REMOVIDO
         self.transcriber = None # Apenas para garantir que não quebre
-        self.gemini_model = self._load_gemini()
+        self.gemini_model = modelo or self._load_gemini()
+        self.scheduler = scheduler or GeminiScheduler()
+        self.circuito = CircuitBreaker("gemini", sonda=self._sondar_gemini)
+        # Com SHARED_CACHE_PATH, o que um worker gerou serve aos outros
+        self.sugestoes_cache = SuggestionCache(compartilhado=cache_compartilhado())
+        self._reposicoes = {}  # chave -> Task que está gerando mais um conjunto
+        self.perguntas_cache = DrilldownCache(compartilhado=cache_compartilhado())
+        self._perguntas_em_voo = {}  # tópico normalizado -> Task que está gerando as perguntas
 
     def _load_whisper(self):
         # --- FUNÇÃO REMOVIDA ---
         pass
 
     def _load_gemini(self):
-        # (Sem mudanças)
+        # (Só o import do genai mudou para cá)
         try:
+            import google.generativeai as genai  # import lento; fica fora do import do módulo
             GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
             if not GOOGLE_API_KEY:
                 raise ValueError("Variável de ambiente GOOGLE_API_KEY não definida.")
@@ -40,92 +116,240 @@ class AIService:
             print(f"Erro ao configurar o Gemini: {e}")
             return None
 
+    # --- FUNÇÃO ATUALIZADA (Cache) ---
     async def get_suggestions(self, contexto: CheckinContext):
-        # (Sem mudanças)
         if not self.gemini_model: raise Exception("Modelo Gemini não carregado.")
+        chave = SuggestionCache.chave(contexto.area, contexto.sentimento)
+        await self.sugestoes_cache.trazer_compartilhado(chave)
+        sugestoes = self.sugestoes_cache.obter(chave)
+        if sugestoes is not None:
+            # Completa o rodízio da chave em segundo plano, sem segurar o clique
+            self._agendar_reposicao(chave)
+            self._prefetch_perguntas(sugestoes)
+            return {"sugestoes": sugestoes}
+        try:
+            sugestoes = await self._gerar_sugestoes(*chave, prioridade=PRIORIDADE_INTERATIVA)
+            await self.sugestoes_cache.guardar(chave, sugestoes)
+            self._agendar_reposicao(chave)
+            self._prefetch_perguntas(sugestoes)
+            return {"sugestoes": sugestoes}
+        except Exception as e:
+            print(f"Erro ao chamar Gemini (Nível 1): {e}")
+            return {"sugestoes": ["Fale sobre seu dia", "O que mais te marcou hoje?"]}
+
+    async def _gerar_sugestoes(self, area, sentimento, prioridade=PRIORIDADE_NORMAL):
+        """Uma chamada ao Gemini. Levanta exceção se a resposta não servir (nada de fallback no cache)."""
         sentimento_desc = "muito positivo"
-        if contexto.sentimento <= 2: sentimento_desc = "extremamente negativo"
-        elif contexto.sentimento <= 3: sentimento_desc = "negativo"
+        if sentimento <= 2: sentimento_desc = "extremamente negativo"
+        elif sentimento <= 3: sentimento_desc = "negativo"
         prompt = f"""
         Contexto: O usuário está fazendo um check-in de bem-estar.
-        - Área da Vida: {contexto.area}
-        - Sentimento (1-5): {contexto.sentimento} (indica sentimento {sentimento_desc}).
+        - Área da Vida: {area}
+        - Sentimento (1-5): {sentimento} (indica sentimento {sentimento_desc}).
         Gere 4 "gatilhos prováveis" que podem ter causado esse sentimento.
         Seja muito breve e direto (máximo 10 palavras por item, idealmente 5-7).
+        Para cada item, gere também 4 perguntas-chave curtas para investigar o tópico,
+        cada uma com 2-3 exemplos de respostas curtas entre parênteses.
         Retorne APENAS um objeto JSON válido no formato:
-        {{"sugestoes": ["item curto 1", "item curto 2", "item curto 3", "item curto 4"]}}
+        {{"sugestoes": ["item curto 1", "item curto 2", "item curto 3", "item curto 4"],
+          "perguntas": [["Pergunta 1 do item 1? (ex: sim, não)", "..."], ["Pergunta 1 do item 2? (ex: hoje, ontem)", "..."], ["..."], ["..."]]}}
         """
+        response = await self._gerar(prompt, prioridade, GEMINI_DEADLINE_SUGESTOES, "sugestoes")
+        json_data = json.loads(response.text)
+        sugestoes = json_data.get("sugestoes", [])
+        if not isinstance(sugestoes, list) or not sugestoes:
+            raise ValueError(f"Resposta sem sugestões: {response.text}")
+        sugestoes = [str(s) for s in sugestoes]
+        # As perguntas vêm na mesma ordem das sugestões; o que faltar é buscado depois
+        perguntas = json_data.get("perguntas", [])
+        if isinstance(perguntas, list):
+            for topico, perguntas_do_topico in zip(sugestoes, perguntas):
+                if isinstance(perguntas_do_topico, list) and perguntas_do_topico:
+                    await self.perguntas_cache.guardar(topico, [str(p) for p in perguntas_do_topico])
+        print(f"Sugestões do Gemini: {sugestoes}")
+        return sugestoes
+
+    def _agendar_reposicao(self, chave):
+        if self.sugestoes_cache.faltam(chave) <= 0 or chave in self._reposicoes:
+            return
+        tarefa = asyncio.create_task(self._repor(chave))
+        self._reposicoes[chave] = tarefa
+        tarefa.add_done_callback(lambda _: self._reposicoes.pop(chave, None))
+
+    async def _repor(self, chave):
         try:
-            response = await self.gemini_model.generate_content_async(prompt)
-            json_data = json.loads(response.text)
-            print(f"Sugestões do Gemini: {json_data.get('sugestoes', [])}")
-            return json_data
+            await self.sugestoes_cache.guardar(chave, await self._gerar_sugestoes(*chave, prioridade=PRIORIDADE_BACKGROUND))
         except Exception as e:
-            print(f"Erro ao chamar Gemini (Nível 1): {e}")
-            return {"sugestoes": ["Fale sobre seu dia", "O que mais te marcou hoje?"]}
+            print(f"Erro ao repor sugestões em cache para {chave}: {e}")
+
+    async def aquecer_sugestoes(self, areas, sentimentos=range(1, 6)):
+        """Preenche um conjunto por (area, sentimento), para o primeiro clique não esperar o Gemini."""
+        if not self.gemini_model:
+            return
+        limite = asyncio.Semaphore(SUGGESTIONS_WARM_CONCURRENCY)
+        async def aquecer(chave):
+            async with limite:
+                await self.sugestoes_cache.trazer_compartilhado(chave)
+                if self.sugestoes_cache.faltam(chave) < self.sugestoes_cache.sets_por_chave:
+                    return  # já tem algo (ex: um paciente chegou antes)
+                await self._repor(chave)
+        inicio = asyncio.get_running_loop().time()
+        await asyncio.gather(*(aquecer(SuggestionCache.chave(a, s)) for a in areas for s in sentimentos))
+        duracao = asyncio.get_running_loop().time() - inicio
+        print(f"Cache de sugestões aquecido: {len(self.sugestoes_cache)} conjuntos em {duracao:.1f}s.")
 
+    # --- FUNÇÃO ATUALIZADA (Cache + Prefetch) ---
     async def get_drilldown_questions(self, request: DrilldownRequest):
-        # (Sem mudanças)
         if not self.gemini_model: raise Exception("Modelo Gemini não carregado.")
+        topico = request.topico_selecionado
+        try:
+            await self.perguntas_cache.trazer_compartilhado(topico)
+            perguntas = self.perguntas_cache.obter(topico)
+            if perguntas is None:
+                # Se o prefetch deste tópico ainda está em voo, o scheduler junta as duas
+                # chamadas numa só (e passa o prefetch para a frente da fila)
+                perguntas = await self._gerar_perguntas(topico, PRIORIDADE_INTERATIVA)
+            return {"perguntas": perguntas}
+        except Exception as e:
+            print(f"Erro ao chamar Gemini (Nível 2): {e}")
+            return {"perguntas": ["Pode detalhar mais?", "Como você se sentiu?"]}
+
+    async def _gerar_perguntas(self, topico, prioridade=PRIORIDADE_NORMAL):
         prompt = f"""
-        Contexto: O usuário selecionou o tópico: "{request.topico_selecionado}"
+        Contexto: O usuário selecionou o tópico: "{topico}"
         Gere 4 perguntas-chave curtas para investigar este tópico.
         Para cada pergunta, inclua 2-3 exemplos de respostas curtas entre parênteses.
         Retorne APENAS um objeto JSON válido no formato:
         {{"perguntas": ["Pergunta 1? (ex: sim, não)", "Pergunta 2? (ex: hoje, ontem)", "Pergunta 3? (ex: raiva, tristeza)", "Pergunta 4? (ex: sim, um pouco, não)"]}}
         """
-        try:
-            response = await self.gemini_model.generate_content_async(prompt)
-            json_data = json.loads(response.text)
-            print(f"Perguntas-Chave do Gemini: {json_data.get('perguntas', [])}")
-            return json_data
-        except Exception as e:
-            print(f"Erro ao chamar Gemini (Nível 2): {e}")
-            return {"perguntas": ["Pode detalhar mais?", "Como você se sentiu?"]}
+        response = await self._gerar(prompt, prioridade, GEMINI_DEADLINE_PERGUNTAS, "perguntas", chave=("perguntas", normalizar_topico(topico)))
+        perguntas = json.loads(response.text).get("perguntas", [])
+        if not isinstance(perguntas, list) or not perguntas:
+            raise ValueError(f"Resposta sem perguntas: {response.text}")
+        perguntas = [str(p) for p in perguntas]
+        await self.perguntas_cache.guardar(topico, perguntas)
+        print(f"Perguntas-Chave do Gemini: {perguntas}")
+        return perguntas
+
+    def _prefetch_perguntas(self, topicos):
+        """Busca em paralelo as perguntas dos tópicos que ainda não estão no cache."""
+        for topico in topicos:
+            chave = normalizar_topico(topico)
+            if topico in self.perguntas_cache or chave in self._perguntas_em_voo:
+                continue
+            tarefa = asyncio.create_task(self._prefetch(topico))
+            self._perguntas_em_voo[chave] = tarefa
+            tarefa.add_done_callback(lambda t, chave=chave: self._fim_prefetch(chave, t))
+
+    async def _prefetch(self, topico):
+        # Outro worker pode já ter gerado as perguntas deste tópico
+        if not await self.perguntas_cache.trazer_compartilhado(topico):
+            await self._gerar_perguntas(topico)
+
+    def _fim_prefetch(self, chave, tarefa):
+        self._perguntas_em_voo.pop(chave, None)
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            print(f"Erro no prefetch de perguntas para '{chave}': {tarefa.exception()}")
 
     async def transcribe_audio(self, file: UploadFile):
         # --- FUNÇÃO ATUALIZADA (Placeholder) ---
         print("A função de transcrição de áudio foi desativada.")
         return {"transcricao": "[Áudio desativado]"}
 
+    # --- FUNÇÃO ATUALIZADA (Streaming) ---
     async def process_final_checkin(self, checkin_data: CheckinFinal, diario_para_analise: str) -> GeminiResponse:
-        # (Sem mudanças)
+        """Versão sem streaming: consome o stream e devolve só a análise final."""
+        async for _, final in self.stream_final_checkin(checkin_data, diario_para_analise):
+            if final is not None:
+                return final
+
+    async def stream_final_checkin(self, checkin_data: CheckinFinal, diario_para_analise: str):
+        """
+        Gera (parcial, final): `parcial` é o dict com o que o Gemini já escreveu
+        (ex: o começo do insight); `final` só vem preenchido no último item,
+        com o GeminiResponse validado que deve ser salvo.
+        """
         if not self.gemini_model: raise Exception("Modelo Gemini não carregado.")
         if not diario_para_analise: 
-            return GeminiResponse(
+            yield {}, GeminiResponse(
                 insight="Seu check-in de sentimento foi salvo.",
                 acao="Na próxima vez, tente escrever um diário para receber mais insights."
             )
+            return
         prompt_final = f"""
         Contexto Psicológico:
         Um usuário registrou um diário sobre a área "{checkin_data.area}" com nota {checkin_data.sentimento}/5.
         Diário: "{diario_para_analise}" 
-        Analise o diário e retorne APENAS um objeto JSON válido com 5 chaves:
-        1. "insight": (String) 1 frase empática que valide o sentimento. Não dê conselhos.
-        2. "acao": (String) 1 ação concreta e imediata (máx 2 frases) baseada no diário.
-        3. "sentimento_texto": (String) Uma única palavra que descreva a emoção principal (ex: "Frustração").
-        4. "temas": (Lista de Strings) Uma lista com 2 ou 3 temas principais (ex: ["Conflito", "Prazo"]).
-        5. "resumo": (String) Um resumo de 2 frases para uma psicóloga.
+        Analise o diário e retorne APENAS um objeto JSON válido com 5 chaves, nesta ordem:
+        {INSTRUCOES_ANALISE}
         """
+        parcial = {}
         try:
-            response = await self.gemini_model.generate_content_async(prompt_final)
-            json_data = json.loads(response.text)
-            gemini_response = GeminiResponse(**json_data)
-            print(f"Análise Final do Gemini: {gemini_response.model_dump_json(indent=2)}")
-            return gemini_response
+            async for parcial, completo in self._stream_json(prompt_final, GEMINI_DEADLINE_ANALISE, "analise"):
+                if completo:
+                    gemini_response = GeminiResponse(**parcial)
+                    print(f"Análise Final do Gemini: {gemini_response.model_dump_json(indent=2)}")
+                    yield parcial, gemini_response
+                    return
+                yield parcial, None
         except Exception as e:
             print(f"Erro ao gerar análise final do Gemini: {e}")
-            return GeminiResponse(
-                insight="Houve um erro ao analisar seu diário.",
-                acao="Tente novamente mais tarde."
-            )
+        yield parcial, GeminiResponse(
+            insight=INSIGHT_DE_ERRO,
+            acao="Tente novamente mais tarde."
+        )
+
+    # --- NOVO: Reanálise em lote ---
+    async def analisar_em_lote(self, itens):
+        """
+        Analisa vários diários num único pedido ao Gemini, em segundo plano.
+        `itens`: [(chave, area, sentimento, diario)]. Retorna {chave: GeminiResponse} só com
+        as análises válidas; as que faltarem na resposta ficam para a próxima rodada.
+        """
+        if not self.gemini_model: raise Exception("Modelo Gemini não carregado.")
+        # Números curtos no prompt em vez das chaves (menos tokens, e o modelo não os corrompe)
+        diarios = "\n".join(
+            f'[{n}] Área "{area}", nota {sentimento}/5. Diário: "{diario}"'
+            for n, (_, area, sentimento, diario) in enumerate(itens, 1)
+        )
+        prompt = f"""
+        Contexto Psicológico:
+        Cada registro abaixo é o diário de um usuário sobre uma área da vida, com a nota que ele deu (1-5).
+        {diarios}
+        Analise CADA diário separadamente e retorne APENAS um objeto JSON válido no formato
+        {{"analises": [{{"n": 1, ...}}, {{"n": 2, ...}}]}}, com um objeto por registro contendo
+        "n" (o número do registro) e estas 5 chaves, nesta ordem:
+        {INSTRUCOES_ANALISE}
+        """
+        response = await self._gerar(prompt, PRIORIDADE_BACKGROUND, GEMINI_DEADLINE_REANALISE, "reanalise",
+                                     chave=("reanalise", tuple(chave for chave, *_ in itens)))
+        analises = json.loads(response.text).get("analises", [])
+        if not isinstance(analises, list):
+            raise ValueError(f"Resposta sem análises: {response.text[:200]}")
+        resultado = {}
+        for analise in analises:
+            try:
+                n = int(analise.pop("n"))
+                if 1 <= n <= len(itens):
+                    resultado[itens[n - 1][0]] = GeminiResponse(**analise)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                print(f"Análise em lote ignorada ({e}): {str(analise)[:200]}")
+        return resultado
 
     async def get_sugestao_recado_psicologa(self, ultimo_diario_paciente: str, rascunho_psicologa: str):
-        # (Sem mudanças)
+        """Versão sem streaming: devolve {"recado": texto_final}."""
+        recado = ""
+        async for recado in self.stream_sugestao_recado(ultimo_diario_paciente, rascunho_psicologa):
+            pass
+        return {"recado": recado}
+
+    async def stream_sugestao_recado(self, ultimo_diario_paciente: str, rascunho_psicologa: str):
+        """Gera o texto do recado sugerido à medida que chega; o último item é o texto final."""
         if not self.gemini_model:
             raise Exception("Modelo Gemini não carregado.")
         if not ultimo_diario_paciente:
-            return {"recado": "O paciente não deixou um diário para este registro."}
+            yield "O paciente não deixou um diário para este registro."
+            return
         prompt = f"""
         Contexto: Você é uma psicóloga (TCC). Um paciente enviou o seguinte registro de diário:
         ---
@@ -144,13 +368,118 @@ class AIService:
         {{"recado": "Sua mensagem sugerida (ou completada) aqui."}}
         """
         try:
-            response = await self.gemini_model.generate_content_async(prompt)
-            json_data = json.loads(response.text)
-            print(f"Sugestão de Recado: {json_data.get('recado', 'N/A')}")
-            return json_data
+            async for json_data, completo in self._stream_json(prompt, GEMINI_DEADLINE_RECADO, "recado"):
+                recado = json_data.get("recado", "") if isinstance(json_data, dict) else ""
+                if completo:
+                    print(f"Sugestão de Recado: {recado or 'N/A'}")
+                    yield recado or "Não foi possível gerar sugestão."
+                elif recado:
+                    yield recado
+        except CircuitoAberto as e:
+            print(f"Sugestão de recado não gerada: {e}")
+            yield "A IA está indisponível no momento. Tente novamente em instantes."
         except Exception as e:
             print(f"Erro ao gerar sugestão de recado: {e}")
-            return {"recado": f"Erro ao gerar sugestão: {e}"}
+            yield f"Erro ao gerar sugestão: {e}"
+
+    async def _stream_json(self, prompt, prazo, operacao, prioridade=PRIORIDADE_INTERATIVA):
+        """
+        Chama o Gemini com stream=True e gera (objeto, completo) a cada pedaço:
+        o JSON parcial enquanto chega e, no fim, o JSON inteiro validado com json.loads.
+        O stream inteiro tem que terminar dentro de `prazo`.
+        """
+        self.circuito.verificar()
+        loop = asyncio.get_running_loop()
+        fim = loop.time() + prazo
+        async def abrir():
+            return self._pedacos_medidos(prompt, operacao)
+        pedacos = self.scheduler.stream(
+            abrir, prioridade=prioridade, tokens=estimar_tokens(prompt)
+        )
+        texto = ""
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(pedacos.__anext__(), max(0.0, fim - loop.time()))
+                except StopAsyncIteration:
+                    break
+                texto += chunk.text
+                parcial = parse_json_parcial(texto)
+                if isinstance(parcial, dict):
+                    yield parcial, False
+        except ERROS_DE_COTA:
+            raise  # cota esgotada não é sinal de serviço fora do ar
+        except Exception as e:
+            self.circuito.falha(e)
+            raise
+        finally:
+            await pedacos.aclose()
+        self.circuito.sucesso()
+        yield json.loads(texto), True
+
+    async def _pedacos_medidos(self, prompt, operacao):
+        """O stream do Gemini com métricas; os tokens vêm no último pedaço."""
+        ultimo = None
+        with _medir_gemini(operacao):
+            async for chunk in await self.gemini_model.generate_content_async(prompt, stream=True):
+                ultimo = chunk
+                yield chunk
+        _contar_tokens(operacao, ultimo)
+
+    async def _chamar_gemini(self, prompt, prazo, operacao):
+        with _medir_gemini(operacao):
+            response = await asyncio.wait_for(self.gemini_model.generate_content_async(prompt), prazo)
+        _contar_tokens(operacao, response)
+        return response
+
+    async def _gerar(self, prompt, prioridade, prazo, operacao, chave=None):
+        """
+        Chamada sem streaming, pelo scheduler. Chamadas em voo com a mesma chave (padrão: o prompt) viram uma só.
+        O prazo vale para a chamada ao Gemini; quem é interativo também não espera a fila além dele.
+        """
+        self.circuito.verificar()
+        chamou, contou = False, False
+        async def chamada():
+            nonlocal chamou, contou
+            chamou = True
+            try:
+                response = await self._chamar_gemini(prompt, prazo, operacao)
+            except ERROS_DE_COTA:
+                raise  # o scheduler repete; cota esgotada não abre o disjuntor
+            except Exception as e:
+                if not contou:
+                    contou = True
+                    self.circuito.falha(e)
+                raise
+            self.circuito.sucesso()
+            return response
+        execucao = self.scheduler.executar(
+            chamada, prioridade=prioridade, chave=chave or prompt, tokens=estimar_tokens(prompt)
+        )
+        if prioridade == PRIORIDADE_INTERATIVA:
+            try:
+                return await asyncio.wait_for(execucao, prazo)
+            except asyncio.TimeoutError as e:
+                # Com o mesmo prazo, este wait_for vence o do _chamar_gemini: a chamada travada é
+                # cancelada (CancelledError) sem passar pelo except dela. Conta aqui, se ela chegou
+                # a ir ao Gemini (tempo esperando na fila não é falha do Gemini).
+                if chamou and not contou:
+                    contou = True
+                    self.circuito.falha(e)
+                raise
+        return await execucao
+
+    async def _sondar_gemini(self):
+        """Sonda do disjuntor: a menor chamada possível, em segundo plano."""
+        prompt = 'Retorne APENAS o JSON {"ok": true}'
+        await self.scheduler.executar(
+            lambda: self._chamar_gemini(prompt, GEMINI_DEADLINE_SONDA, "sonda"),
+            prioridade=PRIORIDADE_BACKGROUND, tokens=estimar_tokens(prompt, saida=10)
+        )
+
+    def estado(self):
+        """Situação do disjuntor e do scheduler, para operadores."""
+        return {"circuito": self.circuito.estado(), "scheduler": self.scheduler.estado()}
 
-# Cria uma instância única
-ai_service = AIService()
\ No newline at end of file
+# Cria uma instância única (montada em segundo plano; ver iniciar_em_segundo_plano)
+ai_service = ServicoPreguicoso("IA", AIService, AIService)
\ No newline at end of file
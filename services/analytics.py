@@ -0,0 +1,317 @@
+# services/analytics.py
+from datetime import date, datetime, timedelta
+import numpy as np
+
+"""
+Motor de análise dos check-ins compartilhados, para a aba Analytics da psicóloga.
+Guarda só o que as contas usam (paciente, área, dia, nota, temas e sentimento da IA)
+em arrays NumPy que crescem a cada check-in, em vez de recalcular a planilha
+inteira. Por paciente: média e tendência da nota por área e semana, frequência
+dos temas e sentimentos apontados pela IA e adesão (semanas com check-in).
+O relatório de cada paciente fica guardado até chegar (ou sair) um check-in dele.
+"""
+
+_EPOCA = date(1970, 1, 1)
+_MICROS_POR_DIA = 86_400_000_000
+TOP_FREQUENCIAS = 10
+SEM_VALOR = ("", "N/A")  # o que a IA devolve quando não gerou o campo
+
+class _Vetor:
+    """Array NumPy que cresce dobrando a capacidade (append amortizado O(1))."""
+    def __init__(self, dtype):
+        self.dados = np.empty(64, dtype=dtype)
+        self.n = 0
+
+    def estender(self, valores):
+        valores = np.asarray(valores, dtype=self.dados.dtype)
+        fim = self.n + len(valores)
+        if fim > len(self.dados):
+            novo = np.empty(max(fim, 2 * len(self.dados)), dtype=self.dados.dtype)
+            novo[:self.n] = self.dados[:self.n]
+            self.dados = novo
+        self.dados[self.n:fim] = valores
+        self.n = fim
+
+    @property
+    def valores(self):
+        return self.dados[:self.n]
+
+class _Dicionario:
+    """Texto -> código sequencial (os arrays guardam só o código)."""
+    def __init__(self):
+        self.valores = []
+        self.codigo = {}
+
+    def codificar(self, texto):
+        codigo = self.codigo.get(texto)
+        if codigo is None:
+            codigo = self.codigo[texto] = len(self.valores)
+            self.valores.append(texto)
+        return codigo
+
+def dia_do_timestamp(timestamp):
+    """Dias desde 1970-01-01 de um timestamp ISO, ou None se não for uma data."""
+    try:
+        return (datetime.fromisoformat(str(timestamp)).date() - _EPOCA).days
+    except ValueError:
+        return None
+
+def semana_do_dia(dia):
+    # Semanas começando na segunda-feira (1970-01-01 foi uma quinta)
+    return (dia + 3) // 7
+
+def inicio_da_semana(semana):
+    return _EPOCA + timedelta(days=int(semana) * 7 - 3)
+
+def dividir_temas(temas):
+    return [t.strip() for t in str(temas).split(",") if t.strip() not in SEM_VALOR]
+
+def _inclinacoes(medias, tem_dado):
+    """Inclinação (nota por semana) da reta de mínimos quadrados de cada linha; NaN com menos de 2 semanas."""
+    x = np.arange(medias.shape[1], dtype=np.float64)
+    peso = tem_dado.astype(np.float64)
+    y = np.where(tem_dado, medias, 0.0)
+    k = peso.sum(axis=1)
+    sx, sy = peso @ x, y.sum(axis=1)
+    sxx, sxy = peso @ (x * x), y @ x
+    denominador = k * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where((k >= 2) & (denominador > 0), (k * sxy - sx * sy) / denominador, np.nan)
+
+def _arredondar(valor, casas=2):
+    return None if valor is None or np.isnan(valor) else round(float(valor), casas)
+
+def _mais_frequentes(contagens, valores):
+    ordem = np.argsort(-contagens, kind="stable")[:TOP_FREQUENCIAS]
+    return [(valores[i], int(contagens[i])) for i in ordem if contagens[i] > 0]
+
+class AnaliseCheckins:
+    def __init__(self):
+        self.pacientes = _Dicionario()
+        self.areas = _Dicionario()
+        self.temas = _Dicionario()
+        self.sentimentos_texto = _Dicionario()
+        # Uma posição por check-in
+        self.paciente = _Vetor(np.int32)
+        self.area = _Vetor(np.int32)
+        self.dia = _Vetor(np.int32)
+        self.nota = _Vetor(np.float64)
+        self.sentimento_texto = _Vetor(np.int32)  # -1 = sem sentimento da IA
+        self.ativo = _Vetor(np.bool_)             # False depois do descarte
+        # Uma posição por tema (um check-in pode ter vários)
+        self.tema_checkin = _Vetor(np.int32)
+        self.tema = _Vetor(np.int32)
+        self.posicao_por_registro = {}  # registro_id -> posição (evita contar duas vezes)
+        self._relatorios = {}           # código do paciente -> (dia de hoje, relatório)
+
+    def __len__(self):
+        return self.paciente.n
+
+    # --- Entrada ---
+    def adicionar_lote(self, registros, pacientes, dias, areas, notas, temas, sentimentos_texto):
+        """
+        Acrescenta check-ins (sequências do mesmo tamanho; `temas` com o texto da coluna
+        temas_gemini). Registros já vistos são ignorados. Retorna quantos entraram.
+        """
+        return self._anexar(
+            registros, np.array([self.pacientes.codificar(p) for p in pacientes], dtype=np.int32), dias,
+            np.array([self.areas.codificar(a) for a in areas], dtype=np.int32), notas, temas, sentimentos_texto
+        )
+
+    def _anexar(self, registros, codigos_pacientes, dias, codigos_areas, notas, temas, sentimentos_texto):
+        inicio = len(self)
+        novos = []
+        for j, registro_id in enumerate(registros):
+            if registro_id:
+                if registro_id in self.posicao_por_registro:
+                    continue
+                self.posicao_por_registro[registro_id] = inicio + len(novos)
+            novos.append(j)
+        if not novos:
+            return 0
+        codigos_pacientes = codigos_pacientes[novos]
+        self.paciente.estender(codigos_pacientes)
+        self.area.estender(codigos_areas[novos])
+        self.dia.estender(np.asarray(dias)[novos])
+        self.nota.estender(np.asarray(notas, dtype=np.float64)[novos])
+        self.ativo.estender(np.ones(len(novos), dtype=np.bool_))
+        # Temas e sentimentos da IA se repetem muito: cada texto distinto é dividido e codificado uma vez
+        sentimentos_vistos, temas_vistos = {}, {}
+        codigos_sentimentos, tema_checkins, codigos_temas = [], [], []
+        for posicao, j in enumerate(novos, start=inicio):
+            texto = sentimentos_texto[j]
+            codigo = sentimentos_vistos.get(texto)
+            if codigo is None:
+                limpo = str(texto).strip()
+                codigo = sentimentos_vistos[texto] = -1 if limpo in SEM_VALOR else self.sentimentos_texto.codificar(limpo)
+            codigos_sentimentos.append(codigo)
+            codigos = temas_vistos.get(temas[j])
+            if codigos is None:
+                codigos = temas_vistos[temas[j]] = [self.temas.codificar(t) for t in dividir_temas(temas[j])]
+            tema_checkins.extend([posicao] * len(codigos))
+            codigos_temas.extend(codigos)
+        self.sentimento_texto.estender(codigos_sentimentos)
+        self.tema_checkin.estender(tema_checkins)
+        self.tema.estender(codigos_temas)
+        for codigo in set(codigos_pacientes.tolist()):
+            self._relatorios.pop(codigo, None)
+        return len(novos)
+
+    def adicionar_row(self, headers, row):
+        """Um check-in no formato das linhas do storage; só entram os compartilhados e não descartados."""
+        campos = dict(zip(headers, row))
+        if str(campos.get('compartilhado', '')).upper() != 'TRUE' or str(campos.get('descartado', '')).upper() == 'TRUE':
+            return False
+        dia = dia_do_timestamp(campos.get('timestamp'))
+        try:
+            nota = float(campos.get('sentimento'))
+        except (TypeError, ValueError):
+            return False
+        if dia is None or not campos.get('paciente_id'):
+            return False
+        return self.adicionar_lote(
+            [campos.get('registro_id', '')], [campos['paciente_id']], [dia], [campos.get('area', '')],
+            [nota], [campos.get('temas_gemini', '')], [campos.get('sentimento_texto', '')]
+        ) == 1
+
+    @classmethod
+    def de_rows(cls, headers, rows):
+        analise = cls()
+        for row in rows:
+            analise.adicionar_row(headers, row)
+        return analise
+
+    @classmethod
+    def de_colunas(cls, tabela):
+        """
+        Monta direto das colunas do snapshot (ColunasCheckins): filtros e conversões
+        vetorizados; só registro_id, temas e sentimento da IA são decodificados.
+        """
+        analise = cls()
+        n = len(tabela)
+        if not n:
+            return analise
+        def numeros(valores, tipo):
+            # Cópia: um array.array com buffer exportado não pode crescer (a próxima sincronização falharia)
+            return np.frombuffer(valores, dtype=f"{tipo}{valores.itemsize}")[:n].copy()
+        def bits(nome):
+            coluna = tabela.coluna(nome)
+            if coluna is None:
+                return np.zeros(n, dtype=np.bool_)
+            return np.unpackbits(np.frombuffer(coluna.verdadeiros, dtype=np.uint8), bitorder="little")[:n].astype(np.bool_)
+        pacientes = tabela.coluna('paciente_id')
+        codigos_pacientes = numeros(pacientes.codigos, "u")
+        epocas = numeros(tabela.coluna('timestamp').epocas, "i")
+        notas = numeros(tabela.coluna('sentimento').numeros, "f")
+        validos = bits('compartilhado') & ~bits('descartado') & ~np.isnan(notas) & (epocas != np.iinfo(np.int64).min)
+        vazio = pacientes.codigo_de("")
+        if vazio is not None:
+            validos &= codigos_pacientes != vazio
+        selecionados = np.flatnonzero(validos)
+        if not len(selecionados):
+            return analise
+        areas = tabela.coluna('area')
+        headers = tabela.headers
+        def textos(nome):
+            if nome not in headers:
+                return [""] * len(selecionados)
+            return tabela.coluna(nome).textos(selecionados.tolist())
+        # Os dicionários do snapshot viram os do motor por tabela de tradução (um valor por string distinta)
+        traduzir_pacientes = np.array([analise.pacientes.codificar(v) for v in pacientes.valores], dtype=np.int32)
+        traduzir_areas = np.array([analise.areas.codificar(v) for v in areas.valores], dtype=np.int32)
+        analise._anexar(
+            textos('registro_id'),
+            traduzir_pacientes[codigos_pacientes[selecionados]],
+            epocas[selecionados] // _MICROS_POR_DIA,
+            traduzir_areas[numeros(areas.codigos, "u")[selecionados]],
+            notas[selecionados], textos('temas_gemini'), textos('sentimento_texto'),
+        )
+        return analise
+
+    def remover(self, registro_id):
+        """Tira um check-in descartado das contas."""
+        posicao = self.posicao_por_registro.pop(registro_id, None)
+        if posicao is None:
+            return False
+        self.ativo.dados[posicao] = False
+        self._relatorios.pop(int(self.paciente.dados[posicao]), None)
+        return True
+
+    # --- Consultas ---
+    def relatorio(self, pacientes, hoje: date = None):
+        """Um relatório por paciente (na ordem pedida); pacientes sem check-in vêm zerados."""
+        hoje = hoje or date.today()
+        dia_hoje = (hoje - _EPOCA).days
+        relatorios = []
+        for paciente_id in pacientes:
+            codigo = self.pacientes.codigo.get(paciente_id)
+            if codigo is None:
+                relatorios.append(self._relatorio_vazio(paciente_id))
+                continue
+            guardado = self._relatorios.get(codigo)
+            if guardado is None or guardado[0] != dia_hoje:
+                guardado = self._relatorios[codigo] = (dia_hoje, self._calcular(paciente_id, codigo, dia_hoje))
+            relatorios.append(guardado[1])
+        return relatorios
+
+    @staticmethod
+    def _relatorio_vazio(paciente_id):
+        return {"paciente": paciente_id, "checkins": 0, "media": None, "tendencia": None, "adesao": 0.0,
+                "ultimo": None, "semanal": [], "areas": [], "temas": [], "sentimentos": []}
+
+    def _calcular(self, paciente_id, codigo, dia_hoje):
+        selecao = np.flatnonzero((self.paciente.valores == codigo) & self.ativo.valores)
+        if not len(selecao):
+            return self._relatorio_vazio(paciente_id)
+        notas = self.nota.valores[selecao]
+        areas = self.area.valores[selecao]
+        dias = self.dia.valores[selecao]
+        semanas = semana_do_dia(dias)
+        primeira = int(semanas.min())
+        total_semanas = int(semanas.max()) - primeira + 1
+        n_areas = len(self.areas.valores)
+
+        # Matriz área x semana com soma e contagem das notas
+        chave = areas * total_semanas + (semanas - primeira)
+        somas = np.bincount(chave, weights=notas, minlength=n_areas * total_semanas).reshape(n_areas, total_semanas)
+        contagens = np.bincount(chave, minlength=n_areas * total_semanas).reshape(n_areas, total_semanas)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            medias = somas / contagens
+            medias_semana = somas.sum(axis=0) / contagens.sum(axis=0)
+        tem_dado = contagens > 0
+        tendencias = _inclinacoes(medias, tem_dado)
+        tendencia_geral = _inclinacoes(medias_semana[np.newaxis, :], tem_dado.any(axis=0)[np.newaxis, :])[0]
+
+        semanal = [
+            (inicio_da_semana(primeira + w).isoformat(), self.areas.valores[a], _arredondar(medias[a, w]), int(contagens[a, w]))
+            for a, w in np.argwhere(tem_dado)
+        ]
+        por_area = contagens.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media_area = somas.sum(axis=1) / por_area
+        resumo_areas = [
+            (self.areas.valores[a], int(por_area[a]), _arredondar(media_area[a]), _arredondar(tendencias[a], 3))
+            for a in np.flatnonzero(por_area)
+        ]
+
+        # Temas: uma entrada por tema de cada check-in selecionado
+        tema_checkins = self.tema_checkin.valores
+        do_paciente = (self.paciente.valores[tema_checkins] == codigo) & self.ativo.valores[tema_checkins]
+        temas = np.bincount(self.tema.valores[do_paciente], minlength=len(self.temas.valores))
+        sentimentos = self.sentimento_texto.valores[selecao]
+        sentimentos = np.bincount(sentimentos[sentimentos >= 0], minlength=len(self.sentimentos_texto.valores))
+
+        # Adesão: semanas com pelo menos um check-in, desde a primeira até a semana atual
+        semanas_ate_hoje = max(semana_do_dia(dia_hoje), int(semanas.max())) - primeira + 1
+        return {
+            "paciente": paciente_id,
+            "checkins": int(len(selecao)),
+            "media": _arredondar(notas.mean()),
+            "tendencia": _arredondar(tendencia_geral, 3),
+            "adesao": round(int(tem_dado.any(axis=0).sum()) / semanas_ate_hoje, 3),
+            "ultimo": (_EPOCA + timedelta(days=int(dias.max()))).isoformat(),
+            "semanal": semanal,
+            "areas": resumo_areas,
+            "temas": _mais_frequentes(temas, self.temas.valores),
+            "sentimentos": _mais_frequentes(sentimentos, self.sentimentos_texto.valores),
+        }
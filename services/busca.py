@@ -0,0 +1,234 @@
+# services/busca.py
+import functools
+import math
+import re
+import unicodedata
+from array import array
+import numpy as np
+
+"""
+Busca textual nos check-ins compartilhados, para a aba de busca da psicóloga.
+Índice invertido em memória sobre o diário, os tópicos e os temas e o resumo da IA:
+termo -> (posições dos check-ins, peso do termo em cada um). Montado uma vez das
+linhas do storage e mantido em dia a cada check-in novo, descartado ou reanalisado,
+como a AnaliseCheckins (services/analytics.py).
+- Acentos e maiúsculas não contam ("Insônia" acha "insonia"), e um radicalizador
+  leve do português junta plural, feminino, diminutivo e as formas verbais mais
+  comuns ("dormindo", "dormir", "dormia" -> "dorm").
+- Ranking BM25; tópicos e temas da IA pesam o dobro do texto livre. Quem tem
+  todos os termos da busca vem antes de quem tem só alguns.
+- Só os pacientes pedidos entram no resultado (filtro vetorizado, por código).
+"""
+
+# Peso de cada coluna no ranking (tópicos e temas resumem o registro)
+CAMPOS_BUSCA = {'diario_texto': 1.0, 'resumo_psicologa': 1.0, 'topicos_selecionados': 2.0, 'temas_gemini': 2.0}
+SEM_VALOR = ("", "N/A")  # o que a IA devolve quando não gerou o campo
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Acima desta fração de check-ins removidos (descarte, reanálise), as listas são reescritas sem eles
+FRACAO_REMOVIDOS_COMPACTAR = 0.5
+
+PALAVRAS_VAZIAS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles depois
+do dos e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes estou eu foi
+fui isso isto ja lhe lhes mais mas me mesmo meu meus minha minhas muito na nao nas nem no nos nossa
+nossas nosso nossos num numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser
+seu seus so sua suas tambem te tem ter teu teus tinha tu tua tuas um uma umas uns voce voces vos
+""".split())
+
+_MARCAS = re.compile(r"[\u0300-\u036f]")
+_PALAVRA = re.compile(r"[a-z0-9]+")
+
+# Radicalizador leve: (sufixo, troca), do mais longo para o mais curto dentro de cada grupo
+_PLURAL = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("res", "r"),
+           ("zes", "z"), ("ses", "s"), ("ns", "m"), ("s", ""))
+_SUFIXOS = ("amentos", "imentos", "amento", "imento", "zinho", "zinha", "mente", "idade", "acao", "icao",
+            "ancia", "encia", "inho", "inha", "avel", "ivel", "ando", "endo", "indo", "aram", "eram",
+            "iram", "avam", "ismo", "ista", "dade", "osa", "oso", "ado", "ada", "ido", "ida", "ava",
+            "iam", "ar", "er", "ir", "ia", "ou", "ei")
+_RADICAL_MINIMO = 3
+
+def sem_acentos(texto):
+    """Minúsculas e sem acentos (ç vira c)."""
+    return _MARCAS.sub("", unicodedata.normalize("NFKD", str(texto).lower()))
+
+# O vocabulário se repete muito entre os diários: cada palavra distinta é radicalizada uma vez
+@functools.lru_cache(maxsize=200_000)
+def radical(palavra):
+    """Radical de uma palavra já sem acentos; palavras curtas ficam como estão."""
+    if len(palavra) <= _RADICAL_MINIMO:
+        return palavra
+    for sufixo, troca in _PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= _RADICAL_MINIMO:
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    for sufixo in _SUFIXOS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= _RADICAL_MINIMO:
+            palavra = palavra[:-len(sufixo)]
+            break
+    if len(palavra) > _RADICAL_MINIMO and palavra[-1] in "aeo":
+        palavra = palavra[:-1]
+    return palavra
+
+def termos_do_texto(texto):
+    """Radicais das palavras do texto, na ordem, sem as palavras vazias."""
+    return [radical(p) for p in _PALAVRA.findall(sem_acentos(texto)) if len(p) > 1 and p not in PALAVRAS_VAZIAS]
+
+class IndiceBusca:
+    def __init__(self):
+        self.chaves = []             # posição -> chave do check-in (registro_id, ou o que o motor usar)
+        self.posicao_por_chave = {}  # chave -> posição (só os ativos)
+        self.codigo_paciente = {}    # paciente_id -> código
+        # Uma posição por check-in
+        self.paciente = array('I')
+        self.comprimento = array('d')
+        self.ativo = bytearray()
+        self.termos = {}             # termo -> (array de posições, array de pesos)
+        self.soma_comprimentos = 0.0
+
+    def __len__(self):
+        return len(self.posicao_por_chave)
+
+    # --- Entrada ---
+    def adicionar(self, chave, paciente_id, campos):
+        """Um check-in: `campos` = {coluna: texto}. Chaves já vistas são ignoradas. Retorna se entrou."""
+        if chave in self.posicao_por_chave:
+            return False
+        pesos = {}
+        for coluna, peso in CAMPOS_BUSCA.items():
+            texto = campos.get(coluna, "")
+            if str(texto).strip() in SEM_VALOR:
+                continue
+            for termo in termos_do_texto(texto):
+                pesos[termo] = pesos.get(termo, 0.0) + peso
+        posicao = len(self.chaves)
+        self.chaves.append(chave)
+        self.posicao_por_chave[chave] = posicao
+        codigo = self.codigo_paciente.setdefault(paciente_id, len(self.codigo_paciente))
+        self.paciente.append(codigo)
+        comprimento = sum(pesos.values())
+        self.comprimento.append(comprimento)
+        self.ativo.append(1)
+        self.soma_comprimentos += comprimento
+        for termo, peso in pesos.items():
+            lista = self.termos.get(termo)
+            if lista is None:
+                lista = self.termos[termo] = (array('I'), array('d'))
+            lista[0].append(posicao)
+            lista[1].append(peso)
+        return True
+
+    def adicionar_row(self, headers, row, chave=None):
+        """
+        Um check-in no formato das linhas do storage; só entram os compartilhados e não descartados.
+        Sem `chave`, vale o registro_id (linhas antigas sem registro_id precisam de uma chave do motor).
+        """
+        campos = dict(zip(headers, row))
+        if str(campos.get('compartilhado', '')).upper() != 'TRUE' or str(campos.get('descartado', '')).upper() == 'TRUE':
+            return False
+        chave = chave if chave is not None else campos.get('registro_id')
+        if not chave or not campos.get('paciente_id'):
+            return False
+        return self.adicionar(chave, campos['paciente_id'], campos)
+
+    @classmethod
+    def de_rows(cls, headers, rows_com_chave):
+        """`rows_com_chave`: [(chave | None, row)]."""
+        indice = cls()
+        for chave, row in rows_com_chave:
+            indice.adicionar_row(headers, row, chave)
+        return indice
+
+    def remover(self, chave):
+        """Tira um check-in descartado (ou que vai entrar de novo com outro texto) da busca."""
+        posicao = self.posicao_por_chave.pop(chave, None)
+        if posicao is None:
+            return False
+        self.ativo[posicao] = 0
+        self.soma_comprimentos -= self.comprimento[posicao]
+        removidos = len(self.chaves) - len(self.posicao_por_chave)
+        if removidos > FRACAO_REMOVIDOS_COMPACTAR * len(self.chaves):
+            self._compactar()
+        return True
+
+    def _compactar(self):
+        """Reescreve as posições sem os check-ins removidos (as chaves não mudam)."""
+        ativo = np.frombuffer(self.ativo, dtype=np.uint8).astype(np.bool_)
+        vivos = np.flatnonzero(ativo)
+        nova_posicao = np.full(len(ativo), -1, dtype=np.int64)
+        nova_posicao[vivos] = np.arange(len(vivos))
+        termos = {}
+        for termo, (posicoes, pesos) in self.termos.items():
+            p = np.array(posicoes, dtype=np.int64)
+            manter = ativo[p]
+            if manter.any():
+                termos[termo] = (array('I', nova_posicao[p[manter]].tolist()),
+                                 array('d', np.array(pesos, dtype=np.float64)[manter].tolist()))
+        self.termos = termos
+        self.chaves = [self.chaves[i] for i in vivos.tolist()]
+        self.posicao_por_chave = {chave: i for i, chave in enumerate(self.chaves)}
+        self.paciente = array('I', [self.paciente[i] for i in vivos.tolist()])
+        self.comprimento = array('d', [self.comprimento[i] for i in vivos.tolist()])
+        self.ativo = bytearray(b"\x01" * len(self.chaves))
+
+    # --- Consultas ---
+    def buscar(self, consulta, pacientes, inicio=0, limite=20):
+        """
+        Check-ins dos `pacientes` que têm algum termo da `consulta`, do mais relevante
+        para o menos (empate: o mais recente). Retorna ([(chave, pontuação)] da página, total).
+        """
+        termos = list(dict.fromkeys(termos_do_texto(consulta)))
+        codigos = [self.codigo_paciente[p] for p in pacientes if p in self.codigo_paciente]
+        if not termos or not codigos or not self.posicao_por_chave:
+            return [], 0
+        # Só as posições das listas dos termos são tocadas: nada proporcional ao índice inteiro.
+        # (Visões sem cópia: quem chama não deixa o índice crescer durante a busca.)
+        ativo = np.frombuffer(self.ativo, dtype=np.bool_)
+        paciente = np.frombuffer(self.paciente, dtype=np.uint32)
+        comprimento = np.frombuffer(self.comprimento, dtype=np.float64)
+        permitido = np.zeros(len(self.codigo_paciente), dtype=np.bool_)
+        permitido[codigos] = True
+        total_ativos = len(self.posicao_por_chave)
+        media = self.soma_comprimentos / total_ativos or 1.0
+        por_termo_posicoes, por_termo_pontos = [], []
+        for termo in termos:
+            lista = self.termos.get(termo)
+            if lista is None:
+                continue
+            posicoes = np.frombuffer(lista[0], dtype=np.uint32)
+            vivas = ativo[posicoes]
+            frequencia = int(np.count_nonzero(vivas))
+            if not frequencia:
+                continue
+            idf = math.log(1 + (total_ativos - frequencia + 0.5) / (frequencia + 0.5))
+            manter = vivas & permitido[paciente[posicoes]]
+            pesos = np.frombuffer(lista[1], dtype=np.float64)[manter]
+            posicoes = posicoes[manter].astype(np.int64)
+            normalizado = BM25_K1 * (1 - BM25_B + BM25_B * comprimento[posicoes] / media)
+            por_termo_posicoes.append(posicoes)
+            por_termo_pontos.append(idf * pesos * (BM25_K1 + 1) / (pesos + normalizado))
+        del ativo, paciente, comprimento
+        if not por_termo_posicoes:
+            return [], 0
+        if len(por_termo_posicoes) == 1:
+            candidatos, pontos = por_termo_posicoes[0], por_termo_pontos[0]
+            achados = np.ones(len(candidatos), dtype=np.int64)
+        else:
+            # Cada check-in aparece no máximo uma vez por termo: soma por posição
+            candidatos, inverso = np.unique(np.concatenate(por_termo_posicoes), return_inverse=True)
+            pontos = np.bincount(inverso, weights=np.concatenate(por_termo_pontos))
+            achados = np.bincount(inverso)
+        total = len(candidatos)
+        if not total:
+            return [], 0
+        # Quem tem mais termos vem antes; depois a pontuação (sempre menor que o teto); empate: o mais novo
+        chave = achados * (float(pontos.max()) + 1.0) + pontos
+        fim = inicio + limite
+        if fim < total:
+            # Só a cabeça do ranking é ordenada (todos os empatados no corte entram, para a ordem ser estável)
+            limiar = np.partition(chave, total - fim)[total - fim]
+            corte = np.flatnonzero(chave >= limiar)
+        else:
+            corte = np.arange(total)
+        ordem = corte[np.lexsort((-candidatos[corte], -chave[corte]))][inicio:fim]
+        return [(self.chaves[candidatos[i]], round(float(pontos[i]), 3)) for i in ordem.tolist()], total
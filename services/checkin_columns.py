@@ -0,0 +1,268 @@
+# services/checkin_columns.py
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+"""
+Armazenamento colunar das linhas da aba Checkins.
+Em vez de uma lista de listas de strings (o mesmo paciente_id, a mesma área e
+os mesmos 'TRUE'/'FALSE' repetidos em cada linha), cada coluna é guardada no
+formato que lhe cabe:
+- ids e área: dicionário (string única + código numérico por linha);
+- sentimento: array de float; timestamp: microssegundos desde a época (int64);
+- compartilhado/descartado: bits;
+- textos (diário, resumo, insight...): bytes UTF-8 contíguos, decodificados só
+  quando a linha é lida.
+As leituras continuam devolvendo listas de strings, iguais às do Sheets; um
+valor que não volta idêntico do formato compacto é guardado como veio.
+"""
+
+_EPOCA = datetime(1970, 1, 1)
+_SEM_DATA = -2 ** 63
+
+class _Coluna:
+    def __init__(self):
+        self.excecoes = {}  # índice -> texto original (o que o formato compacto não reproduz)
+
+    def __len__(self):
+        return self.n
+
+    def get(self, i):
+        texto = self.excecoes.get(i)
+        return texto if texto is not None else self._decodificar(i)
+
+    def append(self, texto):
+        texto = str(texto)
+        self._anexar(texto)
+        self.n += 1
+        self._conferir(self.n - 1, texto)
+
+    def set(self, i, texto):
+        texto = str(texto)
+        self.excecoes.pop(i, None)
+        self._trocar(i, texto)
+        self._conferir(i, texto)
+
+    def _conferir(self, i, texto):
+        if self._decodificar(i) != texto:
+            self.excecoes[i] = texto
+
+class ColunaDicionario(_Coluna):
+    """Strings repetidas: `codigos[i]` aponta para `valores` (internadas, uma de cada)."""
+    def __init__(self):
+        super().__init__()
+        self.valores = []
+        self.codigo = {}
+        self.codigos = array('I')
+        self.n = 0
+
+    def codigo_de(self, texto):
+        """Código de um valor, ou None se ele não aparece na coluna."""
+        return self.codigo.get(texto)
+
+    def _codificar(self, texto):
+        codigo = self.codigo.get(texto)
+        if codigo is None:
+            codigo = self.codigo[texto] = len(self.valores)
+            self.valores.append(sys.intern(texto))
+        return codigo
+
+    def _anexar(self, texto):
+        self.codigos.append(self._codificar(texto))
+
+    def _trocar(self, i, texto):
+        self.codigos[i] = self._codificar(texto)
+
+    def _decodificar(self, i):
+        return self.valores[self.codigos[i]]
+
+class ColunaNumero(_Coluna):
+    """Números como float; vazio ou texto vira NaN (e o original fica nas exceções)."""
+    def __init__(self):
+        super().__init__()
+        self.numeros = array('d')
+        self.n = 0
+
+    @staticmethod
+    def _converter(texto):
+        try:
+            return float(texto)
+        except ValueError:
+            return float("nan")
+
+    def _anexar(self, texto):
+        self.numeros.append(self._converter(texto))
+
+    def _trocar(self, i, texto):
+        self.numeros[i] = self._converter(texto)
+
+    def _decodificar(self, i):
+        # Mesmo formato de como_celula (write_queue): 3.0 -> '3'
+        valor = self.numeros[i]
+        if valor != valor:
+            return ""
+        return str(int(valor)) if valor.is_integer() else repr(valor)
+
+class ColunaData(_Coluna):
+    """Timestamps ISO como microssegundos desde 1970-01-01 (sem fuso, como são gravados)."""
+    def __init__(self):
+        super().__init__()
+        self.epocas = array('q')
+        self.n = 0
+
+    @staticmethod
+    def _converter(texto):
+        try:
+            return (datetime.fromisoformat(texto) - _EPOCA) // timedelta(microseconds=1)
+        except (ValueError, TypeError):
+            return _SEM_DATA
+
+    def _anexar(self, texto):
+        self.epocas.append(self._converter(texto))
+
+    def _trocar(self, i, texto):
+        self.epocas[i] = self._converter(texto)
+
+    def _decodificar(self, i):
+        epoca = self.epocas[i]
+        return "" if epoca == _SEM_DATA else (_EPOCA + timedelta(microseconds=epoca)).isoformat()
+
+class ColunaBooleana(_Coluna):
+    """'TRUE'/'FALSE'/'' em dois conjuntos de bits (verdadeiro e vazio)."""
+    def __init__(self):
+        super().__init__()
+        self.verdadeiros = bytearray()
+        self.vazios = bytearray()
+        self.n = 0
+
+    @staticmethod
+    def _ligar(bits, i, ligado):
+        if ligado:
+            bits[i >> 3] |= 1 << (i & 7)
+        else:
+            bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def _anexar(self, texto):
+        if self.n % 8 == 0:
+            self.verdadeiros.append(0)
+            self.vazios.append(0)
+        self._trocar(self.n, texto)
+
+    def _trocar(self, i, texto):
+        self._ligar(self.verdadeiros, i, texto.upper() == "TRUE")
+        self._ligar(self.vazios, i, texto == "")
+
+    def verdadeiro(self, i):
+        return bool(self.verdadeiros[i >> 3] & (1 << (i & 7)))
+
+    def _decodificar(self, i):
+        if self.vazios[i >> 3] & (1 << (i & 7)):
+            return ""
+        return "TRUE" if self.verdadeiro(i) else "FALSE"
+
+class ColunaTexto(_Coluna):
+    """Textos livres em UTF-8 num único buffer; só viram str quando lidos."""
+    def __init__(self):
+        super().__init__()
+        self.dados = bytearray()
+        self.inicios = array('Q', [0])  # a célula i vai de inicios[i] a inicios[i + 1]
+        self.n = 0
+
+    def _anexar(self, texto):
+        self.dados += texto.encode("utf-8")
+        self.inicios.append(len(self.dados))
+
+    def _trocar(self, i, texto):
+        # Raro (descarte mexe numa coluna booleana): guarda o novo texto como exceção
+        self.excecoes[i] = texto
+
+    def _conferir(self, i, texto):
+        pass  # UTF-8 sempre volta idêntico
+
+    def _decodificar(self, i):
+        return self.dados[self.inicios[i]:self.inicios[i + 1]].decode("utf-8")
+
+    def textos(self, indices):
+        """Várias células de uma vez (leitura em lote, sem o custo de `get` por célula)."""
+        dados, inicios, excecoes = self.dados, self.inicios, self.excecoes
+        return [excecoes[i] if i in excecoes else dados[inicios[i]:inicios[i + 1]].decode("utf-8") for i in indices]
+
+# Formato de cada coluna conhecida; as demais (e as que vierem a ser criadas) são texto
+TIPOS_COLUNAS = {
+    'timestamp': ColunaData, 'area': ColunaDicionario, 'sentimento': ColunaNumero,
+    'paciente_id': ColunaDicionario, 'psicologa_id': ColunaDicionario,
+    'compartilhado': ColunaBooleana, 'descartado': ColunaBooleana,
+}
+
+class ColunasCheckins:
+    """
+    Substitui a lista de linhas do SheetSnapshot da aba Checkins: `tabela[i]` devolve
+    a linha i (lista de strings, nova a cada leitura), `append` recebe uma linha completa.
+    """
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self.colunas = [TIPOS_COLUNAS.get(nome, ColunaTexto)() for nome in self.headers]
+        self.por_nome = dict(zip(self.headers, self.colunas))
+        self.sobras = {}  # índice -> células além do cabeçalho
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("linha fora da tabela")
+        row = [coluna.get(i) for coluna in self.colunas]
+        if i in self.sobras:
+            row += self.sobras[i]
+        return row
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self[i]
+
+    def append(self, row):
+        for coluna, valor in zip(self.colunas, row):
+            coluna.append(valor)
+        if len(row) > len(self.colunas):
+            self.sobras[self.n] = list(row[len(self.colunas):])
+        self.n += 1
+
+    def celula(self, i, j):
+        """Uma única célula, sem montar a linha inteira."""
+        return self.colunas[j].get(i)
+
+    def definir(self, i, j, valor):
+        self.colunas[j].set(i, valor)
+
+    def coluna(self, nome):
+        """A coluna pelo nome (ex: `coluna('paciente_id').codigos`), para filtros vetorizados."""
+        return self.por_nome.get(nome)
+
+class LinhasSelecionadas:
+    """Visão somente leitura: as linhas `indices` da tabela, seguidas de `extras` (já montadas)."""
+    def __init__(self, tabela, indices, extras=()):
+        self.tabela = tabela
+        self.indices = indices
+        self.extras = list(extras)
+
+    def __len__(self):
+        return len(self.indices) + len(self.extras)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[j] for j in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if k >= len(self.indices):
+            return self.extras[k - len(self.indices)]
+        return self.tabela[self.indices[k]]
+
+    def __iter__(self):
+        for i in self.indices:
+            yield self.tabela[i]
+        yield from self.extras
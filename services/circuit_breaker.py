@@ -0,0 +1,86 @@
+# services/circuit_breaker.py
+import asyncio
+import os
+import time
+
+"""
+Disjuntor (circuit breaker) compartilhado pelas chamadas a um serviço externo.
+Depois de N falhas seguidas (erro ou estouro de prazo) ele abre: as chamadas
+falham na hora com CircuitoAberto e quem chamou serve o fallback sem esperar.
+Enquanto aberto, uma sonda leve testa o serviço de tempos em tempos; se ela
+passar, o disjuntor fecha de novo.
+"""
+
+BREAKER_LIMITE_FALHAS = int(os.getenv("BREAKER_LIMITE_FALHAS", "5"))
+BREAKER_INTERVALO_SONDA_SECONDS = float(os.getenv("BREAKER_INTERVALO_SONDA", "30"))
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio-aberto"  # sonda em andamento
+
+class CircuitoAberto(Exception):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, nome: str, limite_falhas: int = BREAKER_LIMITE_FALHAS,
+                 intervalo_sonda: float = BREAKER_INTERVALO_SONDA_SECONDS, sonda=None):
+        self.nome = nome
+        self.limite_falhas = max(1, limite_falhas)
+        self.intervalo_sonda = intervalo_sonda
+        self.sonda = sonda  # corrotina sem argumentos; levanta exceção se o serviço ainda não respondeu
+        self.situacao = FECHADO
+        self.falhas_seguidas = 0
+        self.aberturas = 0
+        self.rejeitadas = 0
+        self.aberto_desde = None
+        self.ultimo_erro = None
+        self._tarefa_sonda = None
+
+    def verificar(self):
+        """Levanta CircuitoAberto se as chamadas não devem nem ser tentadas."""
+        if self.situacao != FECHADO:
+            self.rejeitadas += 1
+            raise CircuitoAberto(f"Circuito '{self.nome}' aberto desde {time.strftime('%H:%M:%S', time.localtime(self.aberto_desde))}.")
+
+    def sucesso(self):
+        self.falhas_seguidas = 0
+        if self.situacao != FECHADO:
+            print(f"Circuito '{self.nome}' fechado: serviço respondeu de novo.")
+            self.situacao = FECHADO
+            self.aberto_desde = None
+
+    def falha(self, erro):
+        self.falhas_seguidas += 1
+        self.ultimo_erro = f"{type(erro).__name__}: {erro}"
+        if self.situacao == FECHADO and self.falhas_seguidas >= self.limite_falhas:
+            self._abrir()
+
+    def estado(self):
+        return {
+            "nome": self.nome, "situacao": self.situacao,
+            "falhas_seguidas": self.falhas_seguidas, "aberturas": self.aberturas,
+            "rejeitadas": self.rejeitadas, "ultimo_erro": self.ultimo_erro,
+            "aberto_ha_segundos": round(time.time() - self.aberto_desde, 1) if self.aberto_desde else None,
+        }
+
+    # --- Internos ---
+    def _abrir(self):
+        self.situacao = ABERTO
+        self.aberturas += 1
+        self.aberto_desde = time.time()
+        print(f"Circuito '{self.nome}' ABERTO após {self.falhas_seguidas} falhas seguidas ({self.ultimo_erro}).")
+        if self.sonda and (self._tarefa_sonda is None or self._tarefa_sonda.done()):
+            self._tarefa_sonda = asyncio.ensure_future(self._sondar())
+
+    async def _sondar(self):
+        while self.situacao != FECHADO:
+            await asyncio.sleep(self.intervalo_sonda)
+            self.situacao = MEIO_ABERTO
+            try:
+                await self.sonda()
+            except Exception as e:
+                self.ultimo_erro = f"{type(e).__name__}: {e}"
+                self.situacao = ABERTO
+                print(f"Circuito '{self.nome}': sonda falhou, continua aberto ({self.ultimo_erro}).")
+            else:
+                self.sucesso()
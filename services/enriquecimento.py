@@ -0,0 +1,121 @@
+# services/enriquecimento.py
+import asyncio
+import os
+from models.schemas import GeminiResponse
+from services.ai_service import INSIGHT_DE_ERRO, INSIGHT_PENDENTE
+from services.idempotencia import Envio
+from services.metrics import CHECKINS_ENRIQUECIDOS
+
+"""
+Enriquecimento dos check-ins pela IA depois de salvos.
+O check-in é gravado na hora com a análise pendente (ANALISE_PENDENTE), e a análise
+do Gemini é escrita depois, no lugar, nas colunas da IA da mesma linha
+(storage.atualizar_analises), sem esperar o Gemini para salvar.
+- A primeira tentativa é a análise em streaming que o paciente acompanha na tela.
+- Se o Gemini falhar, a linha não fica com o texto de erro: novas tentativas em
+  segundo plano (prioridade baixa), com espera crescente entre elas.
+- Se a linha ainda não chegou ao Sheets (fila de escrita), a gravação espera e tenta de novo.
+O que esgotar as tentativas (ou ficar pendente numa queda do app) continua com a
+análise pendente; a reanálise em lote (services/reanalise.py) completa depois.
+"""
+
+ENRIQUECIMENTO_TENTATIVAS = int(os.getenv("ENRIQUECIMENTO_TENTATIVAS", "5"))
+ENRIQUECIMENTO_ESPERA_SECONDS = float(os.getenv("ENRIQUECIMENTO_ESPERA_SECONDS", "5"))
+ENRIQUECIMENTO_ESPERA_MAX_SECONDS = 300.0
+
+# Colunas da IA de um check-in recém-salvo, até a análise chegar
+ANALISE_PENDENTE = GeminiResponse(insight=INSIGHT_PENDENTE)
+
+class EnriquecedorCheckins:
+    def __init__(self, ai, storage, tentativas: int = ENRIQUECIMENTO_TENTATIVAS,
+                 espera: float = ENRIQUECIMENTO_ESPERA_SECONDS):
+        self.ai = ai
+        self.storage = storage
+        self.tentativas = max(1, tentativas)
+        self.espera = espera
+        self._novas_tentativas = {}  # registro_id -> Task em segundo plano
+        self._em_analise = set()     # registros na primeira tentativa
+        self._descartados = set()    # desses, os descartados antes de a análise chegar
+
+    def iniciar(self, registro_id, paciente_id, checkin_data, diario_para_analise):
+        """
+        Dispara a análise de um check-in já salvo. Retorna um Envio (services/idempotencia.py):
+        os parciais são o que o Gemini já escreveu; o resultado, o GeminiResponse da primeira
+        tentativa, ou None se ela falhou (aí a análise segue em segundo plano).
+        """
+        envio = Envio()
+        self._em_analise.add(registro_id)
+        envio.tarefa = asyncio.ensure_future(self._primeira(envio, registro_id, paciente_id, checkin_data, diario_para_analise))
+        return envio
+
+    def cancelar(self, registro_id):
+        """O check-in foi descartado: nada mais é gravado na linha dele."""
+        if registro_id in self._em_analise:
+            self._descartados.add(registro_id)
+        tarefa = self._novas_tentativas.pop(registro_id, None)
+        if tarefa is not None:
+            tarefa.cancel()
+
+    @property
+    def em_segundo_plano(self):
+        return len(self._novas_tentativas)
+
+    async def _primeira(self, envio, registro_id, paciente_id, checkin_data, diario):
+        try:
+            return await self._analisar_e_gravar(envio, registro_id, paciente_id, checkin_data, diario)
+        finally:
+            self._em_analise.discard(registro_id)
+            self._descartados.discard(registro_id)
+
+    async def _analisar_e_gravar(self, envio, registro_id, paciente_id, checkin_data, diario):
+        gemini_data = None
+        try:
+            async for parcial, final in self.ai.stream_final_checkin(checkin_data, diario):
+                if final is not None:
+                    gemini_data = final
+                elif parcial.get("insight"):
+                    envio.publicar(dict(parcial))
+        except Exception as e:
+            print(f"Erro na análise do check-in {registro_id}: {e}")
+        if registro_id in self._descartados:
+            return gemini_data
+        if gemini_data is None or gemini_data.insight == INSIGHT_DE_ERRO:
+            self._agendar(registro_id, paciente_id, checkin_data, diario, None)
+            return None
+        if await self._gravar(registro_id, paciente_id, gemini_data):
+            CHECKINS_ENRIQUECIDOS.inc(resultado="primeira")
+        else:
+            # A linha ainda está na fila de escrita: a análise já está pronta, só falta gravar
+            self._agendar(registro_id, paciente_id, checkin_data, diario, gemini_data)
+        return gemini_data
+
+    def _agendar(self, registro_id, paciente_id, checkin_data, diario, gemini_data):
+        tarefa = asyncio.ensure_future(self._tentar_de_novo(registro_id, paciente_id, checkin_data, diario, gemini_data))
+        self._novas_tentativas[registro_id] = tarefa
+        tarefa.add_done_callback(lambda _: self._novas_tentativas.pop(registro_id, None))
+
+    async def _tentar_de_novo(self, registro_id, paciente_id, checkin_data, diario, gemini_data):
+        for tentativa in range(self.tentativas):
+            await asyncio.sleep(min(self.espera * 2 ** tentativa, ENRIQUECIMENTO_ESPERA_MAX_SECONDS))
+            if gemini_data is None:
+                try:
+                    analises = await self.ai.analisar_em_lote(
+                        [(registro_id, checkin_data.area, checkin_data.sentimento, diario)])
+                    gemini_data = analises.get(registro_id)
+                except Exception as e:
+                    print(f"Erro na nova tentativa de análise do check-in {registro_id}: {e}")
+                if gemini_data is None:
+                    continue
+            if await self._gravar(registro_id, paciente_id, gemini_data):
+                CHECKINS_ENRIQUECIDOS.inc(resultado="nova_tentativa")
+                print(f"Análise do check-in {registro_id} gravada na tentativa {tentativa + 2}.")
+                return
+        CHECKINS_ENRIQUECIDOS.inc(resultado="desistiu")
+        print(f"Check-in {registro_id} ficou com a análise pendente depois de {self.tentativas + 1} tentativas.")
+
+    async def _gravar(self, registro_id, paciente_id, gemini_data):
+        try:
+            return await self.storage.atualizar_analises([(registro_id, "", paciente_id, gemini_data)]) > 0
+        except Exception as e:
+            print(f"Erro ao gravar a análise do check-in {registro_id}: {e}")
+            return False
@@ -0,0 +1,248 @@
+# services/gemini_scheduler.py
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from google.api_core import exceptions as google_exceptions
+from services.metrics import GEMINI_ESPERA_FILA
+
+"""
+Agendador único das chamadas ao Gemini.
+- Limita quantas chamadas rodam ao mesmo tempo.
+- Respeita um orçamento de requisições por segundo e de tokens por minuto (token bucket).
+- Atende por prioridade: o clique de um usuário passa na frente do trabalho em segundo plano.
+- Repete 429 (cota) com backoff exponencial e jitter, em vez de cair direto no fallback.
+- Junta prompts idênticos em voo numa única chamada, e a cancela se todos desistirem dela.
+"""
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_QPS = float(os.getenv("GEMINI_QPS", "2"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "4"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))  # 0 = sem limite de tokens por minuto
+GEMINI_MAX_TENTATIVAS = int(os.getenv("GEMINI_MAX_TENTATIVAS", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 20.0
+
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_NORMAL = 1
+PRIORIDADE_BACKGROUND = 2
+NOMES_PRIORIDADE = {PRIORIDADE_INTERATIVA: "interativa", PRIORIDADE_NORMAL: "normal", PRIORIDADE_BACKGROUND: "background"}
+
+ERROS_DE_COTA = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+class TokenBucket:
+    def __init__(self, taxa_por_segundo: float, capacidade: float):
+        self.taxa = taxa_por_segundo
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self._ultimo = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def espera_para(self, custo: float):
+        """Segundos até haver `custo` tokens (0 = já tem)."""
+        self._repor()
+        # Um pedido maior que a capacidade passa quando o balde estiver cheio
+        custo = min(custo, self.capacidade)
+        return 0.0 if self.tokens >= custo else (custo - self.tokens) / self.taxa
+
+    def consumir(self, custo: float):
+        self._repor()
+        self.tokens -= min(custo, self.capacidade)
+
+class _Pedido:
+    """Uma espera por vaga na fila; `vaga` é resolvida pelo despachante."""
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.vaga = asyncio.get_running_loop().create_future()
+        self.prioridade = None
+
+class GeminiScheduler:
+    def __init__(self, max_concorrencia: int = GEMINI_MAX_CONCURRENCY, qps: float = GEMINI_QPS,
+                 burst: int = GEMINI_BURST, tpm: int = GEMINI_TPM, max_tentativas: int = GEMINI_MAX_TENTATIVAS):
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.max_tentativas = max(1, max_tentativas)
+        self.requisicoes = TokenBucket(qps, max(1, burst))
+        self.tokens = TokenBucket(tpm / 60.0, tpm) if tpm > 0 else None
+        self.ativas = 0
+        self.retentativas_429 = 0
+        self.coalescidas = 0
+        self.canceladas = 0
+        self._fila = []                  # heap de (prioridade, ordem, _Pedido)
+        self._ordem = itertools.count()
+        self._em_voo = {}                # chave -> (Task, [_Pedido atual], [quantos esperam])
+        self._mudou = None
+        self._despachante = None
+        self._loop = None
+
+    # --- API ---
+    async def executar(self, chamada, prioridade: int = PRIORIDADE_NORMAL, chave=None, tokens: int = 0):
+        """
+        Roda `chamada()` (corrotina sem argumentos) quando houver vaga e orçamento.
+        Com `chave`, quem pedir a mesma chave enquanto a primeira está em voo
+        recebe o mesmo resultado, sem nova chamada ao Gemini. Se todos os que
+        esperam uma chave forem cancelados, a chamada é cancelada também.
+        """
+        if chave is None:
+            return await self._com_retentativas(chamada, prioridade, tokens, [None])
+        if chave in self._em_voo:
+            tarefa, pedido_atual, esperando = self._em_voo[chave]
+            self.coalescidas += 1
+            self._promover(pedido_atual[0], prioridade)
+            return await self._esperar_em_voo(chave, tarefa, esperando)
+        pedido_atual = [None]
+        esperando = [0]
+        tarefa = asyncio.ensure_future(self._com_retentativas(chamada, prioridade, tokens, pedido_atual))
+        self._em_voo[chave] = (tarefa, pedido_atual, esperando)
+        tarefa.add_done_callback(lambda t: self._fim_em_voo(chave, t))
+        return await self._esperar_em_voo(chave, tarefa, esperando)
+
+    async def stream(self, abrir, prioridade: int = PRIORIDADE_NORMAL, tokens: int = 0):
+        """
+        Para respostas em streaming: `abrir()` devolve o iterável assíncrono de pedaços.
+        A vaga fica presa até o fim do stream; só repete 429 se nada foi entregue ainda.
+        """
+        for tentativa in range(self.max_tentativas):
+            entregou = False
+            async with self._vaga(prioridade, tokens, [None]):
+                try:
+                    async for pedaco in await abrir():
+                        entregou = True
+                        yield pedaco
+                    return
+                except ERROS_DE_COTA as e:
+                    if entregou or tentativa == self.max_tentativas - 1:
+                        raise
+                    espera = self._backoff(tentativa, e)
+            await asyncio.sleep(espera)
+
+    def estado(self):
+        return {
+            "ativas": self.ativas, "na_fila": sum(1 for _, _, p in self._fila if not p.vaga.done()),
+            "em_voo_coalescidas": len(self._em_voo), "coalescidas": self.coalescidas,
+            "retentativas_429": self.retentativas_429, "canceladas": self.canceladas,
+        }
+
+    # --- Internos ---
+    async def _com_retentativas(self, chamada, prioridade, tokens, pedido_atual):
+        for tentativa in range(self.max_tentativas):
+            async with self._vaga(prioridade, tokens, pedido_atual):
+                try:
+                    return await chamada()
+                except ERROS_DE_COTA as e:
+                    if tentativa == self.max_tentativas - 1:
+                        raise
+                    espera = self._backoff(tentativa, e)
+            await asyncio.sleep(espera)
+
+    async def _esperar_em_voo(self, chave, tarefa, esperando):
+        esperando[0] += 1
+        try:
+            # shield: se este chamador for cancelado, os outros que esperam a mesma chave seguem
+            return await asyncio.shield(tarefa)
+        finally:
+            esperando[0] -= 1
+            if esperando[0] == 0 and not tarefa.done():
+                # Ninguém mais quer a resposta (pedido superado, prazo): não gasta cota com ela
+                self.canceladas += 1
+                tarefa.cancel()
+                # Quem pedir a mesma chave daqui em diante começa outra chamada, não esta que está morrendo
+                self._fim_em_voo(chave, tarefa)
+
+    def _fim_em_voo(self, chave, tarefa):
+        registro = self._em_voo.get(chave)
+        if registro is not None and registro[0] is tarefa:
+            del self._em_voo[chave]
+        # Marca o erro como lido (ninguém pode estar esperando)
+        if tarefa.done() and not tarefa.cancelled():
+            tarefa.exception()
+
+    def _backoff(self, tentativa, erro):
+        self.retentativas_429 += 1
+        espera = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** tentativa))
+        print(f"Gemini sem cota (429): nova tentativa em {espera:.1f}s. ({erro})")
+        return espera
+
+    @asynccontextmanager
+    async def _vaga(self, prioridade, tokens, pedido_atual):
+        pedido = _Pedido(tokens)
+        pedido_atual[0] = pedido
+        self._enfileirar(pedido, prioridade)
+        inicio = time.monotonic()
+        try:
+            await pedido.vaga
+        except asyncio.CancelledError:
+            # Pode ter ganhado a vaga no mesmo instante em que foi cancelado
+            if pedido.vaga.done() and not pedido.vaga.cancelled():
+                self._liberar()
+            else:
+                pedido.vaga.cancel()
+            raise
+        GEMINI_ESPERA_FILA.observar(time.monotonic() - inicio,
+                                    prioridade=NOMES_PRIORIDADE.get(pedido.prioridade, pedido.prioridade))
+        try:
+            yield
+        finally:
+            self._liberar()
+
+    def _enfileirar(self, pedido, prioridade):
+        pedido.prioridade = prioridade
+        heapq.heappush(self._fila, (prioridade, next(self._ordem), pedido))
+        self._acordar()
+
+    def _promover(self, pedido, prioridade):
+        """Um pedido já na fila herda a prioridade maior de quem se juntou a ele."""
+        if pedido is not None and not pedido.vaga.done() and prioridade < pedido.prioridade:
+            self._enfileirar(pedido, prioridade)
+
+    def _liberar(self):
+        self.ativas -= 1
+        self._acordar()
+
+    def _acordar(self):
+        # O Event e o despachante ficam presos ao event loop em que foram criados
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._mudou = asyncio.Event()
+            self._despachante = None
+            self._loop = loop
+        self._mudou.set()
+        if self._despachante is None or self._despachante.done():
+            self._despachante = asyncio.ensure_future(self._despachar())
+
+    async def _despachar(self):
+        while self._fila:
+            _, _, pedido = self._fila[0]
+            if pedido.vaga.done():
+                heapq.heappop(self._fila)  # cancelado, ou entrada duplicada de um pedido promovido
+                continue
+            self._mudou.clear()
+            if self.ativas >= self.max_concorrencia:
+                await self._mudou.wait()
+                continue
+            espera = self.requisicoes.espera_para(1)
+            if self.tokens is not None and pedido.tokens:
+                espera = max(espera, self.tokens.espera_para(pedido.tokens))
+            if espera > 0:
+                # Acorda antes se chegar algo mais prioritário
+                try:
+                    await asyncio.wait_for(self._mudou.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._fila)
+            self.requisicoes.consumir(1)
+            if self.tokens is not None and pedido.tokens:
+                self.tokens.consumir(pedido.tokens)
+            self.ativas += 1
+            pedido.vaga.set_result(None)
+
+def estimar_tokens(prompt: str, saida: int = 300):
+    """Estimativa grosseira (~4 caracteres por token) para o orçamento de tokens por minuto."""
+    return len(prompt) // 4 + saida
@@ -0,0 +1,125 @@
+# services/idempotencia.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+"""
+Envios idempotentes do check-in final.
+Um duplo clique em "Registrar Check-in", ou o Gradio reenviando depois de uma
+conexão instável, roda o mesmo check-in de novo: outra análise no Gemini e outra
+linha na aba. Aqui cada envio ganha uma chave (sessão + hash do conteúdo) e roda
+numa tarefa própria; um segundo envio com a mesma chave acompanha a tarefa em
+andamento (ou pega o resultado já pronto) em vez de começar outra.
+- A tarefa não pertence a nenhum handler: se a primeira conexão cair, o envio
+  termina mesmo assim e o reenvio recebe o resultado.
+- Envios que falharam são esquecidos na hora (o próximo tenta de novo).
+"""
+
+# Quanto tempo um check-in concluído continua respondendo aos reenvios
+IDEMPOTENCIA_TTL_SECONDS = float(os.getenv("IDEMPOTENCIA_TTL_SECONDS", "600"))
+IDEMPOTENCIA_MAX_ENVIOS = int(os.getenv("IDEMPOTENCIA_MAX_ENVIOS", "5000"))
+
+def chave_do_envio(sessao, *conteudo):
+    """Sessão + sha256 do conteúdo (modelos pydantic entram pelos seus campos)."""
+    normalizado = [c.model_dump() if hasattr(c, "model_dump") else c for c in conteudo]
+    texto = json.dumps(normalizado, ensure_ascii=False, sort_keys=True, default=str)
+    return f"{sessao}:{hashlib.sha256(texto.encode('utf-8')).hexdigest()}"
+
+class Envio:
+    """Uma tarefa em andamento (ou concluída) e o último parcial que ela publicou."""
+    def __init__(self):
+        self.parcial = None
+        self.tarefa = None
+        self._mudou = asyncio.Event()
+
+    def publicar(self, parcial):
+        """Chamado pela tarefa a cada parcial (ex: o insight enquanto o Gemini escreve)."""
+        self.parcial = parcial
+        self._mudou.set()
+
+    async def acompanhar(self):
+        """Gera os parciais novos até a tarefa terminar; depois, `await envio.resultado()`."""
+        visto = None
+        while True:
+            if self.parcial is not None and self.parcial is not visto:
+                visto = self.parcial
+                yield visto
+            if self.tarefa.done():
+                return
+            self._mudou.clear()
+            espera = asyncio.ensure_future(self._mudou.wait())
+            try:
+                await asyncio.wait({espera, self.tarefa}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                espera.cancel()
+
+    async def resultado(self):
+        # shield: quem desistiu de esperar não cancela a tarefa dos outros
+        return await asyncio.shield(self.tarefa)
+
+class EnviosIdempotentes:
+    def __init__(self, ttl: float = IDEMPOTENCIA_TTL_SECONDS, max_envios: int = IDEMPOTENCIA_MAX_ENVIOS):
+        self.ttl = ttl
+        self.max_envios = max(1, max_envios)
+        self._envios = OrderedDict()  # chave -> (expira_em, Envio); expira_em None = em andamento
+
+    def iniciar(self, chave, executar):
+        """
+        Retorna (envio, repetido). Se a chave é nova, `executar(envio)` (corrotina) roda numa
+        tarefa própria e pode chamar `envio.publicar(parcial)`; se não, devolve o envio existente.
+        """
+        self._limpar()
+        registro = self._envios.get(chave)
+        if registro is not None:
+            return registro[1], True
+        envio = Envio()
+        envio.tarefa = asyncio.ensure_future(executar(envio))
+        self._envios[chave] = (None, envio)
+        envio.tarefa.add_done_callback(lambda tarefa: self._concluir(chave, envio, tarefa))
+        return envio, False
+
+    def esquecer(self, condicao, condicao_parcial=None):
+        """
+        Tira os envios cujo resultado satisfaz `condicao` (ex: o registro foi descartado) e, dos que
+        ainda estão em andamento, os cujo último parcial satisfaz `condicao_parcial`: o reenvio
+        seguinte começa outro envio, em vez de acompanhar um cujo resultado já não vale.
+        """
+        for chave, (_, envio) in list(self._envios.items()):
+            # Pela tarefa, não por expira_em: o _concluir pode ainda não ter rodado
+            tarefa = envio.tarefa
+            if tarefa.done():
+                esquecer = not tarefa.cancelled() and tarefa.exception() is None and condicao(tarefa.result())
+            else:
+                esquecer = condicao_parcial is not None and envio.parcial is not None and condicao_parcial(envio.parcial)
+            if esquecer:
+                del self._envios[chave]
+
+    def __len__(self):
+        self._limpar()
+        return len(self._envios)
+
+    def _concluir(self, chave, envio, tarefa):
+        registro = self._envios.get(chave)
+        if registro is None or registro[1] is not envio:
+            return
+        if tarefa.cancelled() or tarefa.exception() is not None:
+            del self._envios[chave]
+        else:
+            self._envios[chave] = (time.monotonic() + self.ttl, envio)
+
+    def _limpar(self):
+        agora = time.monotonic()
+        for chave, (expira_em, _) in list(self._envios.items()):
+            if expira_em is not None and expira_em <= agora:
+                del self._envios[chave]
+        # Acima do limite, saem os concluídos mais antigos (os em andamento ficam)
+        excesso = len(self._envios) - self.max_envios
+        for chave, (expira_em, _) in list(self._envios.items()):
+            if excesso <= 0:
+                break
+            if expira_em is not None:
+                del self._envios[chave]
+                excesso -= 1
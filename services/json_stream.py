@@ -0,0 +1,122 @@
+# services/json_stream.py
+import json
+
+"""
+Leitura tolerante de JSON incompleto, para mostrar a resposta do Gemini
+enquanto ela ainda está chegando (stream=True).
+'{"insight": "Parece que o dia' -> {"insight": "Parece que o dia"}
+Strings pela metade entram como estão; números, literais e chaves pela metade
+ficam de fora até chegarem completos.
+"""
+
+_INCOMPLETO = object()
+
+def parse_json_parcial(texto: str):
+    """Retorna o melhor objeto possível com o que chegou até agora (ou None)."""
+    leitor = _LeitorParcial(texto)
+    leitor.pular_espacos()
+    valor = leitor.valor()
+    return None if valor is _INCOMPLETO else valor
+
+class _LeitorParcial:
+    def __init__(self, texto):
+        self.texto = texto
+        self.i = 0
+
+    @property
+    def fim(self):
+        return self.i >= len(self.texto)
+
+    def pular_espacos(self):
+        while not self.fim and self.texto[self.i] in " \t\r\n":
+            self.i += 1
+
+    def valor(self):
+        if self.fim:
+            return _INCOMPLETO
+        c = self.texto[self.i]
+        if c == "{":
+            return self.objeto()
+        if c == "[":
+            return self.lista()
+        if c == '"':
+            valor, _ = self.string()
+            return valor
+        return self.escalar()
+
+    def objeto(self):
+        resultado = {}
+        self.i += 1
+        while True:
+            self.pular_espacos()
+            if self.fim:
+                return resultado
+            if self.texto[self.i] == "}":
+                self.i += 1
+                return resultado
+            if self.texto[self.i] == ",":
+                self.i += 1
+                continue
+            if self.texto[self.i] != '"':
+                raise ValueError(f"Chave inválida na posição {self.i}")
+            chave, completa = self.string()
+            self.pular_espacos()
+            if not completa or self.fim:
+                return resultado
+            if self.texto[self.i] != ":":
+                raise ValueError(f"Esperava ':' na posição {self.i}")
+            self.i += 1
+            self.pular_espacos()
+            valor = self.valor()
+            if valor is not _INCOMPLETO:
+                resultado[chave] = valor
+            if self.fim:
+                return resultado
+
+    def lista(self):
+        resultado = []
+        self.i += 1
+        while True:
+            self.pular_espacos()
+            if self.fim:
+                return resultado
+            if self.texto[self.i] == "]":
+                self.i += 1
+                return resultado
+            if self.texto[self.i] == ",":
+                self.i += 1
+                continue
+            valor = self.valor()
+            if valor is not _INCOMPLETO:
+                resultado.append(valor)
+            if self.fim:
+                return resultado
+
+    def string(self):
+        """Retorna (texto decodificado até aqui, fechou_aspas)."""
+        self.i += 1
+        partes = []
+        while not self.fim:
+            c = self.texto[self.i]
+            if c == '"':
+                self.i += 1
+                return "".join(partes), True
+            if c == "\\":
+                escape = self.texto[self.i:self.i + 6] if self.texto[self.i + 1:self.i + 2] == "u" else self.texto[self.i:self.i + 2]
+                if len(escape) < 2 or (escape[1] == "u" and len(escape) < 6):
+                    self.i = len(self.texto)  # escape cortado no meio: espera o próximo pedaço
+                    break
+                partes.append(json.loads(f'"{escape}"'))
+                self.i += len(escape)
+                continue
+            partes.append(c)
+            self.i += 1
+        return "".join(partes), False
+
+    def escalar(self):
+        inicio = self.i
+        while not self.fim and self.texto[self.i] not in ",]} \t\r\n":
+            self.i += 1
+        if self.fim:
+            return _INCOMPLETO  # pode ser '12' de '123' ou 'tr' de 'true'
+        return json.loads(self.texto[inicio:self.i])
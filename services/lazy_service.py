@@ -0,0 +1,128 @@
+# services/lazy_service.py
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import aclosing
+from services.metrics import SERVICO_LATENCIA, SERVICO_ERROS, SERVICO_LINHAS, medir_chamada
+
+"""
+Inicialização preguiçosa dos serviços (Sheets/SQLite e Gemini).
+Construir os singletons autentica no Google, abre as abas e baixa os usuários;
+em vez de fazer isso no import (e derrubar o app se o Sheets estiver fora),
+o app sobe a UI na hora e o serviço é montado numa thread em segundo plano.
+Quem chama um método espera só pelo serviço de que precisa. Se a montagem
+falhar, a próxima chamada tenta de novo.
+"""
+
+PENDENTE = "pendente"
+INICIANDO = "iniciando"
+PRONTO = "pronto"
+FALHOU = "falhou"
+
+class ServicoIndisponivel(Exception):
+    pass
+
+class ServicoPreguicoso:
+    """
+    Substituto do singleton: `await servico.metodo(...)` funciona igual, esperando a
+    montagem se preciso. `interface` é a classe usada para saber quais métodos são
+    corrotinas ou geradores assíncronos; atributos comuns exigem o serviço pronto.
+    """
+    def __init__(self, nome: str, fabrica, interface):
+        self._nome = nome
+        self._fabrica = fabrica
+        self._interface = interface
+        self._lock = threading.Lock()
+        self._futuro = None
+        self._instancia = None
+        self.situacao = PENDENTE
+        self.erro = None
+        self.segundos_para_iniciar = None
+
+    def iniciar_em_segundo_plano(self):
+        """Dispara a montagem (se ainda não começou ou se a anterior falhou). Retorna o Future."""
+        with self._lock:
+            if self._futuro is None or (self._futuro.done() and self._futuro.exception() is not None):
+                self._futuro = Future()
+                self.situacao = INICIANDO
+                threading.Thread(target=self._construir, args=(self._futuro,), daemon=True,
+                                 name=f"iniciar-{self._nome}").start()
+            return self._futuro
+
+    async def obter(self):
+        """A instância pronta, esperando a montagem sem bloquear o event loop."""
+        if self._instancia is not None:
+            return self._instancia
+        return await asyncio.wrap_future(self.iniciar_em_segundo_plano())
+
+    def usar(self, instancia):
+        """Troca o serviço por uma instância já montada (ex: os fakes dos benchmarks)."""
+        futuro = Future()
+        futuro.set_result(instancia)
+        with self._lock:
+            self._futuro = futuro
+            self._instancia = instancia
+            self.situacao = PRONTO
+            self.erro = None
+
+    @property
+    def pronto(self):
+        return self._instancia is not None
+
+    def prontidao(self):
+        """Situação da montagem (os nomes do serviço real, como `estado`, ficam livres para ele)."""
+        return {"situacao": self.situacao, "erro": self.erro, "segundos_para_iniciar": self.segundos_para_iniciar}
+
+    def _construir(self, futuro):
+        inicio = time.monotonic()
+        print(f"Iniciando serviço '{self._nome}' em segundo plano...")
+        try:
+            instancia = self._fabrica()
+        except Exception as e:
+            erro = f"{type(e).__name__}: {e}"
+            print(f"Falha ao iniciar o serviço '{self._nome}': {erro}")
+            if futuro is self._futuro:  # senão, foi substituído por `usar` enquanto montava
+                self.situacao = FALHOU
+                self.erro = erro
+            futuro.set_exception(ServicoIndisponivel(f"Serviço '{self._nome}' indisponível: {erro}"))
+            return
+        with self._lock:
+            if futuro is not self._futuro:
+                futuro.set_result(instancia)  # substituído por `usar` enquanto montava
+                return
+            self._instancia = instancia
+        self.segundos_para_iniciar = round(time.monotonic() - inicio, 2)
+        self.situacao = PRONTO
+        self.erro = None
+        print(f"Serviço '{self._nome}' pronto em {self.segundos_para_iniciar}s.")
+        futuro.set_result(instancia)
+
+    def __getattr__(self, nome):
+        # Só é chamado para o que não existe no próprio proxy
+        if nome.startswith("__"):
+            raise AttributeError(nome)
+        membro = getattr(self._interface, nome, None)
+        if inspect.isasyncgenfunction(membro):
+            async def gerador(*args, **kwargs):
+                servico = await self.obter()
+                with medir_chamada(SERVICO_LATENCIA, SERVICO_ERROS, servico=self._nome, metodo=nome):
+                    async with aclosing(getattr(servico, nome)(*args, **kwargs)) as itens:
+                        async for item in itens:
+                            yield item
+            return gerador
+        if inspect.iscoroutinefunction(membro):
+            async def metodo(*args, **kwargs):
+                servico = await self.obter()
+                # A espera pela montagem fica de fora: mede só o método
+                with medir_chamada(SERVICO_LATENCIA, SERVICO_ERROS, servico=self._nome, metodo=nome):
+                    resultado = await getattr(servico, nome)(*args, **kwargs)
+                # Leituras devolvem (headers, rows, ...)
+                if isinstance(resultado, tuple) and len(resultado) > 1 and isinstance(resultado[1], list):
+                    SERVICO_LINHAS.inc(len(resultado[1]), servico=self._nome, metodo=nome)
+                return resultado
+            return metodo
+        if self._instancia is None:
+            raise ServicoIndisponivel(f"Serviço '{self._nome}' ainda não está pronto ({self.situacao}).")
+        return getattr(self._instancia, nome)
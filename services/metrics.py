@@ -0,0 +1,222 @@
+# services/metrics.py
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Métricas em memória expostas no formato texto do Prometheus (GET /metrics).
+Contadores, medidores e histogramas com rótulos, sem dependência externa;
+o catálogo de métricas do app fica no fim deste arquivo. `medir_handler`
+instrumenta os handlers do Gradio e `medir_chamada` qualquer trecho de código.
+"""
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _formatar(valor):
+    if valor == math.inf:
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+def _rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome: str, ajuda: str, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}  # tupla de valores dos rótulos -> valor
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"Métrica '{self.nome}' espera os rótulos {self.rotulos}, recebeu {tuple(rotulos)}.")
+        return tuple(str(rotulos[r]) for r in self.rotulos)
+
+    def renderizar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            linhas.extend(self._amostras(chave, valor))
+        return linhas
+
+    def _amostras(self, chave, valor):
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_formatar(valor)}"]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+class Medidor(_Metrica):
+    """Valor que sobe e desce. Com `funcao`, o valor é lido na hora de renderizar."""
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=(), funcao=None):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao  # () -> {tupla de rótulos: valor}
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor=1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def set(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def renderizar(self):
+        if self.funcao is not None:
+            try:
+                valores = self.funcao()
+            except Exception as e:
+                print(f"Erro ao ler a métrica '{self.nome}': {e}")
+                valores = {}
+            with self._lock:
+                self._valores = {tuple(str(v) for v in chave): valor for chave, valor in valores.items()}
+        return super().renderizar()
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+                    break
+            self._valores[chave] = (contagens, soma + valor)
+
+    def _amostras(self, chave, valor):
+        contagens, soma = valor
+        amostras, acumulado = [], 0
+        for limite, contagem in zip(self.buckets, contagens):
+            acumulado += contagem
+            le = 'le="' + _formatar(limite) + '"'
+            amostras.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+        amostras.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_formatar(soma)}")
+        amostras.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return amostras
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+
+    def _registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, rotulos=(), funcao=None):
+        return self._registrar(Medidor(nome, ajuda, rotulos, funcao))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def renderizar(self):
+        linhas = []
+        for metrica in self.metricas:
+            linhas.extend(metrica.renderizar())
+        return "\n".join(linhas) + "\n"
+
+registro = Registro()
+
+# --- Catálogo de métricas do app ---
+HANDLER_LATENCIA = registro.histograma("painel_handler_latencia_segundos", "Duração dos handlers do Gradio (streaming: até o último item).", ("handler",))
+HANDLER_ERROS = registro.contador("painel_handler_erros_total", "Exceções que escaparam dos handlers do Gradio.", ("handler",))
+HANDLER_EM_ANDAMENTO = registro.medidor("painel_handler_em_andamento", "Handlers do Gradio rodando agora.", ("handler",))
+CHECKINS_REPETIDOS = registro.contador("painel_checkins_repetidos_total", "Envios de check-in iguais (mesma sessão) atendidos pelo envio original.", ("estado",))
+CHECKINS_ENRIQUECIDOS = registro.contador("painel_checkins_enriquecidos_total", "Análises da IA gravadas (ou abandonadas) depois do check-in salvo.", ("resultado",))
+PEDIDOS_SUPERADOS = registro.contador("painel_pedidos_superados_total", "Pedidos cancelados por um pedido mais novo da mesma sessão.", ("pedido",))
+
+SERVICO_LATENCIA = registro.histograma("painel_servico_latencia_segundos", "Duração dos métodos do storage e da IA.", ("servico", "metodo"))
+SERVICO_ERROS = registro.contador("painel_servico_erros_total", "Exceções levantadas pelos métodos do storage e da IA.", ("servico", "metodo"))
+SERVICO_LINHAS = registro.contador("painel_servico_linhas_devolvidas_total", "Linhas devolvidas pelos métodos de leitura do storage.", ("servico", "metodo"))
+
+SHEETS_CHAMADAS = registro.contador("painel_sheets_chamadas_total", "Chamadas à API do Google Sheets.", ("endpoint", "resultado"))
+SHEETS_LATENCIA = registro.histograma("painel_sheets_latencia_segundos", "Latência das chamadas à API do Google Sheets.", ("endpoint",))
+SHEETS_BYTES_LIDOS = registro.contador("painel_sheets_bytes_lidos_total", "Bytes recebidos da API do Google Sheets.", ("endpoint",))
+SHEETS_LINHAS_LIDAS = registro.contador("painel_sheets_linhas_lidas_total", "Linhas trazidas do Sheets para os snapshots.", ("aba", "modo"))
+CACHE_COMPARTILHADO_LINHAS = registro.contador("painel_cache_compartilhado_linhas_lidas_total", "Linhas trazidas do cache compartilhado (outros processos) para os snapshots.", ("aba", "modo"))
+SHEETS_LINHAS_GRAVADAS = registro.contador("painel_sheets_linhas_gravadas_total", "Linhas enviadas ao Sheets pela fila de escrita.", ("aba",))
+
+GEMINI_CHAMADAS = registro.contador("painel_gemini_chamadas_total", "Chamadas ao Gemini.", ("operacao", "resultado"))
+GEMINI_LATENCIA = registro.histograma("painel_gemini_latencia_segundos", "Latência das chamadas ao Gemini, sem a espera na fila.", ("operacao",))
+GEMINI_ESPERA_FILA = registro.histograma("painel_gemini_espera_fila_segundos", "Espera por vaga no scheduler do Gemini.", ("prioridade",))
+GEMINI_TOKENS = registro.contador("painel_gemini_tokens_total", "Tokens informados pelo Gemini (usage_metadata).", ("operacao", "tipo"))
+
+# --- Instrumentação ---
+@contextmanager
+def medir_chamada(latencia, erros=None, **rotulos):
+    """Observa a duração do bloco em `latencia` e conta exceções em `erros`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if erros is not None and not isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+            erros.inc(**rotulos)
+        raise
+    finally:
+        latencia.observar(time.perf_counter() - inicio, **rotulos)
+
+def medir_handler(fn):
+    """Decorador dos handlers do Gradio (função, corrotina ou gerador assíncrono)."""
+    nome = fn.__name__
+
+    @contextmanager
+    def em_andamento():
+        HANDLER_EM_ANDAMENTO.inc(handler=nome)
+        try:
+            with medir_chamada(HANDLER_LATENCIA, HANDLER_ERROS, handler=nome):
+                yield
+        finally:
+            HANDLER_EM_ANDAMENTO.dec(handler=nome)
+
+    # functools.wraps preserva a assinatura: o Gradio continua vendo os parâmetros (ex: gr.Request)
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def gerador(*args, **kwargs):
+            with em_andamento():
+                async for item in fn(*args, **kwargs):
+                    yield item
+        return gerador
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def corrotina(*args, **kwargs):
+            with em_andamento():
+                return await fn(*args, **kwargs)
+        return corrotina
+
+    @functools.wraps(fn)
+    def funcao(*args, **kwargs):
+        with em_andamento():
+            return fn(*args, **kwargs)
+    return funcao
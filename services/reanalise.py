@@ -0,0 +1,185 @@
+# services/reanalise.py
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from services.ai_service import INSIGHT_DE_ERRO, INSIGHT_PENDENTE
+from services.gemini_scheduler import GeminiScheduler
+
+"""
+Reanálise em lote dos check-ins já salvos (job offline, fora do app).
+Refaz as colunas da IA (insight, ação, sentimento, temas, resumo) dos check-ins
+com diário que ficaram com a análise de erro ou pendente (o enriquecimento em
+segundo plano desistiu, ou o app caiu antes); com --todos, de todos eles (ex:
+depois de mudar o prompt da análise final).
+- Vários diários vão num mesmo pedido ao Gemini (--por-pedido).
+- Concorrência e pedidos por segundo próprios (--concorrencia, --qps), bem abaixo
+  dos do app, que divide a mesma cota; --max-pedidos limita a rodada.
+- Os resultados são gravados em lotes (values:batchUpdate) e cada lote gravado
+  entra no checkpoint. Interrompido (Ctrl+C / SIGTERM), o job termina os pedidos
+  em voo, grava o que já voltou e sai; a próxima execução retoma de onde parou.
+Uso:
+    python -m services.reanalise                          # só os que ficaram com a análise de erro ou pendente
+    python -m services.reanalise --todos --desde 2024-06-01
+    python -m services.reanalise --todos --recomecar      # ignora o checkpoint anterior
+O app em execução vê as análises novas na próxima recarga completa do snapshot.
+"""
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Reanálise em lote dos check-ins salvos.")
+    parser.add_argument("--todos", action="store_true", help="Todos os check-ins com diário, não só os com análise de erro ou pendente.")
+    parser.add_argument("--desde", default=None, help="Só check-ins a partir deste timestamp ISO (ex: 2024-06-01).")
+    parser.add_argument("--por-pedido", type=int, default=10, help="Diários por pedido ao Gemini.")
+    parser.add_argument("--concorrencia", type=int, default=2, help="Pedidos ao Gemini ao mesmo tempo.")
+    parser.add_argument("--qps", type=float, default=0.5, help="Pedidos ao Gemini por segundo.")
+    parser.add_argument("--max-pedidos", type=int, default=0, help="Para depois de tantos pedidos (0 = sem limite).")
+    parser.add_argument("--lote-escrita", type=int, default=100, help="Check-ins gravados por vez (e por checkpoint).")
+    parser.add_argument("--checkpoint", default="reanalise_checkpoint.jsonl", help="Arquivo com os check-ins já reanalisados.")
+    parser.add_argument("--recomecar", action="store_true", help="Apaga o checkpoint e começa do zero.")
+    return parser.parse_args(argv)
+
+# --- Seleção ---
+def chave_do_checkin(registro_id, timestamp, paciente_id):
+    """Identificador do check-in no checkpoint (os antigos não têm registro_id)."""
+    return registro_id or f"{timestamp}|{paciente_id}"
+
+def selecionar(headers, rows, todos=False, desde=None, feitos=()):
+    """[(chave, (registro_id, timestamp, paciente_id), area, sentimento, diario)] a reanalisar."""
+    col = {nome: headers.index(nome) for nome in headers}
+    registro_col = col.get('registro_id')
+    candidatos = []
+    for row in rows:
+        diario, insight, timestamp = row[col['diario_texto']], row[col['insight_ia']], row[col['timestamp']]
+        if not diario or (not todos and insight not in (INSIGHT_DE_ERRO, INSIGHT_PENDENTE, "", "N/A")):
+            continue
+        if desde and timestamp < desde:
+            continue
+        identificacao = (row[registro_col] if registro_col is not None else "", timestamp, row[col['paciente_id']])
+        chave = chave_do_checkin(*identificacao)
+        if chave in feitos:
+            continue
+        candidatos.append((chave, identificacao, row[col['area']], row[col['sentimento']], diario))
+    return candidatos
+
+# --- Checkpoint ---
+class Checkpoint:
+    """Diário append-only (com fsync) das chaves já gravadas, como o da fila de escrita."""
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def ler(self):
+        feitos = set()
+        if not os.path.exists(self.caminho):
+            return feitos
+        with open(self.caminho, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    feitos.add(json.loads(linha)["chave"])
+                except (ValueError, KeyError, TypeError):
+                    continue  # última linha cortada por uma queda
+        return feitos
+
+    def registrar(self, chaves):
+        with open(self.caminho, "a", encoding="utf-8") as f:
+            for chave in chaves:
+                f.write(json.dumps({"chave": chave}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def apagar(self):
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+# --- Execução ---
+async def reanalisar(storage, ai, args, parar=None):
+    """Roda a reanálise e retorna um resumo. `parar` (asyncio.Event) encerra sem perder o que voltou."""
+    parar = parar or asyncio.Event()
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.recomecar:
+        checkpoint.apagar()
+    feitos = checkpoint.ler()
+    headers, rows = await storage.get_all_checkin_data()
+    if not headers:
+        print("Nenhum check-in para reanalisar.")
+        return {"candidatos": 0, "pedidos": 0, "gravados": 0, "falhas": 0}
+    candidatos = selecionar(headers, rows, args.todos, args.desde, feitos)
+    print(f"Reanálise: {len(candidatos)} check-ins a reanalisar ({len(feitos)} já no checkpoint).")
+
+    lotes = iter([candidatos[i:i + args.por_pedido] for i in range(0, len(candidatos), max(1, args.por_pedido))])
+    resumo = {"candidatos": len(candidatos), "pedidos": 0, "gravados": 0, "falhas": 0}
+    prontos = []  # [(chave, (registro_id, timestamp, paciente_id, GeminiResponse))] ainda não gravados
+    gravacao = asyncio.Lock()
+    inicio = time.perf_counter()
+
+    async def gravar():
+        async with gravacao:
+            lote, prontos[:] = list(prontos), []
+            if not lote:
+                return
+            try:
+                await storage.atualizar_analises([analise for _, analise in lote])
+            except Exception as e:
+                # Fica fora do checkpoint: a próxima execução refaz estes
+                resumo["falhas"] += len(lote)
+                print(f"Erro ao gravar {len(lote)} análises: {e}")
+                return
+            checkpoint.registrar([chave for chave, _ in lote])
+            resumo["gravados"] += len(lote)
+            print(f"Reanálise: {resumo['gravados']}/{len(candidatos)} gravados ({time.perf_counter() - inicio:.0f}s).")
+
+    async def trabalhador():
+        for lote in lotes:
+            if parar.is_set() or (args.max_pedidos and resumo["pedidos"] >= args.max_pedidos):
+                return
+            resumo["pedidos"] += 1
+            try:
+                respostas = await ai.analisar_em_lote([(chave, area, sentimento, diario)
+                                                       for chave, _, area, sentimento, diario in lote])
+            except Exception as e:
+                resumo["falhas"] += len(lote)
+                print(f"Erro no pedido de reanálise ({len(lote)} diários): {e}")
+                continue
+            resumo["falhas"] += len(lote) - len(respostas)
+            prontos.extend((chave, (*identificacao, respostas[chave]))
+                           for chave, identificacao, *_ in lote if chave in respostas)
+            if len(prontos) >= args.lote_escrita:
+                await gravar()
+
+    await asyncio.gather(*(trabalhador() for _ in range(max(1, args.concorrencia))))
+    await gravar()
+    if parar.is_set():
+        print("Reanálise interrompida; rode de novo para continuar do checkpoint.")
+    print(f"Reanálise concluída: {resumo}")
+    return resumo
+
+async def _rodar(args):
+    from services.ai_service import AIService
+    from services.storage import criar_storage
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sinal, parar.set)
+    # Orçamento próprio: o job não pode tomar a cota dos usuários do app
+    ai = AIService(scheduler=GeminiScheduler(max_concorrencia=args.concorrencia, qps=args.qps, burst=1))
+    if not ai.gemini_model:
+        print("Gemini não configurado (GOOGLE_API_KEY).")
+        return 1
+    storage = await asyncio.to_thread(criar_storage)
+    resumo = await reanalisar(storage, ai, args, parar)
+    return 1 if resumo["falhas"] else 0
+
+def main(argv=None):
+    args = _argumentos(argv)
+    # Diário de escrita próprio: o do app seria reenviado por este processo
+    os.environ["SHEETS_JOURNAL_PATH"] = args.checkpoint + ".journal"
+    os.environ["SHEETS_COMPACTION_INTERVAL"] = "0"  # renumerar linhas é trabalho do app
+    if os.getenv("STORAGE_BACKEND", "sheets").lower() != "sqlite" and not os.getenv("SHARED_CACHE_PATH"):
+        # Só pelo cache compartilhado o job e a compactação do app deixam de se cruzar
+        print("Aviso: sem o SHARED_CACHE_PATH do app, a compactação dele pode renumerar as linhas durante a reanálise.")
+    return asyncio.run(_rodar(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# services/shared_cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""
+Cache compartilhado entre os processos do app no mesmo host (vários workers do app.py).
+Um arquivo SQLite (WAL) guarda:
+1. As abas do Sheets (Usuarios, Checkins, Recados) como o último processo as viu.
+   Só um processo por vez busca no Sheets (quem pega a reserva); os outros leem a
+   cauda daqui, sem gastar cota nem baixar a aba de novo.
+2. As escritas ainda na fila de cada processo, para um check-in ou usuário novo
+   aparecer nos outros workers antes de chegar ao Sheets (e continuar aparecendo
+   até uma busca no Sheets, iniciada depois da gravação, publicar a linha).
+3. Resultados do Gemini (sugestões e perguntas), com expiração, e o último recado
+   visto por cada paciente.
+Cada aba tem uma `versao` (muda a cada alteração, e os processos a comparam a cada
+leitura) e uma `geracao` (muda quando o Sheets é baixado inteiro de novo, ex: linhas
+apagadas), que obriga os outros processos a recarregar daqui. Células alteradas
+(descarte, análise da IA) entram num registro por versão: os outros processos
+trazem só as linhas que mudaram.
+Desligado por padrão: com SHARED_CACHE_PATH vazio, cada processo segue sozinho.
+"""
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+# Quanto tempo um processo pode levar buscando no Sheets antes de outro assumir a vez
+SHARED_CACHE_RESERVA_SECONDS = float(os.getenv("SHARED_CACHE_RESERVA_SECONDS", "30"))
+# Escritas pendentes de um processo que morreu deixam de aparecer depois deste prazo
+SHARED_CACHE_PENDENTES_TTL = float(os.getenv("SHARED_CACHE_PENDENTES_TTL", "600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS abas (
+    aba TEXT PRIMARY KEY, geracao INTEGER NOT NULL, versao INTEGER NOT NULL, headers TEXT,
+    atualizado_em REAL NOT NULL DEFAULT 0,  -- início da última busca no Sheets publicada
+    invalidado_em REAL NOT NULL DEFAULT 0,  -- última gravação no Sheets (a busca tem que ser posterior)
+    reservado_ate REAL NOT NULL DEFAULT 0, recarregar INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS linhas (
+    aba TEXT, linha INTEGER, row TEXT, PRIMARY KEY (aba, linha)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alteracoes (
+    aba TEXT, versao INTEGER, linha INTEGER, PRIMARY KEY (aba, versao, linha)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pendentes (
+    id TEXT PRIMARY KEY, aba TEXT, row TEXT, processo TEXT, criado_em REAL, gravado_em REAL
+);
+CREATE INDEX IF NOT EXISTS idx_pendentes_aba ON pendentes (aba, criado_em);
+CREATE TABLE IF NOT EXISTS valores (
+    espaco TEXT, chave TEXT, valor TEXT, expira_em REAL, PRIMARY KEY (espaco, chave)
+) WITHOUT ROWID;
+"""
+
+class CacheCompartilhado:
+    def __init__(self, caminho: str = SHARED_CACHE_PATH):
+        self.caminho = caminho
+        self.processo = str(os.getpid())
+        self._lock = threading.Lock()
+        # isolation_level=None: as transações são abertas à mão (BEGIN IMMEDIATE nas escritas)
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        print(f"Cache compartilhado em '{caminho}' (processo {self.processo}).")
+
+    def _transacao(self, funcao, escrita=True):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE" if escrita else "BEGIN")
+            try:
+                resultado = funcao(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return resultado
+
+    # --- Abas ---
+    def versao(self, aba):
+        """Versão atual da aba (uma consulta por chave primária; feita a cada leitura)."""
+        with self._lock:
+            registro = self.conn.execute("SELECT versao FROM abas WHERE aba = ?", (aba,)).fetchone()
+        return registro[0] if registro else None
+
+    def ler_aba(self, aba, geracao, versao, desde, max_age):
+        """
+        O que falta para um snapshot local (`geracao`/`versao`, linhas até `desde` - 1) alcançar o
+        compartilhado. Retorna None quando é preciso ir ao Sheets: a aba nunca foi publicada, ou
+        ninguém a buscou há mais de `max_age` segundos e este processo ficou com a reserva. Senão,
+        (geracao, versao, headers, [(linha, row)] novas, recarregou, [(linha, row)] alteradas)
+        numa leitura consistente.
+        """
+        agora = time.time()
+        def reservar(conn):
+            estado = conn.execute("SELECT atualizado_em, invalidado_em, reservado_ate, recarregar FROM abas WHERE aba = ?", (aba,)).fetchone()
+            if estado is None:
+                return True
+            atualizado_em, invalidado_em, reservado_ate, recarregar = estado
+            em_dia = atualizado_em > invalidado_em and agora - atualizado_em <= max_age and not recarregar
+            if em_dia or reservado_ate > agora:
+                return False  # em dia, ou outro processo já está buscando (serve o que há aqui)
+            conn.execute("UPDATE abas SET reservado_ate = ? WHERE aba = ?", (agora + SHARED_CACHE_RESERVA_SECONDS, aba))
+            return True
+        if self._transacao(reservar):
+            return None
+        def ler(conn):
+            estado = conn.execute("SELECT geracao, versao, headers FROM abas WHERE aba = ?", (aba,)).fetchone()
+            g, versao_atual, headers = estado
+            recarregou = g != geracao
+            inicio = 2 if recarregou else desde
+            linhas = conn.execute("SELECT linha, row FROM linhas WHERE aba = ? AND linha >= ? ORDER BY linha", (aba, inicio)).fetchall()
+            alteradas = [] if recarregou else self._alteradas(conn, aba, versao, desde)
+            return (g, versao_atual, json.loads(headers), [(linha, json.loads(row)) for linha, row in linhas],
+                    recarregou, alteradas)
+        return self._transacao(ler, escrita=False)
+
+    def precisa_recarga(self, aba):
+        """Alguém pediu que a próxima busca no Sheets baixe a aba inteira."""
+        with self._lock:
+            registro = self.conn.execute("SELECT recarregar FROM abas WHERE aba = ?", (aba,)).fetchone()
+        return bool(registro and registro[0])
+
+    def publicar_recarga(self, aba, headers, rows, lido_em):
+        """A aba inteira, baixada do Sheets numa busca iniciada em `lido_em`. Retorna (geracao, versao) novas."""
+        def publicar(conn):
+            conn.execute("DELETE FROM linhas WHERE aba = ?", (aba,))
+            conn.execute("DELETE FROM alteracoes WHERE aba = ?", (aba,))
+            conn.executemany("INSERT INTO linhas (aba, linha, row) VALUES (?, ?, ?)",
+                             ((aba, i + 2, json.dumps(list(row), ensure_ascii=False)) for i, row in enumerate(rows)))
+            conn.execute(
+                "INSERT INTO abas (aba, geracao, versao, headers, atualizado_em) VALUES (?, 1, 1, ?, ?) "
+                "ON CONFLICT (aba) DO UPDATE SET geracao = geracao + 1, versao = versao + 1, headers = excluded.headers, "
+                "atualizado_em = excluded.atualizado_em, reservado_ate = 0, recarregar = 0",
+                (aba, json.dumps(list(headers), ensure_ascii=False), lido_em)
+            )
+            self._esquecer_gravados(conn, aba, lido_em)
+            return conn.execute("SELECT geracao, versao FROM abas WHERE aba = ?", (aba,)).fetchone()
+        return self._transacao(publicar)
+
+    def publicar_cauda(self, aba, geracao, versao, novas, lido_em):
+        """
+        Linhas novas [(linha, row)] trazidas do Sheets (busca iniciada em `lido_em`) sobre o snapshot
+        local (`geracao`/`versao`). Retorna (versao, [(linha, row)] alteradas por outros processos
+        desde `versao`), ou None se o compartilhado já está em outra geração (o snapshot local
+        recarrega daqui).
+        """
+        def publicar(conn):
+            estado = conn.execute("SELECT geracao, versao FROM abas WHERE aba = ?", (aba,)).fetchone()
+            if estado is None or estado[0] != geracao:
+                return None
+            primeira = novas[0][0] if novas else float("inf")
+            alteradas = self._alteradas(conn, aba, versao, primeira)
+            conn.executemany("INSERT OR REPLACE INTO linhas (aba, linha, row) VALUES (?, ?, ?)",
+                             ((aba, linha, json.dumps(list(row), ensure_ascii=False)) for linha, row in novas))
+            # Sem linhas novas a versão não muda: os outros processos não têm o que buscar
+            conn.execute("UPDATE abas SET versao = versao + ?, atualizado_em = MAX(atualizado_em, ?), reservado_ate = 0 WHERE aba = ?",
+                         (1 if novas else 0, lido_em, aba))
+            self._esquecer_gravados(conn, aba, lido_em)
+            return self._versao_alcancada(estado[1], versao, 1 if novas else 0), alteradas
+        return self._transacao(publicar)
+
+    def publicar_celulas(self, aba, geracao, versao, celulas):
+        """
+        Células alteradas [(linha, coluna, valor)] sobre o snapshot local (`geracao`/`versao`).
+        Retorna a versão que o snapshot local passa a refletir; se o compartilhado está em outra
+        geração, pede uma recarga do Sheets e retorna None.
+        """
+        def publicar(conn):
+            estado = conn.execute("SELECT geracao, versao FROM abas WHERE aba = ?", (aba,)).fetchone()
+            if estado is None:
+                return None
+            if estado[0] != geracao:
+                # Os nºs das linhas podem ter mudado: quem buscar no Sheets agora baixa tudo
+                conn.execute("UPDATE abas SET versao = versao + 1, recarregar = 1 WHERE aba = ?", (aba,))
+                return None
+            por_linha = {}
+            for linha, coluna, valor in celulas:
+                por_linha.setdefault(linha, []).append((coluna, valor))
+            for linha, alteracoes in por_linha.items():
+                registro = conn.execute("SELECT row FROM linhas WHERE aba = ? AND linha = ?", (aba, linha)).fetchone()
+                if registro is None:
+                    continue
+                row = json.loads(registro[0])
+                for coluna, valor in alteracoes:
+                    row += [""] * (coluna + 1 - len(row))
+                    row[coluna] = valor
+                conn.execute("UPDATE linhas SET row = ? WHERE aba = ? AND linha = ?", (json.dumps(row, ensure_ascii=False), aba, linha))
+            conn.execute("UPDATE abas SET versao = versao + 1 WHERE aba = ?", (aba,))
+            conn.executemany("INSERT OR IGNORE INTO alteracoes (aba, versao, linha) VALUES (?, ?, ?)",
+                             ((aba, estado[1] + 1, linha) for linha in por_linha))
+            return self._versao_alcancada(estado[1], versao, 1)
+        return self._transacao(publicar)
+
+    @staticmethod
+    def _versao_alcancada(atual, local, incremento):
+        # Se outro processo mudou a aba desde a versão local, o snapshot local continua na versão
+        # antiga: a próxima leitura traz o que falta (reaplicar as próprias alterações não muda nada)
+        return atual + incremento if atual == local else local
+
+    @staticmethod
+    def _alteradas(conn, aba, versao, antes_de):
+        """[(linha, row)] com células alteradas depois de `versao`, só entre as linhas anteriores a `antes_de`."""
+        registros = conn.execute(
+            "SELECT linha, row FROM linhas WHERE aba = ? AND linha IN "
+            "(SELECT linha FROM alteracoes WHERE aba = ? AND versao > ? AND linha < ?) ORDER BY linha",
+            (aba, aba, versao or 0, antes_de)
+        ).fetchall()
+        return [(linha, json.loads(row)) for linha, row in registros]
+
+    def invalidar(self, aba):
+        """A próxima leitura, em qualquer processo, busca a cauda no Sheets."""
+        self._transacao(lambda conn: conn.execute(
+            "UPDATE abas SET versao = versao + 1, invalidado_em = ? WHERE aba = ?", (time.time(), aba)))
+
+    # --- Escritas pendentes (fila de cada processo) ---
+    def publicar_pendente(self, entrada):
+        """Uma entrada da fila de escrita ({"id", "aba", "row", "em"}) deste processo."""
+        self._transacao(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO pendentes (id, aba, row, processo, criado_em) VALUES (?, ?, ?, ?, ?)",
+            (entrada["id"], entrada["aba"], json.dumps(entrada["row"], ensure_ascii=False), self.processo,
+             entrada.get("em") or time.time())
+        ))
+
+    def remover_pendente(self, id_escrita):
+        self._transacao(lambda conn: conn.execute("DELETE FROM pendentes WHERE id = ?", (id_escrita,)))
+
+    def concluir_pendentes(self, aba, ids):
+        """
+        Lote gravado no Sheets: a aba fica desatualizada e as linhas continuam na lista (como
+        gravadas) até uma busca posterior publicá-las, para não sumirem no meio do caminho.
+        """
+        agora = time.time()
+        def concluir(conn):
+            conn.executemany("UPDATE pendentes SET gravado_em = ? WHERE id = ?", ((agora, i) for i in ids))
+            conn.execute("UPDATE abas SET versao = versao + 1, invalidado_em = ? WHERE aba = ?", (agora, aba))
+        self._transacao(concluir)
+
+    def pendentes_de_outros(self, aba):
+        """
+        [(criado_em, id, row)], do mais antigo ao mais novo: o que está na fila dos outros processos
+        e o que já foi gravado (por qualquer processo) mas ainda não chegou ao compartilhado.
+        """
+        with self._lock:
+            registros = self.conn.execute(
+                "SELECT criado_em, id, row FROM pendentes WHERE aba = ? AND ("
+                "(gravado_em IS NULL AND processo != ? AND criado_em > ?) OR "
+                "gravado_em >= COALESCE((SELECT atualizado_em FROM abas WHERE aba = ?), 0)"
+                ") ORDER BY criado_em, id",
+                (aba, self.processo, time.time() - SHARED_CACHE_PENDENTES_TTL, aba)
+            ).fetchall()
+        return [(criado_em, id_escrita, json.loads(row)) for criado_em, id_escrita, row in registros]
+
+    @staticmethod
+    def _esquecer_gravados(conn, aba, lido_em):
+        # Gravadas antes do início desta busca: já estão nas linhas publicadas
+        conn.execute("DELETE FROM pendentes WHERE aba = ? AND gravado_em < ?", (aba, lido_em))
+
+    # --- Reservas entre processos ---
+    def reservar(self, nome, segundos):
+        """True se este processo ficou (ou continua) com a reserva `nome` pelos próximos `segundos`."""
+        agora = time.time()
+        def reservar(conn):
+            registro = conn.execute("SELECT valor, expira_em FROM valores WHERE espaco = 'reservas' AND chave = ?",
+                                    (json.dumps(nome),)).fetchone()
+            if registro and registro[1] > agora and json.loads(registro[0]) != self.processo:
+                return False
+            conn.execute("INSERT OR REPLACE INTO valores (espaco, chave, valor, expira_em) VALUES ('reservas', ?, ?, ?)",
+                         (json.dumps(nome), json.dumps(self.processo), agora + segundos))
+            return True
+        return self._transacao(reservar)
+
+    def liberar(self, nome):
+        """Devolve a reserva `nome` antes do prazo, se ela ainda for deste processo."""
+        self._transacao(lambda conn: conn.execute(
+            "DELETE FROM valores WHERE espaco = 'reservas' AND chave = ? AND valor = ?",
+            (json.dumps(nome), json.dumps(self.processo))))
+
+    # --- Valores (resultados do Gemini, recados vistos) ---
+    def obter_valor(self, espaco, chave):
+        """O valor guardado (já decodificado) e quando expira (time.time()), ou (None, None)."""
+        with self._lock:
+            registro = self.conn.execute(
+                "SELECT valor, expira_em FROM valores WHERE espaco = ? AND chave = ? AND expira_em > ?",
+                (espaco, json.dumps(chave, ensure_ascii=False), time.time())
+            ).fetchone()
+        return (json.loads(registro[0]), registro[1]) if registro else (None, None)
+
+    def guardar_valor(self, espaco, chave, valor, expira_em):
+        def guardar(conn):
+            conn.execute("INSERT OR REPLACE INTO valores (espaco, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                         (espaco, json.dumps(chave, ensure_ascii=False), json.dumps(valor, ensure_ascii=False), expira_em))
+            conn.execute("DELETE FROM valores WHERE expira_em <= ?", (time.time(),))
+        self._transacao(guardar)
+
+_instancia = None
+_instancia_lock = threading.Lock()
+
+def cache_compartilhado():
+    """O cache do processo, aberto no primeiro uso; None se SHARED_CACHE_PATH não foi definido."""
+    global _instancia
+    if not SHARED_CACHE_PATH:
+        return None
+    with _instancia_lock:
+        if _instancia is None:
+            _instancia = CacheCompartilhado(SHARED_CACHE_PATH)
+        return _instancia
@@ -0,0 +1,318 @@
+# services/sheet_cache.py
+from gspread.utils import rowcol_to_a1
+from services.metrics import SHEETS_LINHAS_LIDAS, CACHE_COMPARTILHADO_LINHAS
+from services.sheets_async import qualificar_range, medir_gspread
+import asyncio
+import os
+import re
+import threading
+import time
+
+"""
+Cópia local (snapshot) de uma aba do Google Sheets.
+Em vez de baixar a aba inteira a cada leitura, guarda quantas linhas já viu
+e, ao sincronizar, busca apenas a cauda nova (ex: 'A{n+1}:M').
+Só recarrega tudo quando o cabeçalho muda ou linhas foram apagadas.
+Com um CacheCompartilhado (services/shared_cache.py), os processos do mesmo host
+dividem o snapshot: só um busca no Sheets e publica; os outros leem a cauda de lá
+(e as linhas em que alguém alterou células, entregues ao callback `ao_alterar`).
+"""
+
+# Defasagem máxima (em segundos) aceita antes de sincronizar de novo
+CACHE_MAX_AGE_SECONDS = float(os.getenv("SHEETS_CACHE_MAX_AGE", "15"))
+
+class SheetSnapshot:
+    def __init__(self, worksheet, max_age: float = CACHE_MAX_AGE_SECONDS, lock=None, fabrica_linhas=None, compartilhado=None,
+                 ao_alterar=None):
+        self.worksheet = worksheet
+        self.max_age = max_age
+        self.headers = []
+        self.rows = []            # rows[i] corresponde à linha i + 2 da planilha
+        # headers -> contêiner vazio das linhas (ex: ColunasCheckins); padrão: lista de listas
+        self.fabrica_linhas = fabrica_linhas or (lambda headers: [])
+        self.ultima_sync = None   # time.monotonic() da última sincronização
+        # Quem mantém índices derivados do snapshot pode compartilhar o mesmo lock
+        self.lock = lock or threading.RLock()
+        # CacheCompartilhado com os outros processos do host (None = só este processo)
+        self.compartilhado = compartilhado
+        self.geracao_compartilhada = None  # geração/versão do compartilhado que as linhas locais refletem
+        self.versao_compartilhada = None
+        self._direto_do_sheets = False     # forcar_recarga: a próxima sincronização não serve do compartilhado
+        # callback([(nº da linha, row antiga, row nova)]), dentro do lock, quando células de linhas
+        # já carregadas mudam (aqui, por atualizar_celulas, ou em outro processo)
+        self.ao_alterar = ao_alterar
+        self._async_lock = None
+        self._async_lock_loop = None
+
+    @property
+    def carregado(self):
+        return self.ultima_sync is not None
+
+    def invalidar(self):
+        """Força uma sincronização (barata, só da cauda) na próxima leitura."""
+        with self.lock:
+            if self.carregado:
+                self.ultima_sync = 0.0
+        if self.compartilhado is not None:
+            self.compartilhado.invalidar(self.worksheet.title)
+
+    async def invalidar_async(self):
+        """Igual a `invalidar`, com o SQLite do cache compartilhado fora do event loop."""
+        with self.lock:
+            if self.carregado:
+                self.ultima_sync = 0.0
+        if self.compartilhado is not None:
+            await asyncio.to_thread(self.compartilhado.invalidar, self.worksheet.title)
+
+    def precisa_sincronizar(self):
+        if not self.carregado or time.monotonic() - self.ultima_sync > self.max_age:
+            return True
+        # Outro processo publicou algo (linhas novas, célula alterada, lote gravado no Sheets)
+        return self.compartilhado is not None and \
+            self.compartilhado.versao(self.worksheet.title) != self.versao_compartilhada
+
+    async def precisa_sincronizar_async(self):
+        """Igual a `precisa_sincronizar`, com a versão do compartilhado lida fora do event loop."""
+        if not self.carregado or time.monotonic() - self.ultima_sync > self.max_age:
+            return True
+        if self.compartilhado is None:
+            return False
+        # Uma escrita longa de outro processo no SQLite não pode segurar o event loop deste
+        return await asyncio.to_thread(self.compartilhado.versao, self.worksheet.title) != self.versao_compartilhada
+
+    def get(self):
+        """Retorna (headers, rows) da memória, sincronizando se passou do limite de defasagem."""
+        with self.lock:
+            if self.precisa_sincronizar():
+                self.sincronizar()
+            return self.headers, self.rows
+
+    def sincronizar(self, ao_aplicar=None):
+        """
+        Busca cabeçalho, última linha conhecida e cauda numa única chamada (gspread).
+        Retorna (recarregou_tudo, [(nº da linha, row), ...] novas). `ao_aplicar` recebe
+        o mesmo resultado ainda dentro do lock, para atualizar índices derivados.
+        """
+        with self.lock:
+            if self._pode_ler_compartilhado():
+                lido = self.compartilhado.ler_aba(self.worksheet.title, *self._posicao_compartilhada(), self.max_age)
+                if lido is not None:
+                    return self._aplicar_compartilhado(lido, ao_aplicar)
+                self._conferir_recarga_pedida()
+            lido_em = time.time()  # o que foi gravado no Sheets antes disto vem nesta busca
+            resultado = self._sincronizar_sheets(ao_aplicar)
+            self._publicar(*resultado, lido_em)
+            return resultado
+
+    def _sincronizar_sheets(self, ao_aplicar):
+        n, ranges = self._ranges_da_cauda()
+        if ranges:
+            novas = self._aplicar_cauda(n, *medir_gspread("batch_get", self.worksheet.batch_get, ranges))
+            if novas is not None:
+                return self._concluir(False, novas, ao_aplicar)
+        all_data = medir_gspread("get_all_values", self.worksheet.get_all_values)
+        return self._concluir(True, self._aplicar_recarga(all_data), ao_aplicar)
+
+    async def sincronizar_async(self, cliente, ao_aplicar=None):
+        """Igual a `sincronizar`, mas pelo AsyncSheetsClient, sem bloquear o event loop."""
+        async with self._lock_async():
+            # Outra corrotina pode ter sincronizado enquanto esperávamos
+            if not await self.precisa_sincronizar_async():
+                return False, []
+            # O SQLite do cache compartilhado é lido e escrito fora do event loop (e fora do lock)
+            if self._pode_ler_compartilhado():
+                with self.lock:
+                    posicao = self._posicao_compartilhada()
+                lido = await asyncio.to_thread(self.compartilhado.ler_aba, self.worksheet.title, *posicao, self.max_age)
+                if lido is not None:
+                    with self.lock:
+                        return self._aplicar_compartilhado(lido, ao_aplicar)
+                await asyncio.to_thread(self._conferir_recarga_pedida)
+            lido_em = time.time()
+            resultado = await self._sincronizar_sheets_async(cliente, ao_aplicar)
+            if self.compartilhado is not None:
+                await asyncio.to_thread(self._publicar, *resultado, lido_em)
+            return resultado
+
+    async def _sincronizar_sheets_async(self, cliente, ao_aplicar):
+        with self.lock:
+            n, ranges = self._ranges_da_cauda()
+        if ranges:
+            respostas = await cliente.batch_get([qualificar_range(self.worksheet.title, r) for r in ranges])
+            with self.lock:
+                novas = self._aplicar_cauda(n, *respostas)
+                if novas is not None:
+                    return self._concluir(False, novas, ao_aplicar)
+        all_data = (await cliente.batch_get([qualificar_range(self.worksheet.title)]))[0]
+        with self.lock:
+            return self._concluir(True, self._aplicar_recarga(all_data), ao_aplicar)
+
+    async def atualizar_celulas(self, celulas):
+        """
+        Células [(nº da linha, coluna, valor)] já gravadas no Sheets: aplica no snapshot (avisando
+        `ao_alterar`) e publica para os outros processos, que trazem só as linhas alteradas.
+        """
+        async with self._lock_async():
+            with self.lock:
+                por_linha = {}
+                for linha, coluna, valor in celulas:
+                    if 0 <= linha - 2 < len(self.rows):
+                        por_linha.setdefault(linha, list(self.rows[linha - 2]))[coluna] = valor
+                self._aplicar_alteradas(por_linha.items())
+                geracao, versao = self.geracao_compartilhada, self.versao_compartilhada
+            if self.compartilhado is not None and geracao is not None:
+                publicado = await asyncio.to_thread(self.compartilhado.publicar_celulas, self.worksheet.title,
+                                                    geracao, versao, celulas)
+                with self.lock:
+                    if publicado is not None and self.geracao_compartilhada == geracao:
+                        self.versao_compartilhada = publicado
+
+    def forcar_recarga(self):
+        """Depois de apagar linhas na planilha: a próxima sincronização baixa a aba inteira."""
+        with self.lock:
+            self.headers = []
+            self._direto_do_sheets = True
+            if self.carregado:
+                self.ultima_sync = 0.0
+
+    # --- Cache compartilhado entre processos ---
+    def _pode_ler_compartilhado(self):
+        return self.compartilhado is not None and not self._direto_do_sheets
+
+    def _posicao_compartilhada(self):
+        """(geração e versão locais, nº da primeira linha que falta) para o ler_aba."""
+        if not self.headers:
+            return None, None, 2
+        return self.geracao_compartilhada, self.versao_compartilhada, len(self.rows) + 2
+
+    def _conferir_recarga_pedida(self):
+        # Outro processo alterou células sobre uma geração velha: esta busca baixa a aba inteira
+        if self.compartilhado.precisa_recarga(self.worksheet.title):
+            self.forcar_recarga()
+
+    def _aplicar_compartilhado(self, lido, ao_aplicar):
+        geracao, versao, headers, linhas, recarregou, alteradas = lido
+        if not recarregou and linhas and linhas[0][0] != len(self.rows) + 2:
+            # Buraco entre o local e o compartilhado: a próxima leitura recarrega de lá
+            self.geracao_compartilhada = self.versao_compartilhada = None
+            return self._concluir(False, [], ao_aplicar, origem="compartilhado")
+        if recarregou:
+            novas = self._aplicar_recarga([headers] + [row for _, row in linhas])
+        else:
+            self._aplicar_alteradas(alteradas)
+            novas = []
+            for _, row in linhas:
+                row = self._completar(row)
+                self.rows.append(row)
+                novas.append((len(self.rows) + 1, row))
+        self.geracao_compartilhada, self.versao_compartilhada = geracao, versao
+        return self._concluir(recarregou, novas, ao_aplicar, origem="compartilhado")
+
+    def _publicar(self, recarregou, novas, lido_em):
+        """Publica no cache compartilhado o que veio do Sheets numa busca iniciada em `lido_em`."""
+        if self.compartilhado is None:
+            return
+        titulo = self.worksheet.title
+        if recarregou:
+            self.geracao_compartilhada, self.versao_compartilhada = \
+                self.compartilhado.publicar_recarga(titulo, self.headers, [row for _, row in novas], lido_em)
+        else:
+            publicado = self.compartilhado.publicar_cauda(titulo, self.geracao_compartilhada, self.versao_compartilhada,
+                                                          novas, lido_em)
+            if publicado is not None:
+                self.versao_compartilhada, alteradas = publicado
+                with self.lock:
+                    self._aplicar_alteradas(alteradas)
+        self._direto_do_sheets = False
+
+    def _aplicar_alteradas(self, alteradas):
+        """Troca as células que mudaram nas linhas [(nº, row)] já carregadas e avisa `ao_alterar`."""
+        mudancas = []
+        for linha, row in alteradas:
+            i = linha - 2
+            if not 0 <= i < len(self.rows):
+                continue
+            antiga, nova = list(self.rows[i]), self._completar(row)
+            diferentes = [(j, valor) for j, valor in enumerate(nova) if j >= len(antiga) or antiga[j] != valor]
+            if not diferentes:
+                continue
+            for j, valor in diferentes:
+                if hasattr(self.rows, "definir"):
+                    self.rows.definir(i, j, valor)
+                else:
+                    self.rows[i][j] = valor
+            mudancas.append((linha, antiga, self.rows[i]))
+        if mudancas and self.ao_alterar:
+            self.ao_alterar(mudancas)
+
+    # --- Internos ---
+    def _lock_async(self):
+        loop = asyncio.get_running_loop()
+        if self._async_lock_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_lock_loop = loop
+        return self._async_lock
+
+    def _ranges_da_cauda(self):
+        """Retorna (n, ranges) para a sincronização incremental, ou (None, None) se precisa recarregar."""
+        if not self.headers:
+            return None, None
+        n = len(self.rows) + 1  # última linha conhecida na planilha
+        ultima_letra = coluna_letra(len(self.headers))
+        return n, [f"A1:{ultima_letra}1", f"A{n}:{ultima_letra}{n}", f"A{n + 1}:{ultima_letra}"]
+
+    def _aplicar_cauda(self, n, cabecalho, ultima_linha, cauda):
+        """Anexa a cauda e retorna as linhas novas, ou None se for preciso recarregar tudo."""
+        cabecalho = cabecalho[0] if cabecalho else []
+        ultima_linha = ultima_linha[0] if ultima_linha else []
+        ultima_conhecida = self.rows[-1] if self.rows else self.headers
+        if n != len(self.rows) + 1 or \
+           _sem_vazios_finais(cabecalho) != _sem_vazios_finais(self.headers) or \
+           _sem_vazios_finais(ultima_linha) != _sem_vazios_finais(ultima_conhecida):
+            print(f"Snapshot '{self.worksheet.title}': cabeçalho mudou ou linhas foram apagadas. Recarregando tudo.")
+            return None
+        novas = []
+        for row in cauda:
+            row = self._completar(row)
+            self.rows.append(row)
+            novas.append((len(self.rows) + 1, row))
+        if novas:
+            print(f"Snapshot '{self.worksheet.title}': {len(novas)} linhas novas sincronizadas.")
+        return novas
+
+    def _aplicar_recarga(self, all_data):
+        self.headers = list(all_data[0]) if all_data else []
+        self.rows = self.fabrica_linhas(self.headers)
+        novas = []
+        for row in all_data[1:]:
+            row = self._completar(row)
+            self.rows.append(row)
+            novas.append((len(self.rows) + 1, row))
+        print(f"Snapshot '{self.worksheet.title}' carregado: {len(self.rows)} linhas.")
+        return novas
+
+    def _concluir(self, recarregou, novas, ao_aplicar, origem="sheets"):
+        self.ultima_sync = time.monotonic()
+        modo = "recarga" if recarregou else "cauda"
+        if origem == "sheets":
+            SHEETS_LINHAS_LIDAS.inc(len(novas), aba=self.worksheet.title, modo=modo)
+        else:
+            CACHE_COMPARTILHADO_LINHAS.inc(len(novas), aba=self.worksheet.title, modo=modo)
+        if ao_aplicar:
+            ao_aplicar(recarregou, novas)
+        return recarregou, novas
+
+    def _completar(self, row):
+        row = list(row)
+        row += [""] * (len(self.headers) - len(row))
+        return row
+
+def coluna_letra(numero_coluna):
+    """Converte o número da coluna (1 = A) na letra usada em ranges A1."""
+    return re.sub(r"\d", "", rowcol_to_a1(1, numero_coluna))
+
+def _sem_vazios_finais(row):
+    row = [str(v) for v in row]
+    while row and row[-1] == "":
+        row.pop()
+    return row
@@ -0,0 +1,122 @@
+# services/sheets_async.py
+import asyncio
+import os
+import time
+import httpx
+from google.auth.transport.requests import Request
+from services.metrics import SHEETS_CHAMADAS, SHEETS_LATENCIA, SHEETS_BYTES_LIDOS, medir_chamada
+
+"""
+Cliente assíncrono mínimo da API do Google Sheets (v4).
+Usa um único httpx.AsyncClient com pool de conexões keep-alive, para que as
+leituras dos handlers não bloqueiem o event loop do Gradio como o gspread faz.
+Só cobre o que o app usa: values:batchGet, values:batchUpdate e batchUpdate.
+"""
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+SHEETS_HTTP_MAX_CONNECTIONS = int(os.getenv("SHEETS_HTTP_MAX_CONNECTIONS", "20"))
+SHEETS_HTTP_TIMEOUT_SECONDS = float(os.getenv("SHEETS_HTTP_TIMEOUT", "30"))
+
+class AsyncSheetsClient:
+    def __init__(self, creds, spreadsheet_id: str):
+        self.creds = creds
+        self.spreadsheet_id = spreadsheet_id
+        self._http = None
+        self._loop = None
+        self._token_lock = None
+
+    def _cliente_http(self):
+        # O AsyncClient fica preso ao event loop em que foi criado
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                timeout=SHEETS_HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=SHEETS_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=SHEETS_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+            )
+            self._loop = loop
+            self._token_lock = asyncio.Lock()
+        return self._http
+
+    async def _cabecalhos(self):
+        async with self._token_lock:
+            if not self.creds.valid:
+                # O refresh do google-auth é síncrono; roda fora do event loop
+                await asyncio.to_thread(self.creds.refresh, Request())
+        return {"Authorization": f"Bearer {self.creds.token}"}
+
+    async def _requisitar(self, metodo, sufixo, **kwargs):
+        http = self._cliente_http()
+        endpoint = sufixo.lstrip("/:")
+        inicio = time.perf_counter()
+        try:
+            resposta = await http.request(
+                metodo, f"{SHEETS_API_URL}/{self.spreadsheet_id}{sufixo}",
+                headers=await self._cabecalhos(), **kwargs
+            )
+            resposta.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            SHEETS_CHAMADAS.inc(endpoint=endpoint, resultado=str(e.response.status_code))
+            raise
+        except Exception:
+            SHEETS_CHAMADAS.inc(endpoint=endpoint, resultado="erro")
+            raise
+        finally:
+            SHEETS_LATENCIA.observar(time.perf_counter() - inicio, endpoint=endpoint)
+        SHEETS_CHAMADAS.inc(endpoint=endpoint, resultado="ok")
+        SHEETS_BYTES_LIDOS.inc(len(resposta.content), endpoint=endpoint)
+        return resposta.json()
+
+    async def batch_get(self, ranges, major_dimension=None):
+        """Lê vários ranges numa chamada. Retorna uma lista de linhas para cada range."""
+        params = [("ranges", r) for r in ranges]
+        if major_dimension:
+            params.append(("majorDimension", major_dimension))
+        dados = await self._requisitar("GET", "/values:batchGet", params=params)
+        return [value_range.get("values", []) for value_range in dados.get("valueRanges", [])]
+
+    async def batch_update_values(self, data, value_input_option="RAW"):
+        """Escreve vários ranges numa chamada. data: [{"range": "'Aba'!A2:B2", "values": [[...]]}]."""
+        return await self._requisitar(
+            "POST", "/values:batchUpdate",
+            json={"valueInputOption": value_input_option, "data": data}
+        )
+
+    async def batch_update(self, requests):
+        """Alterações estruturais (ex: deleteDimension) numa única chamada."""
+        return await self._requisitar("POST", ":batchUpdate", json={"requests": requests})
+
+    async def apagar_faixas(self, sheet_id: int, faixas):
+        """
+        Apaga as faixas de linhas [(inicio, fim), ...] (numeração da planilha, começando em 1)
+        numa única chamada. Vai de baixo para cima, para uma exclusão não deslocar as seguintes.
+        """
+        return await self.batch_update([{"deleteDimension": {"range": {
+            "sheetId": sheet_id, "dimension": "ROWS",
+            "startIndex": inicio - 1, "endIndex": fim,
+        }}} for inicio, fim in sorted(faixas, reverse=True)])
+
+    async def fechar(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+def medir_gspread(endpoint, chamada, *args, **kwargs):
+    """Chamada síncrona do gspread contabilizada nas mesmas métricas do cliente assíncrono."""
+    endpoint = f"gspread.{endpoint}"
+    try:
+        with medir_chamada(SHEETS_LATENCIA, endpoint=endpoint):
+            resultado = chamada(*args, **kwargs)
+    except Exception:
+        SHEETS_CHAMADAS.inc(endpoint=endpoint, resultado="erro")
+        raise
+    SHEETS_CHAMADAS.inc(endpoint=endpoint, resultado="ok")
+    return resultado
+
+def qualificar_range(titulo_aba: str, a1: str = None):
+    """'Checkins', 'A1:M1' -> "'Checkins'!A1:M1" (sem a1, a aba inteira)."""
+    titulo = "'" + titulo_aba.replace("'", "''") + "'"
+    return f"{titulo}!{a1}" if a1 else titulo
@@ -1,61 +1,334 @@
 # services/sheets_service.py
 import gspread
 from google.oauth2.service_account import Credentials
-from datetime import datetime
 from models.schemas import CheckinFinal, GeminiResponse
+from services.analytics import AnaliseCheckins
+from services.busca import IndiceBusca
+from services.checkin_columns import ColunasCheckins, LinhasSelecionadas
+from services.sheet_cache import SheetSnapshot, coluna_letra
+from services.sheets_async import AsyncSheetsClient, qualificar_range
+from services.shared_cache import cache_compartilhado
+from services.storage_base import StorageBackend, CHECKINS_HEADERS, COLUNAS_ANALISE, RECADOS_HEADERS
+from services.user_directory import UserDirectory
+from services.write_queue import WriteBehindQueue, como_celula
+import asyncio
+import bisect
+import contextlib
 import os
 import json
+import threading
+import time
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive.file"]
 SHEET_ID = "1QhiPEx0z-_vnKgcGhr05ie1KucDjGkPXm4HBb0UKdGw" 
 GOOGLE_SHEETS_CREDS_SECRET_NAME = "GOOGLE_SHEETS_CREDENTIALS"
+# Usuários incluídos direto na planilha aparecem depois de no máximo este intervalo
+USERS_REFRESH_SECONDS = float(os.getenv("USERS_REFRESH_SECONDS", "300"))
+# De quanto em quanto tempo as linhas descartadas (tombstones) são apagadas de fato
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("SHEETS_COMPACTION_INTERVAL", "3600"))
+COMPACTION_FAIXAS_POR_CHAMADA = 100
+# Linhas reescritas por chamada ao values:batchUpdate (reanálise em lote)
+REANALISE_LINHAS_POR_CHAMADA = 200
+# Prazo da reserva entre processos das escritas por nº de linha (renovada a cada lote)
+RESERVA_LINHAS_SECONDS = 60
+RESERVA_LINHAS_NOME = "linhas:Checkins"
+# Último recado visto por paciente, quando não há SHARED_CACHE_PATH (com ele, fica no cache compartilhado)
+RECADOS_VISTOS_PATH = os.getenv("SHEETS_RECADOS_VISTOS_PATH", "recados_vistos.json")
 
-class SheetsService:
-    def __init__(self):
+class SheetsService(StorageBackend):
+    def __init__(self, planilha=None, cliente_async=None):
+        """`planilha`/`cliente_async` substituem a conexão ao Google (ex: benchmarks/fakes.py)."""
         self.checkins_sheet = None
         self.users_sheet = None
         self.recados_sheet = None # <-- NOVO
-        self.psicologas_list = []
-        self.all_users_data = [] 
+        self.diretorio = UserDirectory() # <-- NOVO: busca O(1) por username
+        self.users_cache = None
+        # --- NOVO: Índice paciente_id -> linhas da aba Checkins ---
+        self.checkins_headers = []
+        self.indice_checkins = {}       # paciente_id -> [nº da linha, ...] (ordem crescente)
+        self.linhas_compartilhadas = set()
+        self.indice_compartilhados = {} # paciente_id -> [nº da linha, ...] só dos compartilhados (paginação)
+        self.ultimo_compartilhado = {}  # paciente_id -> nº da linha do último registro compartilhado
+        self.linha_por_registro = {}    # registro_id -> nº da linha (só registros não descartados)
+        self.linhas_descartadas = set() # tombstones ainda não compactados
+        self.indice_recados = {}        # paciente_id -> [nº da linha, ...] da aba Recados (caixa de entrada)
+        self.recados_vistos = None      # paciente_id -> cursor do último recado visto (RECADOS_VISTOS_PATH)
+        self._recados_vistos_lock = threading.Lock()
+        self.analise = None             # AnaliseCheckins, montada na primeira consulta da aba Analytics
+        self.busca = None               # IndiceBusca, montado na primeira busca da psicóloga
+        # --- NOVO: Snapshots locais (sincronizados pela cauda) ---
+        self.checkins_cache = None
+        self.recados_cache = None
+        self.write_queue = None # <-- NOVO: escritas assíncronas em lote
+        self.cliente_async = None # <-- NOVO: leituras sem bloquear o event loop
+        # Um único lock protege os snapshots e os índices derivados deles
+        self._lock = threading.RLock()
+        # Descartes, análises da IA e compactação não podem se cruzar (a compactação muda os nºs
+        # das linhas): lock deste processo mais uma reserva no cache compartilhado (_linhas_reservadas)
+        self._linhas_lock = None
+        self._linhas_lock_loop = None
+        self._tarefa_compactacao = None
         
         try:
-            creds_json_str = os.getenv(GOOGLE_SHEETS_CREDS_SECRET_NAME)
-            if not creds_json_str:
-                raise ValueError(f"Secret '{GOOGLE_SHEETS_CREDS_SECRET_NAME}' não encontrado.")
-            creds_dict = json.loads(creds_json_str)
-            creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-            client = gspread.authorize(creds)
-            
-            spreadsheet = client.open_by_key(SHEET_ID)
+            spreadsheet = planilha
+            if spreadsheet is None:
+                creds_json_str = os.getenv(GOOGLE_SHEETS_CREDS_SECRET_NAME)
+                if not creds_json_str:
+                    raise ValueError(f"Secret '{GOOGLE_SHEETS_CREDS_SECRET_NAME}' não encontrado.")
+                creds_dict = json.loads(creds_json_str)
+                creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+                client = gspread.authorize(creds)
+                
+                spreadsheet = client.open_by_key(SHEET_ID)
+                cliente_async = AsyncSheetsClient(creds, SHEET_ID)
             self.checkins_sheet = spreadsheet.worksheet("Checkins") 
             self.users_sheet = spreadsheet.worksheet("Usuarios")   
             self.recados_sheet = spreadsheet.worksheet("Recados") # <-- NOVO
+            self.cliente_async = cliente_async
             
-            self.all_users_data = self.users_sheet.get_all_values()
-            
-            if len(self.all_users_data) > 1:
-                self.psicologas_list = [row[0] for row in self.all_users_data[1:] if len(row) > 2 and row[2] == "Psicóloga"]
-            
-            print(f"Google Sheet (Checkins, Usuarios, Recados) conectado. {len(self.psicologas_list)} psicólogas carregadas.")
+            self._conectar_snapshots()
+            print(f"Google Sheet (Checkins, Usuarios, Recados) conectado. {len(self.diretorio.psicologas)} psicólogas carregadas.")
             
         except Exception as e:
             print(f"Erro Crítico ao conectar ao Google Sheets: {e}")
 
-    def get_psicologas_list_for_signup(self):
-        # (Sem mudanças)
-        if not self.psicologas_list:
+    def _conectar_snapshots(self):
+        """Cria snapshots e fila de escrita sobre as abas já abertas e faz a carga inicial."""
+        # Com SHARED_CACHE_PATH, os workers do host dividem snapshots e escritas pendentes
+        compartilhado = cache_compartilhado()
+        # Checkins é a aba grande: guardada em colunas compactas em vez de listas de strings
+        self.checkins_cache = SheetSnapshot(self.checkins_sheet, lock=self._lock, fabrica_linhas=ColunasCheckins,
+                                            compartilhado=compartilhado, ao_alterar=self._alterar_checkins)
+        self.users_cache = SheetSnapshot(self.users_sheet, max_age=USERS_REFRESH_SECONDS, lock=self._lock,
+                                         compartilhado=compartilhado)
+        self.recados_cache = SheetSnapshot(self.recados_sheet, lock=self._lock, compartilhado=compartilhado)
+        
+        self.write_queue = WriteBehindQueue(
+            {"Checkins": self.checkins_sheet, "Usuarios": self.users_sheet, "Recados": self.recados_sheet},
+            ao_gravar=self._ao_gravar_lote, compartilhado=compartilhado
+        )
+        
+        # Carga inicial síncrona (ainda não há event loop servindo usuários)
+        self.users_cache.sincronizar(ao_aplicar=self._aplicar_usuarios)
+        self.checkins_cache.sincronizar(ao_aplicar=self._aplicar_checkins)
+        self._garantir_colunas_checkins()
+
+    def _garantir_colunas_checkins(self):
+        """Planilhas antigas não têm as colunas registro_id/descartado: acrescenta no cabeçalho."""
+        headers = self.checkins_cache.headers
+        faltando = [col for col in CHECKINS_HEADERS if col not in headers]
+        if not headers or not faltando:
+            return
+        total = len(headers) + len(faltando)
+        if self.checkins_sheet.col_count < total:
+            self.checkins_sheet.add_cols(total - self.checkins_sheet.col_count)
+        inicio = coluna_letra(len(headers) + 1)
+        self.checkins_sheet.update(values=[faltando], range_name=f"{inicio}1:{coluna_letra(total)}1")
+        print(f"Colunas {faltando} acrescentadas à aba Checkins.")
+        self.checkins_cache.forcar_recarga()
+        self.checkins_cache.sincronizar(ao_aplicar=self._aplicar_checkins)
+
+    # --- NOVO: Sincronização assíncrona dos snapshots ---
+    async def _sincronizar(self, cache, ao_aplicar=None):
+        """Traz o snapshot em dia (se passou do limite de defasagem) sem bloquear o event loop."""
+        self._agendar_compactacao()
+        if await cache.precisa_sincronizar_async():
+            await cache.sincronizar_async(self.cliente_async, ao_aplicar=ao_aplicar)
+
+    # --- NOVO: Diretório de usuários ---
+    async def _sincronizar_usuarios(self):
+        """
+        Snapshot de usuários em dia, mais os que ainda estão na fila: deste processo (ex: criados
+        antes de uma queda, que uma recarga do diretório tiraria) e dos outros workers.
+        """
+        await self._sincronizar(self.users_cache, self._aplicar_usuarios)
+        pendentes = await self.write_queue.pendentes_da_aba_async("Usuarios")
+        with self._lock:
+            for _, row in pendentes:
+                self.diretorio.adicionar(row)
+
+    def _aplicar_usuarios(self, recarregou, novas):
+        """Mantém o diretório em dia com os usuários novos da aba (os da fila entram pelo _sincronizar_usuarios)."""
+        if recarregou:
+            self.diretorio.carregar(self.users_cache.rows)
+        else:
+            for _, row in novas:
+                self.diretorio.adicionar(row)
+
+    # --- NOVO: Caixa de entrada de recados por paciente ---
+    def _aplicar_recados(self, recarregou, novas):
+        """Mantém o índice paciente -> linhas da aba Recados em dia com o snapshot."""
+        if recarregou:
+            self.indice_recados = {}
+        paciente_col = RECADOS_HEADERS.index('paciente_id')
+        for linha, row in novas:
+            if row[paciente_col]:
+                self.indice_recados.setdefault(row[paciente_col], []).append(linha)
+
+    # --- NOVO: Índice de linhas por paciente ---
+    def _aplicar_checkins(self, recarregou, novas):
+        """Mantém o índice em dia com o que o snapshot de Checkins acabou de receber."""
+        if recarregou:
+            self._construir_indice_checkins(novas)
+            self.analise = None  # remontada das colunas na próxima consulta
+            self.busca = None
+        else:
+            for linha, row in novas:
+                self._indexar_row(linha, row)
+                if self.analise is not None:
+                    # Check-ins que já entraram pela fila são ignorados (mesmo registro_id)
+                    self.analise.adicionar_row(self.checkins_headers, row)
+                if self.busca is not None:
+                    self.busca.adicionar_row(self.checkins_headers, row, self._chave_busca(linha, row))
+
+    def _alterar_checkins(self, mudancas):
+        """Células alteradas (descarte, análise da IA), aqui ou em outro worker: índices, análise e busca em dia."""
+        registro_col = self.checkins_headers.index('registro_id') if 'registro_id' in self.checkins_headers else None
+        for linha, antiga, nova in mudancas:
+            registro_id = nova[registro_col] if registro_col is not None else ""
+            if self._descartado(nova):
+                if not self._descartado(antiga):
+                    if registro_id:
+                        self.linha_por_registro.pop(registro_id, None)
+                    self._desindexar_linha(nova[self.checkins_headers.index('paciente_id')], linha)
+                    if self.analise is not None and registro_id:
+                        self.analise.remover(registro_id)
+                    if self.busca is not None:
+                        self.busca.remover(self._chave_busca(linha, nova))
+                continue
+            if self.analise is not None:
+                if not registro_id:
+                    self.analise = None  # linha antiga sem registro_id: remontada na próxima consulta
+                else:
+                    # Temas e sentimento da IA mudaram: sai a versão antiga, entra a nova
+                    self.analise.remover(registro_id)
+                    self.analise.adicionar_row(self.checkins_headers, nova)
+            if self.busca is not None:
+                # Temas e resumo da IA mudaram: o check-in entra de novo com o texto novo
+                chave = self._chave_busca(linha, nova)
+                self.busca.remover(chave)
+                self.busca.adicionar_row(self.checkins_headers, nova, chave)
+
+    def _chave_busca(self, linha, row):
+        """Chave do check-in no índice de busca: o registro_id, ou o nº da linha nas linhas antigas sem ele."""
+        if 'registro_id' in self.checkins_headers:
+            return row[self.checkins_headers.index('registro_id')] or linha
+        return linha
+
+    def _construir_indice_checkins(self, novas):
+        """Monta o índice a partir das linhas que o snapshot acabou de carregar."""
+        self.checkins_headers = self.checkins_cache.headers
+        self.indice_checkins = {}
+        self.linhas_compartilhadas = set()
+        self.indice_compartilhados = {}
+        self.ultimo_compartilhado = {}
+        self.linha_por_registro = {}
+        self.linhas_descartadas = set()
+        if not self.checkins_headers:
+            return
+        # As linhas da carga ainda estão montadas: indexa sem decodificar as colunas de volta
+        for linha, row in novas:
+            self._indexar_row(linha, row)
+        print(f"Índice de check-ins montado: {len(self.checkins_cache.rows)} linhas, {len(self.indice_checkins)} pacientes.")
+
+    def _indexar_row(self, linha, row):
+        paciente_id = row[self.checkins_headers.index('paciente_id')]
+        if self._descartado(row):
+            self.linhas_descartadas.add(linha)
+            return
+        if 'registro_id' in self.checkins_headers and row[self.checkins_headers.index('registro_id')]:
+            self.linha_por_registro[row[self.checkins_headers.index('registro_id')]] = linha
+        if paciente_id:
+            compartilhado = str(row[self.checkins_headers.index('compartilhado')]).upper() == 'TRUE'
+            self._indexar_linha(linha, paciente_id, compartilhado)
+
+    def _indexar_linha(self, linha, paciente_id, compartilhado):
+        linhas = self.indice_checkins.setdefault(paciente_id, [])
+        bisect.insort(linhas, linha)
+        if compartilhado:
+            self.linhas_compartilhadas.add(linha)
+            bisect.insort(self.indice_compartilhados.setdefault(paciente_id, []), linha)
+            if linha > self.ultimo_compartilhado.get(paciente_id, 0):
+                self.ultimo_compartilhado[paciente_id] = linha
+
+    def _desindexar_linha(self, paciente_id, linha):
+        """Tira do índice uma linha descartada (os nºs das demais não mudam)."""
+        linhas = self.indice_checkins.get(paciente_id, [])
+        if linha in linhas:
+            linhas.remove(linha)
+        if not linhas:
+            self.indice_checkins.pop(paciente_id, None)
+        self.linhas_compartilhadas.discard(linha)
+        self.linhas_descartadas.add(linha)
+        compartilhadas = self.indice_compartilhados.get(paciente_id, [])
+        if linha in compartilhadas:
+            compartilhadas.remove(linha)
+        if not compartilhadas:
+            self.indice_compartilhados.pop(paciente_id, None)
+        if self.ultimo_compartilhado.get(paciente_id) == linha:
+            del self.ultimo_compartilhado[paciente_id]
+            for anterior in reversed(linhas):
+                if anterior in self.linhas_compartilhadas:
+                    self.ultimo_compartilhado[paciente_id] = anterior
+                    break
+
+    def _descartado(self, row):
+        if 'descartado' not in self.checkins_headers:
+            return False
+        return str(row[self.checkins_headers.index('descartado')]).upper() == 'TRUE'
+
+    # --- NOVO: Leituras enxergam as escritas que ainda estão na fila ---
+    def _ao_gravar_lote(self, aba):
+        """Chamado pela fila quando um lote chega ao Sheets: a próxima leitura busca a cauda."""
+        cache = {"Checkins": self.checkins_cache, "Recados": self.recados_cache}.get(aba)
+        if cache:
+            cache.invalidar()
+
+    async def _fila_checkins(self):
+        """
+        Check-ins ainda na fila, lidos antes de pegar o lock: a fila tem lock próprio (e, com cache
+        compartilhado, SQLite), que não pode ser esperado com o lock dos snapshots na mão.
+        """
+        return await self.write_queue.pendentes_da_aba_async("Checkins")
+
+    def _ainda_na_fila(self, fila):
+        """(Com o lock) Tira da fila lida antes os check-ins que o snapshot trouxe nesse meio-tempo."""
+        registro_col = CHECKINS_HEADERS.index('registro_id')
+        return [(id_escrita, row) for id_escrita, row in fila if row[registro_col] not in self.linha_por_registro]
+
+    def _checkins_pendentes(self, fila, paciente_id, apenas_compartilhados=False):
+        """Check-ins do paciente ainda na `fila` (mais recentes primeiro), formatados como células."""
+        if not self.checkins_headers:
+            return []
+        id_col = self.checkins_headers.index('paciente_id')
+        share_col = self.checkins_headers.index('compartilhado')
+        pendentes = []
+        for id_escrita, row in reversed(self._ainda_na_fila(fila)):
+            if row[id_col] != paciente_id or (apenas_compartilhados and row[share_col] is not True):
+                continue
+            pendentes.append((id_escrita, [como_celula(v) for v in row]))
+        return pendentes
+
+    def _buscar_linhas_checkins(self, linhas):
+        """Busca as linhas pedidas direto do snapshot em memória."""
+        return [self.checkins_cache.rows[l - 2] for l in linhas]
+
+    async def get_psicologas_list_for_signup(self):
+        if not self.users_sheet:
+            return ["Nenhuma psicóloga encontrada"]
+        await self._sincronizar_usuarios()
+        if not self.diretorio.psicologas:
             return ["Nenhuma psicóloga encontrada"]
-        return self.psicologas_list
+        return list(self.diretorio.psicologas)
 
-    def get_pacientes_da_psicologa(self, psicologa_username: str):
-        # (Sem mudanças)
-        if not self.all_users_data:
+    async def get_pacientes_da_psicologa(self, psicologa_username: str):
+        if not self.users_sheet:
             return ["Nenhum paciente encontrado"]
-        pacientes = []
         try:
-            for row in self.all_users_data[1:]:
-                if len(row) > 3 and row[2] == "Paciente" and row[3] == psicologa_username:
-                    pacientes.append(row[0])
+            await self._sincronizar_usuarios()
+            if not len(self.diretorio):
+                return ["Nenhum paciente encontrado"]
+            pacientes = self.diretorio.pacientes_de(psicologa_username)
             if not pacientes:
                 return ["Nenhum paciente vinculado a você"]
             return pacientes
@@ -63,39 +336,41 @@ class SheetsService:
             print(f"Erro ao buscar pacientes: {e}")
             return [f"Erro ao buscar pacientes: {e}"]
 
-    def check_user(self, username, password):
-        # (Sem mudanças)
-        if not self.all_users_data:
+    async def check_user(self, username, password):
+        if not self.users_sheet:
             return False, None, None
         try:
-            users_list = self.all_users_data[1:] 
-            for row in users_list:
-                if row and len(row) > 3 and row[0] == username and row[1] == password:
-                    role = row[2] 
-                    psicologa_associada = row[3] if role == "Paciente" else None
-                    return True, role, psicologa_associada
+            await self._sincronizar_usuarios()
+            row = self.diretorio.buscar(username)
+            if row and row[1] == password:
+                role = row[2] 
+                psicologa_associada = row[3] if role == "Paciente" else None
+                return True, role, psicologa_associada
             print(f"Login falhou para: {username}")
             return False, None, None
         except Exception as e:
             print(f"Erro ao ler lista de usuários: {e}")
             return False, None, None
 
-    def create_user(self, username, password, psicologa_selecionada):
+    async def create_user(self, username, password, psicologa_selecionada):
         # --- MUDANÇA (Request 1): Texto de sucesso ---
         if not self.users_sheet:
             return False, "Erro: Aba de usuários não conectada."
-        if not username or not password or len(username) < 3 or len(password) < 3:
-            return False, "Usuário e senha devem ter pelo menos 3 caracteres."
-        if not psicologa_selecionada or psicologa_selecionada == "Nenhuma psicóloga encontrada":
-            return False, "Por favor, selecione uma psicóloga da lista."
-        try:
-            users_list = self.all_users_data[1:]
-            for row in users_list:
-                if row and row[0] == username:
-                    return False, "Esse nome de usuário já existe. Tente outro."
+        erro = self._validar_novo_usuario(username, password, psicologa_selecionada)
+        if erro:
+            return False, erro
+        try:
+            await self._sincronizar_usuarios()
             novo_usuario = [username, password, "Paciente", psicologa_selecionada]
-            self.users_sheet.append_row(novo_usuario)
-            self.all_users_data.append(novo_usuario) 
+            with self._lock:
+                # Entra no diretório já aqui: outro cadastro com o mesmo nome, enquanto a fila grava, é recusado
+                if not self.diretorio.adicionar(novo_usuario):
+                    return False, "Esse nome de usuário já existe. Tente outro."
+            try:
+                await self.write_queue.enfileirar_async("Usuarios", novo_usuario)
+            except Exception:
+                self.users_cache.forcar_recarga()  # o diretório volta a refletir a aba (sem este usuário)
+                raise
             print(f"Novo usuário 'Paciente' criado: {username}, vinculado a {psicologa_selecionada}")
             
             # --- MUDANÇA (Request 1) ---
@@ -104,116 +379,517 @@ class SheetsService:
             print(f"Erro ao criar usuário: {e}")
             return False, f"Erro no servidor ao tentar criar usuário: {e}"
 
-    def write_checkin(self, checkin: CheckinFinal, gemini_data: GeminiResponse, paciente_id: str, psicologa_id: str, compartilhado: bool):
-        # (Sem mudanças)
+    async def write_checkin(self, checkin: CheckinFinal, gemini_data: GeminiResponse, paciente_id: str, psicologa_id: str, compartilhado: bool, registro_id: str = None):
         if not self.checkins_sheet:
             raise Exception("Aba de check-ins não conectada.")
         try:
-            agora = datetime.now().isoformat()
-            topicos_str = ", ".join(checkin.topicos_selecionados)
-            temas_gemini_str = ", ".join(gemini_data.temas)
-            nova_linha = [
-                agora, checkin.area, checkin.sentimento, topicos_str,
-                checkin.diario_texto, gemini_data.insight, gemini_data.acao,
-                gemini_data.sentimento_texto, temas_gemini_str,
-                gemini_data.resumo, paciente_id, psicologa_id, compartilhado
-            ]
-            self.checkins_sheet.append_row(nova_linha)
+            registro_id = registro_id or self._novo_registro_id()
+            nova_linha = self._montar_linha_checkin(checkin, gemini_data, paciente_id, psicologa_id, compartilhado, registro_id)
+            # Confirmado assim que estiver no diário local; o envio ao Sheets é feito em lote
+            await self.write_queue.enfileirar_async("Checkins", nova_linha)
+            with self._lock:
+                celulas = [como_celula(v) for v in nova_linha]
+                if self.analise is not None:
+                    self.analise.adicionar_row(CHECKINS_HEADERS, celulas)
+                if self.busca is not None:
+                    self.busca.adicionar_row(CHECKINS_HEADERS, celulas)
             print(f"Dados de '{paciente_id}' (Psic: {psicologa_id}) salvos. Compartilhado: {compartilhado}")
+            return registro_id
         except Exception as e:
             print(f"Erro ao escrever no Google Sheets: {e}")
             raise
 
-    def get_all_checkin_data(self):
-        # (Sem mudanças)
+    async def get_all_checkin_data(self):
+        """
+        Retorna (headers, rows) do snapshot em memória. `rows` é uma visão sobre as colunas:
+        cada linha só é montada (e seus textos decodificados) quando lida.
+        """
         if not self.checkins_sheet: return None, []
         try:
-            all_data = self.checkins_sheet.get_all_values()
-            if not all_data or len(all_data) < 2: return None, []
-            headers = all_data[0]; rows = all_data[1:]
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                headers, tabela = self.checkins_cache.headers, self.checkins_cache.rows
+                indices = range(len(tabela))
+                if self.linhas_descartadas:
+                    indices = [i for i in indices if i + 2 not in self.linhas_descartadas]
+                pendentes = [[como_celula(v) for v in row] for _, row in self._ainda_na_fila(fila)]
+            rows = LinhasSelecionadas(tabela, indices, pendentes)
+            if not headers or not rows: return None, []
             return headers, rows
         except Exception as e:
             print(f"Erro ao ler o histórico: {e}"); return None, []
 
     # --- NOVA FUNÇÃO ---
-    def get_ultimo_diario_paciente(self, paciente_id: str):
+    async def get_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, limite: int = None):
+        """Busca os check-ins de um paciente (mais recentes primeiro) usando o índice de linhas."""
+        if not self.checkins_sheet: return None, []
+        try:
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                if not self.checkins_headers: return None, []
+                linhas = reversed(self.indice_checkins.get(paciente_id, []))
+                if apenas_compartilhados:
+                    linhas = (l for l in linhas if l in self.linhas_compartilhadas)
+                pendentes = [row for _, row in self._checkins_pendentes(fila, paciente_id, apenas_compartilhados)]
+                linhas = list(linhas)
+                if limite:
+                    pendentes = pendentes[:limite]
+                    linhas = linhas[:limite - len(pendentes)]
+                return self.checkins_headers, pendentes + self._buscar_linhas_checkins(linhas)
+        except Exception as e:
+            print(f"Erro ao ler o histórico do paciente: {e}"); return None, []
+
+    # --- NOVO: Paginação por cursor ---
+    async def get_pagina_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, tamanho: int = 20, cursor: str = None):
+        """
+        Uma página do histórico lendo só as linhas dela: o cursor guarda o registro_id e o
+        timestamp da borda da página, que continuam válidos depois de novas linhas e da compactação.
+        """
+        if not self.checkins_sheet: return None, [], None, None
+        try:
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                if not self.checkins_headers: return None, [], None, None
+                indice = self.indice_compartilhados if apenas_compartilhados else self.indice_checkins
+                linhas = indice.get(paciente_id, [])  # crescente; a página é lida de trás para frente
+                pendentes = [row for _, row in self._checkins_pendentes(fila, paciente_id, apenas_compartilhados)]
+                total = len(pendentes) + len(linhas)
+                posicao = self._decodificar_cursor(cursor)
+                inicio = 0
+                if posicao is not None:
+                    borda, achou = self._posicao_no_historico(posicao, pendentes, linhas)
+                    if posicao["d"] == "antes":
+                        inicio = borda + 1
+                    else:
+                        # Termina logo antes do registro do cursor (ou onde ele estaria)
+                        inicio = max(0, (borda if achou else borda + 1) - tamanho)
+                fim = min(total, inicio + tamanho)
+                # Posição j na ordem do histórico: primeiro a fila (mais nova), depois o índice de trás para frente
+                pagina = pendentes[inicio:fim]
+                de_linhas = [linhas[len(linhas) - 1 - (j - len(pendentes))] for j in range(max(inicio, len(pendentes)), fim)]
+                pagina += self._buscar_linhas_checkins(de_linhas)
+                if not pagina:
+                    return self.checkins_headers, [], None, None
+                mais_antigos = self._cursor_da_row("antes", pagina[-1]) if fim < total else None
+                mais_recentes = self._cursor_da_row("depois", pagina[0]) if inicio > 0 else None
+                return self.checkins_headers, pagina, mais_antigos, mais_recentes
+        except Exception as e:
+            print(f"Erro ao ler a página do histórico: {e}"); return None, [], None, None
+
+    def _cursor_da_row(self, direcao, row):
+        registro_col = self.checkins_headers.index('registro_id') if 'registro_id' in self.checkins_headers else None
+        registro_id = row[registro_col] if registro_col is not None else ""
+        return self._codificar_cursor(direcao, ts=row[self.checkins_headers.index('timestamp')], id=registro_id)
+
+    def _posicao_no_historico(self, posicao, pendentes, linhas):
+        """
+        Retorna (j, achou): j é a posição do registro do cursor no histórico (fila + índice,
+        mais recentes primeiro). Se ele sumiu (descartado), j é onde ele estaria, pelo timestamp.
+        """
+        registro_id, ts = posicao.get("id"), posicao.get("ts", "")
+        if registro_id:
+            registro_col = self.checkins_headers.index('registro_id')
+            for j, row in enumerate(pendentes):
+                if row[registro_col] == registro_id:
+                    return j, True
+            linha = self.linha_por_registro.get(registro_id)
+            k = bisect.bisect_left(linhas, linha) if linha is not None else len(linhas)
+            if k < len(linhas) and linhas[k] == linha:
+                return len(pendentes) + len(linhas) - 1 - k, True
+        # As linhas entram na aba em ordem de timestamp: busca binária sem ler o resto
+        ts_col = self.checkins_headers.index('timestamp')
+        tabela = self.checkins_cache.rows
+        k = bisect.bisect_left(linhas, ts, key=lambda l: tabela.celula(l - 2, ts_col))
+        if k < len(linhas) and tabela.celula(linhas[k] - 2, ts_col) == ts and not registro_id:
+            return len(pendentes) + len(linhas) - 1 - k, True  # linha antiga, sem registro_id
+        if k < len(linhas):
+            return len(pendentes) + len(linhas) - 1 - k, False
+        # Mais novo que tudo o que já está na aba: conta os da fila que vieram depois dele
+        return sum(1 for row in pendentes if row[ts_col] > ts) - 1, False
+
+    # --- NOVA FUNÇÃO ---
+    async def get_ultimo_diario_paciente(self, paciente_id: str):
         """Busca o último diário COMPARTILHADO de um paciente."""
         if not self.checkins_sheet: return None, "Erro: Aba de check-ins não conectada."
         try:
-            headers, all_rows = self.get_all_checkin_data()
-            if not headers: return None, "Nenhum dado encontrado."
-            
-            id_col = headers.index('paciente_id')
-            share_col = headers.index('compartilhado')
-            diario_col = headers.index('diario_texto')
-            topicos_col = headers.index('topicos_selecionados')
-
-            # Procura de baixo para cima (mais recentes)
-            for row in reversed(all_rows):
-                if len(row) > id_col and row[id_col] == paciente_id and str(row[share_col]).upper() == 'TRUE':
-                    # Encontrou o último registro compartilhado
-                    topicos = row[topicos_col]
-                    diario = row[diario_col]
-                    # Retorna um diário combinado para a IA
-                    return f"Tópicos: {topicos}\n\nDiário: {diario}", f"Último diário (compartilhado) de {paciente_id} carregado."
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                if not self.checkins_headers: return None, "Nenhum dado encontrado."
+                
+                diario_col = self.checkins_headers.index('diario_texto')
+                topicos_col = self.checkins_headers.index('topicos_selecionados')
+
+                # Um registro compartilhado ainda na fila é o mais recente de todos;
+                # senão, o ponteiro do índice aponta direto para o último compartilhado
+                pendentes = self._checkins_pendentes(fila, paciente_id, apenas_compartilhados=True)
+                linha = self.ultimo_compartilhado.get(paciente_id)
+                if pendentes:
+                    row = pendentes[0][1]
+                else:
+                    row = self._buscar_linhas_checkins([linha])[0] if linha else None
+            if row:
+                topicos = row[topicos_col]
+                diario = row[diario_col]
+                # Retorna um diário combinado para a IA
+                return self._formatar_diario_para_recado(topicos, diario), f"Último diário (compartilhado) de {paciente_id} carregado."
             
             return None, f"Nenhum diário compartilhado encontrado para {paciente_id}."
         except Exception as e:
             print(f"Erro ao buscar último diário: {e}")
             return None, f"Erro ao buscar diário: {e}"
 
+    # --- NOVO: Análise dos check-ins compartilhados (aba Analytics) ---
+    async def get_analise_pacientes(self, pacientes):
+        if not self.checkins_sheet: return []
+        try:
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                if not self.checkins_headers: return []
+                if self.analise is None:
+                    self.analise = self._montar_analise(fila)
+                return self.analise.relatorio(pacientes)
+        except Exception as e:
+            print(f"Erro ao calcular a análise: {e}"); return []
+
+    def _montar_analise(self, fila):
+        """Monta o motor das colunas do snapshot (vetorizado) mais os check-ins ainda na `fila`."""
+        analise = AnaliseCheckins.de_colunas(self.checkins_cache.rows)
+        for _, row in self._ainda_na_fila(fila):
+            analise.adicionar_row(CHECKINS_HEADERS, [como_celula(v) for v in row])
+        print(f"Análise dos check-ins montada: {len(analise)} check-ins compartilhados.")
+        return analise
+
+    # --- NOVO: Busca textual nos check-ins compartilhados (aba Buscar da psicóloga) ---
+    async def buscar_checkins(self, pacientes, consulta: str, inicio: int = 0, limite: int = 20):
+        if not self.checkins_sheet: return None, [], 0
+        try:
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                if not self.checkins_headers: return None, [], 0
+                if self.busca is None:
+                    self.busca = self._montar_busca(fila)
+                achados, total = self.busca.buscar(consulta, pacientes, inicio, limite)
+                # Só as linhas da página são montadas: do snapshot, ou da fila se ainda não chegaram ao Sheets
+                registro_col = CHECKINS_HEADERS.index('registro_id')
+                pendentes = {row[registro_col]: row for _, row in self._ainda_na_fila(fila)}
+                rows = []
+                for chave, _ in achados:
+                    linha = chave if isinstance(chave, int) else self.linha_por_registro.get(chave)
+                    if linha is not None:
+                        rows.append(self.checkins_cache.rows[linha - 2])
+                    elif chave in pendentes:
+                        rows.append([como_celula(v) for v in pendentes[chave]])
+            return self.checkins_headers, rows, total
+        except Exception as e:
+            print(f"Erro na busca: {e}"); return None, [], 0
+
+    def _montar_busca(self, fila):
+        """Monta o índice só das linhas compartilhadas do snapshot (as outras nem são decodificadas) mais as da `fila`."""
+        rows = self.checkins_cache.rows
+        def compartilhadas():
+            for linha in sorted(self.linhas_compartilhadas):
+                row = rows[linha - 2]
+                yield self._chave_busca(linha, row), row
+        busca = IndiceBusca.de_rows(self.checkins_headers, compartilhadas())
+        for _, row in self._ainda_na_fila(fila):
+            busca.adicionar_row(CHECKINS_HEADERS, [como_celula(v) for v in row])
+        print(f"Índice de busca montado: {len(busca)} check-ins compartilhados, {len(busca.termos)} termos.")
+        return busca
+
     # --- NOVA FUNÇÃO ---
-    def send_recado(self, psicologa_id, paciente_id, mensagem):
+    async def send_recado(self, psicologa_id, paciente_id, mensagem):
         """Salva um novo recado na aba 'Recados'."""
         if not self.recados_sheet:
             return False, "Erro: Aba de recados não conectada."
         try:
-            nova_linha = [
-                datetime.now().isoformat(), # timestamp
-                psicologa_id,
-                paciente_id,
-                mensagem
-            ]
-            self.recados_sheet.append_row(nova_linha)
+            nova_linha = self._montar_linha_recado(psicologa_id, paciente_id, mensagem)
+            await self.write_queue.enfileirar_async("Recados", nova_linha)
             print(f"Recado de {psicologa_id} para {paciente_id} salvo.")
             return True, "Recado enviado com sucesso."
         except Exception as e:
             print(f"Erro ao enviar recado: {e}")
             return False, f"Erro ao enviar recado: {e}"
 
-    # --- NOVA FUNÇÃO ---
-    def get_recados_paciente(self, paciente_id: str):
-        """Busca todos os recados para um paciente."""
-        if not self.recados_sheet: return None, []
+    # --- FUNÇÃO ATUALIZADA: lê só as linhas do paciente, pelo índice ---
+    async def get_recados_paciente(self, paciente_id: str):
+        """Busca os últimos 20 recados para um paciente."""
+        headers, recados, _, _ = await self.get_recados_desde(paciente_id, limite=20)
+        return headers, recados
+
+    # --- NOVO: Leitura incremental da caixa de entrada ---
+    async def get_recados_desde(self, paciente_id: str, cursor: str = None, limite: int = 20):
+        if not self.recados_sheet: return None, [], cursor, 0
         try:
-            all_data = self.recados_sheet.get_all_values()
-            if len(all_data) < 2: return None, []
-            
-            headers = all_data[0] # timestamp, psicologa_id, paciente_id, mensagem_texto
-            recados = [row for row in all_data[1:] if len(row) > 2 and row[2] == paciente_id]
-            recados.reverse() # Mais recentes primeiro
-            
-            return headers, recados[:20] # Retorna os últimos 20
+            await self._sincronizar(self.recados_cache, self._aplicar_recados)
+            fila = await self.write_queue.pendentes_da_aba_async("Recados")
+            with self._lock:
+                headers = self.recados_cache.headers
+                if not headers: return None, [], cursor, 0
+                ts_col = RECADOS_HEADERS.index('timestamp')
+                paciente_col = RECADOS_HEADERS.index('paciente_id')
+                linhas = self.indice_recados.get(paciente_id, [])
+                # A fila só tem recados mais novos que os da aba
+                pendentes = [[como_celula(v) for v in row] for _, row in fila if row[paciente_col] == paciente_id]
+                if pendentes and linhas:
+                    # Sem os que o snapshot trouxe enquanto a fila era lida (recados não têm id: vale a linha)
+                    na_aba = {tuple(self.recados_cache.rows[l - 2][:len(RECADOS_HEADERS)]) for l in linhas[-len(pendentes):]}
+                    pendentes = [row for row in pendentes if tuple(row) not in na_aba]
+                posicao = self._decodificar_cursor(cursor)
+                visto = posicao.get("ts", "") if posicao else ""
+                # Recados entram na aba em ordem de timestamp: busca binária pelo último visto
+                k = bisect.bisect_right(linhas, visto, key=lambda l: self.recados_cache.rows[l - 2][ts_col]) if visto else 0
+                pendentes = [row for row in pendentes if row[ts_col] > visto]
+                nao_lidos = len(linhas) - k + len(pendentes)
+                novos = pendentes[::-1][:limite]
+                faltam = max(0, min(limite, nao_lidos) - len(novos))
+                novas_linhas = linhas[len(linhas) - faltam:] if faltam else []
+                novos += [self.recados_cache.rows[l - 2] for l in reversed(novas_linhas)]
+                mais_novo = pendentes[-1] if pendentes else (self.recados_cache.rows[linhas[-1] - 2] if linhas else None)
+            if mais_novo is not None and mais_novo[ts_col] > visto:
+                cursor = self._codificar_cursor("depois", ts=mais_novo[ts_col])
+            return headers, novos, cursor, nao_lidos
         except Exception as e:
             print(f"Erro ao ler recados: {e}")
-            return None, []
-
-    def delete_last_record(self, paciente_id: str):
-        # (Sem mudanças)
-        if not self.checkins_sheet: return False
-        try:
-            all_data = self.checkins_sheet.get_all_values()
-            if len(all_data) < 2: return False
-            id_col_index = 10 
-            for i in range(len(all_data) - 1, 0, -1):
-                if len(all_data[i]) > id_col_index and all_data[i][id_col_index] == paciente_id:
-                    row_to_delete = i + 1
-                    self.checkins_sheet.delete_rows(row_to_delete)
-                    print(f"Registro da linha {row_to_delete} ({paciente_id}) apagado.")
-                    return True
-            return False
+            return None, [], cursor, 0
+
+    # --- NOVO: Último recado visto por paciente (sobrevive ao logout e ao restart) ---
+    async def get_recados_vistos(self, paciente_id: str):
+        try:
+            compartilhado = self.recados_cache.compartilhado if self.recados_cache else None
+            if compartilhado is not None:
+                cursor, _ = await asyncio.to_thread(compartilhado.obter_valor, "recados_vistos", paciente_id)
+                return cursor
+            # O arquivo só é lido uma vez; depois o aviso de não lidos consulta a memória
+            vistos = self.recados_vistos
+            if vistos is None:
+                vistos = await asyncio.to_thread(self._ler_recados_vistos)
+            return vistos.get(paciente_id)
+        except Exception as e:
+            print(f"Erro ao ler os recados vistos: {e}")
+            return None
+
+    async def marcar_recados_vistos(self, paciente_id: str, cursor: str):
+        if not cursor: return
+        try:
+            compartilhado = self.recados_cache.compartilhado if self.recados_cache else None
+            if compartilhado is not None:
+                # Não expira: vale para todos os workers enquanto o cache existir
+                await asyncio.to_thread(compartilhado.guardar_valor, "recados_vistos", paciente_id, cursor, float("inf"))
+            else:
+                await asyncio.to_thread(self._gravar_recados_vistos, paciente_id, cursor)
+        except Exception as e:
+            print(f"Erro ao guardar os recados vistos: {e}")
+
+    def _ler_recados_vistos(self):
+        """Carrega RECADOS_VISTOS_PATH na primeira vez (roda fora do event loop)."""
+        with self._recados_vistos_lock:
+            if self.recados_vistos is None:
+                try:
+                    with open(RECADOS_VISTOS_PATH, encoding="utf-8") as f:
+                        self.recados_vistos = json.load(f)
+                except FileNotFoundError:
+                    self.recados_vistos = {}
+            return self.recados_vistos
+
+    def _gravar_recados_vistos(self, paciente_id, cursor):
+        vistos = self._ler_recados_vistos()
+        with self._recados_vistos_lock:
+            vistos[paciente_id] = cursor
+            # Arquivo novo + rename: um restart no meio da gravação não perde os cursores
+            temporario = RECADOS_VISTOS_PATH + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(vistos, f, ensure_ascii=False)
+            os.replace(temporario, RECADOS_VISTOS_PATH)
+
+    # --- ATUALIZADO: descarte por registro_id (tombstone numa única célula) ---
+    async def discard_checkin(self, paciente_id: str, registro_id: str):
+        if not self.checkins_sheet or not registro_id: return False
+        try:
+            # Se o registro ainda está na fila, basta cancelar o envio
+            if await self._cancelar_na_fila(paciente_id, registro_id):
+                return True
+            # Já está indo para o Sheets (ou já chegou): marca o tombstone na linha
+            async with self._linhas_reservadas():
+                linha = await self._localizar_registro(paciente_id, registro_id)
+                if linha is None:
+                    # O envio pode ter falhado enquanto esperávamos: de volta à fila, dá para cancelar
+                    return await self._cancelar_na_fila(paciente_id, registro_id)
+                descartado_col = self.checkins_headers.index('descartado')
+                celula = f"{coluna_letra(descartado_col + 1)}{linha}"
+                await self.cliente_async.batch_update_values([
+                    {"range": qualificar_range(self.checkins_sheet.title, celula), "values": [[True]]}
+                ])
+                # Índices, análise e busca saem pelo _alterar_checkins
+                await self.checkins_cache.atualizar_celulas([(linha, descartado_col, "TRUE")])
+            print(f"Registro {registro_id} (linha {linha}, {paciente_id}) marcado como descartado.")
+            return True
         except Exception as e:
-            print(f"Erro ao apagar o registro: {e}"); return False
+            print(f"Erro ao descartar o registro: {e}"); return False
+
+    async def _cancelar_na_fila(self, paciente_id, registro_id):
+        """Cancela o envio do registro se ele ainda está na fila deste processo (e não no lote em envio)."""
+        registro_col = CHECKINS_HEADERS.index('registro_id')
+        for id_escrita, row in await self._fila_checkins():
+            if row[registro_col] == registro_id and row[CHECKINS_HEADERS.index('paciente_id')] == paciente_id:
+                if not await self.write_queue.cancelar_async(id_escrita):
+                    return False
+                with self._lock:
+                    if self.analise is not None:
+                        self.analise.remover(registro_id)
+                    if self.busca is not None:
+                        self.busca.remover(registro_id)
+                print(f"Registro pendente {registro_id} ({paciente_id}) descartado antes do envio.")
+                return True
+        return False
+
+    async def _localizar_registro(self, paciente_id, registro_id, tentativas=5):
+        """Nº da linha do registro no snapshot; espera um pouco se ele acabou de sair da fila."""
+        for tentativa in range(tentativas):
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            fila = await self._fila_checkins()
+            with self._lock:
+                linha = self.linha_por_registro.get(registro_id)
+                if linha is not None:
+                    dono = self.checkins_cache.rows.celula(linha - 2, self.checkins_headers.index('paciente_id'))
+                    # Só o dono pode descartar o próprio registro
+                    return linha if dono == paciente_id else None
+            em_envio = any(row[CHECKINS_HEADERS.index('registro_id')] == registro_id for _, row in fila)
+            if not em_envio:
+                return None
+            await asyncio.sleep(0.5 * (tentativa + 1))
+            await self.checkins_cache.invalidar_async()
+        return None
+
+    # --- NOVO: Reanálise em lote (services/reanalise.py) ---
+    async def atualizar_analises(self, analises):
+        if not self.checkins_sheet or not analises: return 0
+        # Check-ins ainda na fila deste processo não estão na aba: ficam para a próxima chamada
+        registro_col = CHECKINS_HEADERS.index('registro_id')
+        na_fila = {row[registro_col] for _, row in await self._fila_checkins()}
+        analises = [analise for analise in analises if not analise[0] or analise[0] not in na_fila]
+        if not analises: return 0
+        atualizadas = 0
+        # Com a reserva das linhas nenhuma compactação (deste ou de outro processo) renumera nada no meio do caminho
+        async with self._linhas_reservadas():
+            for i in range(0, len(analises), REANALISE_LINHAS_POR_CHAMADA):
+                await self._renovar_reserva_linhas()
+                # Sincroniza antes de cada lote: se outro processo apagou linhas, a cauda não
+                # confere e o snapshot é recarregado antes de calcular os nºs das linhas
+                await self.checkins_cache.invalidar_async()
+                await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+                with self._lock:
+                    colunas = [self.checkins_headers.index(c) for c in COLUNAS_ANALISE]
+                    lote = [(self._linha_do_checkin(registro_id, timestamp, paciente_id), self._valores_analise(gemini))
+                            for registro_id, timestamp, paciente_id, gemini in analises[i:i + REANALISE_LINHAS_POR_CHAMADA]]
+                lote = [(linha, valores) for linha, valores in lote if linha is not None]
+                if not lote:
+                    continue
+                inicio, fim = coluna_letra(colunas[0] + 1), coluna_letra(colunas[-1] + 1)
+                await self.cliente_async.batch_update_values([
+                    {"range": qualificar_range(self.checkins_sheet.title, f"{inicio}{linha}:{fim}{linha}"), "values": [valores]}
+                    for linha, valores in lote
+                ])
+                # A análise da aba Analytics é corrigida no lugar pelo _alterar_checkins
+                await self.checkins_cache.atualizar_celulas([(linha, coluna, como_celula(valor))
+                                                             for linha, valores in lote
+                                                             for coluna, valor in zip(colunas, valores)])
+                atualizadas += len(lote)
+        print(f"Análises da IA: {atualizadas} de {len(analises)} check-ins atualizados na aba Checkins.")
+        return atualizadas
+
+    def _linha_do_checkin(self, registro_id, timestamp, paciente_id):
+        """Nº da linha (não descartada) do check-in, pelo registro_id ou por (timestamp, paciente_id)."""
+        if registro_id:
+            return self.linha_por_registro.get(registro_id)
+        ts_col = self.checkins_headers.index('timestamp')
+        for linha in self.indice_checkins.get(paciente_id, []):
+            if self.checkins_cache.rows.celula(linha - 2, ts_col) == timestamp:
+                return linha
+        return None
+
+    # --- NOVO: Compactação periódica dos tombstones ---
+    def _lock_linhas(self):
+        loop = asyncio.get_running_loop()
+        if self._linhas_lock_loop is not loop:
+            self._linhas_lock = asyncio.Lock()
+            self._linhas_lock_loop = loop
+        return self._linhas_lock
+
+    @contextlib.asynccontextmanager
+    async def _linhas_reservadas(self):
+        """
+        Exclusividade sobre os nºs das linhas de Checkins: o lock deste processo e, com cache
+        compartilhado, a reserva RESERVA_LINHAS_NOME, que vale entre os workers e o job de reanálise.
+        Quem escreve por nº de linha sincroniza depois de pegá-la.
+        """
+        async with self._lock_linhas():
+            compartilhado = self.checkins_cache.compartilhado
+            if compartilhado is None:
+                yield
+                return
+            prazo = time.monotonic() + RESERVA_LINHAS_SECONDS
+            while not await asyncio.to_thread(compartilhado.reservar, RESERVA_LINHAS_NOME, RESERVA_LINHAS_SECONDS):
+                if time.monotonic() > prazo:
+                    raise TimeoutError("Outro processo segura as linhas da aba Checkins há muito tempo.")
+                await asyncio.sleep(0.2)
+            try:
+                yield
+            finally:
+                await asyncio.to_thread(compartilhado.liberar, RESERVA_LINHAS_NOME)
+
+    async def _renovar_reserva_linhas(self):
+        """Estende a reserva em trabalhos longos; se ela venceu e outro processo a pegou, para."""
+        compartilhado = self.checkins_cache.compartilhado
+        if compartilhado is not None and not await asyncio.to_thread(
+                compartilhado.reservar, RESERVA_LINHAS_NOME, RESERVA_LINHAS_SECONDS):
+            raise TimeoutError("A reserva das linhas da aba Checkins venceu e outro processo a pegou.")
+
+    def _agendar_compactacao(self):
+        if COMPACTION_INTERVAL_SECONDS <= 0:
+            return
+        if self._tarefa_compactacao is None or self._tarefa_compactacao.done():
+            self._tarefa_compactacao = asyncio.ensure_future(self._loop_compactacao())
+
+    async def _loop_compactacao(self):
+        while True:
+            await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+            try:
+                await self.compactar()
+            except Exception as e:
+                print(f"Erro na compactação da aba Checkins: {e}")
 
-# Cria uma instância única
-sheets_service = SheetsService()
\ No newline at end of file
+    async def compactar(self):
+        """Apaga de fato as linhas descartadas, em lotes de faixas contíguas. Retorna quantas apagou."""
+        compartilhado = self.checkins_cache.compartilhado
+        # Com vários workers, só um renumera as linhas a cada intervalo
+        if compartilhado is not None and not await asyncio.to_thread(
+                compartilhado.reservar, "compactacao", max(COMPACTION_INTERVAL_SECONDS, 60)):
+            return 0
+        async with self._linhas_reservadas():
+            await self.checkins_cache.invalidar_async()
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+            with self._lock:
+                linhas = sorted(self.linhas_descartadas)
+            if not linhas:
+                return 0
+            faixas = []
+            for linha in linhas:
+                if faixas and faixas[-1][1] == linha - 1:
+                    faixas[-1][1] = linha
+                else:
+                    faixas.append([linha, linha])
+            # De baixo para cima: cada lote não desloca as faixas dos lotes seguintes
+            faixas.reverse()
+            for i in range(0, len(faixas), COMPACTION_FAIXAS_POR_CHAMADA):
+                await self._renovar_reserva_linhas()
+                await self.cliente_async.apagar_faixas(self.checkins_sheet.id, faixas[i:i + COMPACTION_FAIXAS_POR_CHAMADA])
+            self.checkins_cache.forcar_recarga()
+            await self._sincronizar(self.checkins_cache, self._aplicar_checkins)
+        print(f"Compactação: {len(linhas)} linhas descartadas apagadas da aba Checkins.")
+        return len(linhas)
@@ -0,0 +1,470 @@
+# services/sqlite_service.py
+import asyncio
+import os
+import sqlite3
+import threading
+from models.schemas import CheckinFinal, GeminiResponse
+from services.analytics import AnaliseCheckins
+from services.busca import IndiceBusca
+from services.storage_base import StorageBackend, CHECKINS_HEADERS, COLUNAS_ANALISE, USUARIOS_HEADERS, RECADOS_HEADERS
+from services.write_queue import como_celula
+
+"""
+Motor de armazenamento local em SQLite, com índices por paciente, psicóloga,
+compartilhamento e data. Permite rodar volumes de produção localmente (e nos
+testes) sem credenciais do Google. Opcionalmente espelha as escritas no Sheets
+para manter o Tableau alimentado.
+"""
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "painel.db")
+SQLITE_MIRROR_SHEETS = os.getenv("SQLITE_MIRROR_SHEETS", "0") == "1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT, area TEXT, sentimento REAL, topicos_selecionados TEXT, diario_texto TEXT,
+    insight_ia TEXT, acao_proposta TEXT, sentimento_texto TEXT, temas_gemini TEXT,
+    resumo_psicologa TEXT, paciente_id TEXT, psicologa_id TEXT, compartilhado INTEGER,
+    registro_id TEXT, descartado INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_checkins_paciente ON checkins (paciente_id, id);
+CREATE INDEX IF NOT EXISTS idx_checkins_compartilhado ON checkins (paciente_id, compartilhado, id);
+CREATE INDEX IF NOT EXISTS idx_checkins_psicologa ON checkins (psicologa_id, compartilhado);
+CREATE INDEX IF NOT EXISTS idx_checkins_timestamp ON checkins (timestamp);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    username TEXT PRIMARY KEY, password TEXT, role TEXT, psicologa_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usuarios_psicologa ON usuarios (psicologa_id, role);
+CREATE INDEX IF NOT EXISTS idx_usuarios_role ON usuarios (role);
+
+CREATE TABLE IF NOT EXISTS recados (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT, psicologa_id TEXT, paciente_id TEXT, mensagem_texto TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_recados_paciente ON recados (paciente_id, id);
+CREATE INDEX IF NOT EXISTS idx_recados_psicologa ON recados (psicologa_id);
+CREATE INDEX IF NOT EXISTS idx_recados_timestamp ON recados (timestamp);
+
+CREATE TABLE IF NOT EXISTS recados_vistos (
+    paciente_id TEXT PRIMARY KEY, cursor TEXT
+);
+"""
+
+# Bancos criados antes das colunas novas recebem um ALTER TABLE na abertura
+MIGRACOES_CHECKINS = {"registro_id": "TEXT", "descartado": "INTEGER DEFAULT 0"}
+INDICES_MIGRADOS = "CREATE INDEX IF NOT EXISTS idx_checkins_registro ON checkins (registro_id);"
+
+CHECKINS_COLUNAS_SQL = ", ".join(CHECKINS_HEADERS)
+RECADOS_COLUNAS_SQL = ", ".join(RECADOS_HEADERS)
+
+class SQLiteService(StorageBackend):
+    def __init__(self, db_path: str = SQLITE_PATH, espelho=None):
+        self.db_path = db_path
+        self.espelho = espelho  # StorageBackend (Sheets) que recebe uma cópia das escritas
+        self._lock = threading.Lock()
+        self.analise = None  # AnaliseCheckins, montada na primeira consulta da aba Analytics
+        self.busca = None    # IndiceBusca, montado na primeira busca da psicóloga
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        colunas = {r[1] for r in self.conn.execute("PRAGMA table_info(checkins)")}
+        for coluna, tipo in MIGRACOES_CHECKINS.items():
+            if coluna not in colunas:
+                self.conn.execute(f"ALTER TABLE checkins ADD COLUMN {coluna} {tipo}")
+        self.conn.executescript(INDICES_MIGRADOS)
+        self.conn.commit()
+        total = self.conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+        print(f"SQLite conectado em '{db_path}' ({total} check-ins). Espelho no Sheets: {'sim' if espelho else 'não'}.")
+
+    def _consultar_sync(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _executar_sync(self, sql, params=()):
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cursor
+
+    # O sqlite3 é bloqueante: as consultas rodam numa thread fora do event loop
+    async def _consultar(self, sql, params=()):
+        return await asyncio.to_thread(self._consultar_sync, sql, params)
+
+    async def _executar(self, sql, params=()):
+        return await asyncio.to_thread(self._executar_sync, sql, params)
+
+    @staticmethod
+    def _como_row_checkin(registro):
+        """Converte o registro do SQLite numa linha igual à do Sheets."""
+        row = [como_celula(v) if v is not None else "" for v in registro]
+        for coluna in ('compartilhado', 'descartado'):
+            i = CHECKINS_HEADERS.index(coluna)
+            row[i] = "TRUE" if registro[i] else "FALSE"
+        return row
+
+    # --- Usuários ---
+    async def get_psicologas_list_for_signup(self):
+        psicologas = [r[0] for r in await self._consultar("SELECT username FROM usuarios WHERE role = 'Psicóloga' ORDER BY rowid")]
+        return psicologas or ["Nenhuma psicóloga encontrada"]
+
+    async def get_pacientes_da_psicologa(self, psicologa_username: str):
+        try:
+            pacientes = [r[0] for r in await self._consultar(
+                "SELECT username FROM usuarios WHERE psicologa_id = ? AND role = 'Paciente' ORDER BY rowid",
+                (psicologa_username,)
+            )]
+            return pacientes or ["Nenhum paciente vinculado a você"]
+        except Exception as e:
+            print(f"Erro ao buscar pacientes: {e}")
+            return [f"Erro ao buscar pacientes: {e}"]
+
+    async def check_user(self, username, password):
+        try:
+            registro = await self._consultar("SELECT password, role, psicologa_id FROM usuarios WHERE username = ?", (username,))
+            if registro and registro[0][0] == password:
+                role = registro[0][1]
+                return True, role, registro[0][2] if role == "Paciente" else None
+            print(f"Login falhou para: {username}")
+            return False, None, None
+        except Exception as e:
+            print(f"Erro ao ler lista de usuários: {e}")
+            return False, None, None
+
+    async def create_user(self, username, password, psicologa_selecionada):
+        erro = self._validar_novo_usuario(username, password, psicologa_selecionada)
+        if erro:
+            return False, erro
+        try:
+            novo_usuario = [username, password, "Paciente", psicologa_selecionada]
+            await self._executar(f"INSERT INTO usuarios ({', '.join(USUARIOS_HEADERS)}) VALUES (?, ?, ?, ?)", novo_usuario)
+        except sqlite3.IntegrityError:
+            return False, "Esse nome de usuário já existe. Tente outro."
+        except Exception as e:
+            print(f"Erro ao criar usuário: {e}")
+            return False, f"Erro no servidor ao tentar criar usuário: {e}"
+        if self.espelho:
+            await self.espelho.write_queue.enfileirar_async("Usuarios", novo_usuario)
+        print(f"Novo usuário 'Paciente' criado: {username}, vinculado a {psicologa_selecionada}")
+        return True, f"Paciente de usuário '{username}' criado com sucesso! Agora você pode fazer o login."
+
+    # --- Check-ins ---
+    async def write_checkin(self, checkin: CheckinFinal, gemini_data: GeminiResponse, paciente_id: str, psicologa_id: str, compartilhado: bool, registro_id: str = None):
+        registro_id = registro_id or self._novo_registro_id()
+        nova_linha = self._montar_linha_checkin(checkin, gemini_data, paciente_id, psicologa_id, compartilhado, registro_id)
+        try:
+            await self._executar(
+                f"INSERT INTO checkins ({CHECKINS_COLUNAS_SQL}) VALUES ({', '.join('?' * len(nova_linha))})",
+                nova_linha
+            )
+            celulas = [como_celula(v) for v in nova_linha]
+            if self.analise is not None:
+                self.analise.adicionar_row(CHECKINS_HEADERS, celulas)
+            if self.busca is not None:
+                self.busca.adicionar_row(CHECKINS_HEADERS, celulas)
+            if self.espelho:
+                # Mesmo registro_id no espelho, para o descarte valer nos dois
+                await self.espelho.write_checkin(checkin, gemini_data, paciente_id, psicologa_id, compartilhado, registro_id)
+            print(f"Dados de '{paciente_id}' (Psic: {psicologa_id}) salvos. Compartilhado: {compartilhado}")
+            return registro_id
+        except Exception as e:
+            print(f"Erro ao escrever no SQLite: {e}")
+            raise
+
+    async def get_all_checkin_data(self):
+        try:
+            rows = [self._como_row_checkin(r) for r in await self._consultar(f"SELECT {CHECKINS_COLUNAS_SQL} FROM checkins ORDER BY id")]
+            if not rows: return None, []
+            return list(CHECKINS_HEADERS), rows
+        except Exception as e:
+            print(f"Erro ao ler o histórico: {e}"); return None, []
+
+    async def get_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, limite: int = None):
+        try:
+            sql = f"SELECT {CHECKINS_COLUNAS_SQL} FROM checkins WHERE paciente_id = ?"
+            if apenas_compartilhados:
+                sql += " AND compartilhado = 1"
+            sql += " ORDER BY id DESC LIMIT ?"
+            registros = await self._consultar(sql, (paciente_id, limite or -1))
+            return list(CHECKINS_HEADERS), [self._como_row_checkin(r) for r in registros]
+        except Exception as e:
+            print(f"Erro ao ler o histórico do paciente: {e}"); return None, []
+
+    async def get_pagina_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, tamanho: int = 20, cursor: str = None):
+        """Paginação por chave (id) sobre o índice (paciente_id, id): custo da página, não do histórico."""
+        try:
+            posicao = self._decodificar_cursor(cursor)
+            if posicao is not None and not isinstance(posicao.get("id"), int):
+                posicao = None  # cursor de outro motor: volta à primeira página
+            filtro = "paciente_id = ?" + (" AND compartilhado = 1" if apenas_compartilhados else "")
+            params = [paciente_id]
+            if posicao is not None and posicao["d"] == "depois":
+                # Os próximos mais novos, do mais antigo para o mais novo; a página é invertida no fim
+                sql = f"SELECT id, {CHECKINS_COLUNAS_SQL} FROM checkins WHERE {filtro} AND id > ? ORDER BY id ASC LIMIT ?"
+                registros = await self._consultar(sql, (*params, posicao["id"], tamanho + 1))
+                tem_mais_novos = len(registros) > tamanho
+                registros = registros[:tamanho][::-1]
+                if not tem_mais_novos and len(registros) < tamanho:
+                    # Chegou ao topo: mostra a primeira página cheia
+                    return await self.get_pagina_checkins_paciente(paciente_id, apenas_compartilhados, tamanho)
+                tem_mais_antigos = True
+            else:
+                sql = f"SELECT id, {CHECKINS_COLUNAS_SQL} FROM checkins WHERE {filtro}"
+                if posicao is not None:
+                    sql += " AND id < ?"
+                    params.append(posicao["id"])
+                sql += " ORDER BY id DESC LIMIT ?"
+                registros = await self._consultar(sql, (*params, tamanho + 1))
+                tem_mais_antigos = len(registros) > tamanho
+                registros = registros[:tamanho]
+                tem_mais_novos = posicao is not None
+            if not registros:
+                return list(CHECKINS_HEADERS), [], None, None
+            mais_antigos = self._codificar_cursor("antes", id=registros[-1][0]) if tem_mais_antigos else None
+            mais_recentes = self._codificar_cursor("depois", id=registros[0][0]) if tem_mais_novos else None
+            return list(CHECKINS_HEADERS), [self._como_row_checkin(r[1:]) for r in registros], mais_antigos, mais_recentes
+        except Exception as e:
+            print(f"Erro ao ler a página do histórico: {e}"); return None, [], None, None
+
+    async def get_ultimo_diario_paciente(self, paciente_id: str):
+        try:
+            registro = await self._consultar(
+                "SELECT topicos_selecionados, diario_texto FROM checkins "
+                "WHERE paciente_id = ? AND compartilhado = 1 ORDER BY id DESC LIMIT 1",
+                (paciente_id,)
+            )
+            if registro:
+                topicos, diario = registro[0]
+                return self._formatar_diario_para_recado(topicos, diario), f"Último diário (compartilhado) de {paciente_id} carregado."
+            return None, f"Nenhum diário compartilhado encontrado para {paciente_id}."
+        except Exception as e:
+            print(f"Erro ao buscar último diário: {e}")
+            return None, f"Erro ao buscar diário: {e}"
+
+    async def discard_checkin(self, paciente_id: str, registro_id: str):
+        # No SQLite apagar pelo índice de registro_id já é barato: não precisa de tombstone
+        try:
+            cursor = await self._executar(
+                "DELETE FROM checkins WHERE registro_id = ? AND paciente_id = ?",
+                (registro_id, paciente_id)
+            )
+            if not cursor.rowcount: return False
+            if self.analise is not None:
+                self.analise.remover(registro_id)
+            if self.busca is not None:
+                self.busca.remover(registro_id)
+            if self.espelho:
+                await self.espelho.discard_checkin(paciente_id, registro_id)
+            print(f"Registro {registro_id} ({paciente_id}) apagado.")
+            return True
+        except Exception as e:
+            print(f"Erro ao apagar o registro: {e}"); return False
+
+    async def atualizar_analises(self, analises):
+        if not analises: return 0
+        try:
+            atribuicoes = ", ".join(f"{coluna} = ?" for coluna in COLUNAS_ANALISE)
+            atualizadas = await asyncio.to_thread(
+                self._atualizar_analises_sync,
+                f"UPDATE checkins SET {atribuicoes} WHERE registro_id = ? AND descartado = 0",
+                f"UPDATE checkins SET {atribuicoes} WHERE timestamp = ? AND paciente_id = ? "
+                "AND (registro_id IS NULL OR registro_id = '') AND descartado = 0",
+                analises
+            )
+            if self.espelho:
+                await self.espelho.atualizar_analises(analises)
+            print(f"Análises da IA: {atualizadas} de {len(analises)} check-ins atualizados.")
+            return atualizadas
+        except Exception as e:
+            print(f"Erro ao atualizar as análises: {e}")
+            raise
+
+    def _atualizar_analises_sync(self, sql_por_registro, sql_por_timestamp, analises):
+        # Uma transação só para o lote inteiro
+        with self._lock:
+            atualizadas = 0
+            for registro_id, timestamp, paciente_id, gemini in analises:
+                valores = self._valores_analise(gemini)
+                if registro_id:
+                    cursor = self.conn.execute(sql_por_registro, (*valores, registro_id))
+                else:
+                    cursor = self.conn.execute(sql_por_timestamp, (*valores, timestamp, paciente_id))
+                atualizadas += cursor.rowcount
+            self.conn.commit()
+            self.analise = None  # temas e sentimentos mudaram: remontada na próxima consulta
+            if self.busca is not None:
+                self._reindexar_busca_sync([registro_id for registro_id, *_ in analises], any(not a[0] for a in analises))
+        return atualizadas
+
+    def _reindexar_busca_sync(self, registros, sem_registro_id):
+        """Temas e resumo mudaram: os check-ins entram de novo na busca com o texto novo (chamado com o lock)."""
+        if sem_registro_id:
+            self.busca = None  # linhas antigas sem registro_id: remontado na próxima busca
+            return
+        for i in range(0, len(registros), 500):
+            lote = registros[i:i + 500]
+            for registro_id in lote:
+                self.busca.remover(registro_id)
+            for r in self.conn.execute(
+                    f"SELECT {CHECKINS_COLUNAS_SQL} FROM checkins WHERE registro_id IN ({', '.join('?' * len(lote))}) "
+                    "AND compartilhado = 1 AND descartado = 0", lote):
+                self.busca.adicionar_row(CHECKINS_HEADERS, self._como_row_checkin(r))
+
+    async def get_analise_pacientes(self, pacientes):
+        try:
+            if self.analise is None:
+                await asyncio.to_thread(self._montar_analise_sync)
+            return self.analise.relatorio(pacientes)
+        except Exception as e:
+            print(f"Erro ao calcular a análise: {e}"); return []
+
+    def _montar_analise_sync(self):
+        # Com o lock, nenhum INSERT fica entre a leitura e a troca (os seguintes entram por write_checkin)
+        with self._lock:
+            if self.analise is not None:
+                return
+            registros = self.conn.execute(
+                f"SELECT {CHECKINS_COLUNAS_SQL} FROM checkins WHERE compartilhado = 1 AND descartado = 0 ORDER BY id"
+            )
+            self.analise = AnaliseCheckins.de_rows(CHECKINS_HEADERS, (self._como_row_checkin(r) for r in registros))
+        print(f"Análise dos check-ins montada: {len(self.analise)} check-ins compartilhados.")
+
+    # --- NOVO: Busca textual nos check-ins compartilhados (aba Buscar da psicóloga) ---
+    async def buscar_checkins(self, pacientes, consulta: str, inicio: int = 0, limite: int = 20):
+        try:
+            if self.busca is None:
+                await asyncio.to_thread(self._montar_busca_sync)
+            # Com o lock: a reindexação da reanálise (numa thread) não mexe no índice no meio da busca
+            with self._lock:
+                if self.busca is None:
+                    return list(CHECKINS_HEADERS), [], 0
+                achados, total = self.busca.buscar(consulta, pacientes, inicio, limite)
+            if not achados:
+                return list(CHECKINS_HEADERS), [], total
+            # Chaves: registro_id, ou o id do SQLite nas linhas antigas sem registro_id
+            por_registro = [chave for chave, _ in achados if isinstance(chave, str)]
+            por_id = [chave for chave, _ in achados if isinstance(chave, int)]
+            registros = {}
+            if por_registro:
+                for r in await self._consultar(
+                        f"SELECT {CHECKINS_COLUNAS_SQL} FROM checkins WHERE registro_id IN ({', '.join('?' * len(por_registro))})",
+                        por_registro):
+                    registros[r[CHECKINS_HEADERS.index('registro_id')]] = r
+            if por_id:
+                for r in await self._consultar(
+                        f"SELECT id, {CHECKINS_COLUNAS_SQL} FROM checkins WHERE id IN ({', '.join('?' * len(por_id))})",
+                        por_id):
+                    registros[r[0]] = r[1:]
+            rows = [self._como_row_checkin(registros[chave]) for chave, _ in achados if chave in registros]
+            return list(CHECKINS_HEADERS), rows, total
+        except Exception as e:
+            print(f"Erro na busca: {e}"); return None, [], 0
+
+    def _montar_busca_sync(self):
+        with self._lock:
+            if self.busca is not None:
+                return
+            registros = self.conn.execute(
+                f"SELECT id, {CHECKINS_COLUNAS_SQL} FROM checkins WHERE compartilhado = 1 AND descartado = 0 ORDER BY id"
+            )
+            registro_col = CHECKINS_HEADERS.index('registro_id')
+            self.busca = IndiceBusca.de_rows(
+                CHECKINS_HEADERS, ((r[1 + registro_col] or r[0], self._como_row_checkin(r[1:])) for r in registros)
+            )
+        print(f"Índice de busca montado: {len(self.busca)} check-ins compartilhados, {len(self.busca.termos)} termos.")
+
+    # --- Recados ---
+    async def send_recado(self, psicologa_id, paciente_id, mensagem):
+        try:
+            nova_linha = self._montar_linha_recado(psicologa_id, paciente_id, mensagem)
+            await self._executar(f"INSERT INTO recados ({RECADOS_COLUNAS_SQL}) VALUES (?, ?, ?, ?)", nova_linha)
+            if self.espelho:
+                await self.espelho.write_queue.enfileirar_async("Recados", nova_linha)
+            print(f"Recado de {psicologa_id} para {paciente_id} salvo.")
+            return True, "Recado enviado com sucesso."
+        except Exception as e:
+            print(f"Erro ao enviar recado: {e}")
+            return False, f"Erro ao enviar recado: {e}"
+
+    async def get_recados_paciente(self, paciente_id: str):
+        try:
+            recados = await self._consultar(
+                f"SELECT {RECADOS_COLUNAS_SQL} FROM recados WHERE paciente_id = ? ORDER BY id DESC LIMIT 20",
+                (paciente_id,)
+            )
+            if not recados: return None, []
+            return list(RECADOS_HEADERS), [list(r) for r in recados]
+        except Exception as e:
+            print(f"Erro ao ler recados: {e}")
+            return None, []
+
+    async def get_recados_desde(self, paciente_id: str, cursor: str = None, limite: int = 20):
+        # Tudo pelo índice (paciente_id, id): contar e ler os novos não passa pelos recados já vistos
+        try:
+            posicao = self._decodificar_cursor(cursor)
+            visto = posicao["id"] if posicao and isinstance(posicao.get("id"), int) else 0
+            nao_lidos, mais_novo = (await self._consultar(
+                "SELECT COUNT(*), MAX(id) FROM recados WHERE paciente_id = ? AND id > ?", (paciente_id, visto)
+            ))[0]
+            recados = []
+            if nao_lidos and limite:
+                recados = await self._consultar(
+                    f"SELECT {RECADOS_COLUNAS_SQL} FROM recados WHERE paciente_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                    (paciente_id, visto, limite)
+                )
+            if mais_novo is not None:
+                cursor = self._codificar_cursor("depois", id=mais_novo)
+            return list(RECADOS_HEADERS), [list(r) for r in recados], cursor, nao_lidos
+        except Exception as e:
+            print(f"Erro ao ler recados: {e}")
+            return None, [], cursor, 0
+
+    # --- NOVO: Último recado visto por paciente ---
+    async def get_recados_vistos(self, paciente_id: str):
+        try:
+            registro = await self._consultar("SELECT cursor FROM recados_vistos WHERE paciente_id = ?", (paciente_id,))
+            return registro[0][0] if registro else None
+        except Exception as e:
+            print(f"Erro ao ler os recados vistos: {e}")
+            return None
+
+    async def marcar_recados_vistos(self, paciente_id: str, cursor: str):
+        if not cursor: return
+        try:
+            await self._executar("INSERT OR REPLACE INTO recados_vistos (paciente_id, cursor) VALUES (?, ?)",
+                                 (paciente_id, cursor))
+        except Exception as e:
+            print(f"Erro ao guardar os recados vistos: {e}")
+
+    # --- Importação ---
+    async def importar_do_sheets(self, sheets_service):
+        """Copia Usuarios, Checkins e Recados do Sheets para o SQLite (substitui o conteúdo local)."""
+        _, checkins = await sheets_service.get_all_checkin_data()
+        _, recados = sheets_service.recados_cache.get()
+        usuarios = sheets_service.diretorio.usuarios()
+        compartilhado_col = CHECKINS_HEADERS.index('compartilhado')
+        descartado_col = CHECKINS_HEADERS.index('descartado')
+        with self._lock:
+            self.conn.execute("DELETE FROM checkins")
+            self.conn.execute("DELETE FROM usuarios")
+            self.conn.execute("DELETE FROM recados")
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO usuarios ({', '.join(USUARIOS_HEADERS)}) VALUES (?, ?, ?, ?)",
+                [(row + [""] * 4)[:4] for row in usuarios if row and row[0]]
+            )
+            self.conn.executemany(
+                f"INSERT INTO checkins ({CHECKINS_COLUNAS_SQL}) VALUES ({', '.join('?' * len(CHECKINS_HEADERS))})",
+                [row[:compartilhado_col] + [1 if str(row[compartilhado_col]).upper() == 'TRUE' else 0]
+                 + row[compartilhado_col + 1:descartado_col] + [0] for row in checkins]
+            )
+            self.conn.executemany(
+                f"INSERT INTO recados ({RECADOS_COLUNAS_SQL}) VALUES (?, ?, ?, ?)",
+                [row[:4] for row in recados]
+            )
+            self.conn.commit()
+        print(f"Importação concluída: {len(usuarios)} usuários, {len(checkins)} check-ins, {len(recados)} recados.")
+
+if __name__ == "__main__":
+    # Uso: python -m services.sqlite_service  (copia a planilha para SQLITE_PATH)
+    from services.sheets_service import SheetsService
+    asyncio.run(SQLiteService().importar_do_sheets(SheetsService()))
@@ -0,0 +1,38 @@
+# services/storage.py
+import os
+from services.storage_base import StorageBackend
+from services.lazy_service import ServicoPreguicoso
+
+"""
+Escolhe o motor de armazenamento pela variável de ambiente STORAGE_BACKEND:
+- "sheets" (padrão): Google Sheets via gspread.
+- "sqlite": banco local indexado (SQLITE_PATH); com SQLITE_MIRROR_SHEETS=1
+  as escritas também são enviadas ao Sheets (para o Tableau).
+O motor é montado em segundo plano (ver services/lazy_service.py); os módulos
+do gspread/SQLite só são importados nessa hora.
+"""
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets").lower()
+
+def criar_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend == "sqlite":
+        from services.sqlite_service import SQLiteService, SQLITE_MIRROR_SHEETS
+        espelho = None
+        if SQLITE_MIRROR_SHEETS:
+            from services.sheets_service import SheetsService
+            espelho = SheetsService()
+            if not espelho.checkins_sheet:
+                print("Espelho no Sheets desativado: planilha não conectada.")
+                espelho = None
+        return SQLiteService(espelho=espelho)
+    if backend != "sheets":
+        print(f"STORAGE_BACKEND '{backend}' desconhecido. Usando Google Sheets.")
+    from services.sheets_service import SheetsService
+    servico = SheetsService()
+    if not servico.checkins_sheet:
+        # Sem planilha não há o que servir; a próxima chamada tenta conectar de novo
+        raise ConnectionError("Google Sheets não conectado.")
+    return servico
+
+# Cria uma instância única (montada em segundo plano; ver iniciar_em_segundo_plano)
+storage_service = ServicoPreguicoso("storage", criar_storage, StorageBackend)
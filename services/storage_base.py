@@ -0,0 +1,178 @@
+# services/storage_base.py
+from abc import ABC, abstractmethod
+from datetime import datetime
+import base64
+import json
+import uuid
+from models.schemas import CheckinFinal, GeminiResponse
+
+"""
+Interface comum dos motores de armazenamento (Google Sheets, SQLite).
+Os handlers do app.py só conversam com esta interface; as linhas são sempre
+devolvidas como listas de strings na ordem dos cabeçalhos abaixo, igual ao Sheets.
+Os métodos de dados são corrotinas, para não bloquear o event loop do Gradio.
+"""
+
+CHECKINS_HEADERS = [
+    'timestamp', 'area', 'sentimento', 'topicos_selecionados', 'diario_texto',
+    'insight_ia', 'acao_proposta', 'sentimento_texto', 'temas_gemini',
+    'resumo_psicologa', 'paciente_id', 'psicologa_id', 'compartilhado',
+    'registro_id', 'descartado'  # identificador estável do check-in e marca de descarte (tombstone)
+]
+# Colunas preenchidas pela análise do Gemini (contíguas na aba); a reanálise em lote reescreve só estas
+COLUNAS_ANALISE = ['insight_ia', 'acao_proposta', 'sentimento_texto', 'temas_gemini', 'resumo_psicologa']
+USUARIOS_HEADERS = ['username', 'password', 'role', 'psicologa_id']
+RECADOS_HEADERS = ['timestamp', 'psicologa_id', 'paciente_id', 'mensagem_texto']
+
+class StorageBackend(ABC):
+
+    # --- Usuários ---
+    @abstractmethod
+    async def get_psicologas_list_for_signup(self): ...
+
+    @abstractmethod
+    async def get_pacientes_da_psicologa(self, psicologa_username: str): ...
+
+    @abstractmethod
+    async def check_user(self, username, password):
+        """Retorna (login_valido, role, psicologa_associada)."""
+
+    @abstractmethod
+    async def create_user(self, username, password, psicologa_selecionada):
+        """Retorna (sucesso, mensagem)."""
+
+    # --- Check-ins ---
+    @abstractmethod
+    async def write_checkin(self, checkin: CheckinFinal, gemini_data: GeminiResponse, paciente_id: str, psicologa_id: str, compartilhado: bool, registro_id: str = None):
+        """Retorna o registro_id do check-in (gera um novo se não vier)."""
+
+    @abstractmethod
+    async def get_all_checkin_data(self):
+        """Retorna (headers, rows) de todos os check-ins, ou (None, [])."""
+
+    @abstractmethod
+    async def get_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, limite: int = None):
+        """Retorna (headers, rows) do paciente, mais recentes primeiro."""
+
+    @abstractmethod
+    async def get_pagina_checkins_paciente(self, paciente_id: str, apenas_compartilhados: bool = False, tamanho: int = 20, cursor: str = None):
+        """
+        Uma página do histórico, mais recentes primeiro. Sem cursor, a primeira página.
+        Retorna (headers, rows, cursor_mais_antigos, cursor_mais_recentes); um cursor
+        None indica que não há página naquela direção.
+        """
+
+    @abstractmethod
+    async def get_ultimo_diario_paciente(self, paciente_id: str):
+        """Retorna (diario_combinado | None, mensagem)."""
+
+    @abstractmethod
+    async def discard_checkin(self, paciente_id: str, registro_id: str):
+        """Descarta o check-in `registro_id` do paciente. Retorna True se o encontrou."""
+
+    @abstractmethod
+    async def atualizar_analises(self, analises):
+        """
+        Reescreve as colunas da IA (COLUNAS_ANALISE) de check-ins já salvos.
+        `analises`: [(registro_id, timestamp, paciente_id, GeminiResponse)]; check-ins antigos,
+        sem registro_id, são achados pelo par (timestamp, paciente_id). Retorna quantos atualizou.
+        """
+
+    @abstractmethod
+    async def get_analise_pacientes(self, pacientes):
+        """
+        Retorna um relatório (ver AnaliseCheckins.relatorio) por paciente, só com os
+        check-ins compartilhados, ou [] se não conseguir ler.
+        """
+
+    @abstractmethod
+    async def buscar_checkins(self, pacientes, consulta: str, inicio: int = 0, limite: int = 20):
+        """
+        Busca textual (diário, tópicos, temas e resumo da IA) nos check-ins compartilhados
+        dos `pacientes`, do mais relevante para o menos (ver services/busca.py).
+        Retorna (headers, rows da página que começa em `inicio`, total de resultados).
+        """
+
+    # --- Recados ---
+    @abstractmethod
+    async def send_recado(self, psicologa_id, paciente_id, mensagem):
+        """Retorna (sucesso, mensagem)."""
+
+    @abstractmethod
+    async def get_recados_paciente(self, paciente_id: str):
+        """Retorna (headers, recados) com os últimos 20, mais recentes primeiro."""
+
+    @abstractmethod
+    async def get_recados_desde(self, paciente_id: str, cursor: str = None, limite: int = 20):
+        """
+        Recados chegados depois do `cursor` (sem cursor, desde o início), mais recentes primeiro.
+        Retorna (headers, até `limite` recados, cursor do mais novo, total de não lidos);
+        com limite=0 serve só para contar.
+        """
+
+    @abstractmethod
+    async def get_recados_vistos(self, paciente_id: str):
+        """Cursor do último recado que o paciente viu (em qualquer sessão), ou None se nunca abriu a caixa."""
+
+    @abstractmethod
+    async def marcar_recados_vistos(self, paciente_id: str, cursor: str):
+        """Guarda o cursor do get_recados_desde como o último recado visto pelo paciente."""
+
+    # --- Auxiliares comuns aos motores ---
+    @staticmethod
+    def _validar_novo_usuario(username, password, psicologa_selecionada):
+        """Retorna a mensagem de erro, ou None se os dados forem válidos."""
+        if not username or not password or len(username) < 3 or len(password) < 3:
+            return "Usuário e senha devem ter pelo menos 3 caracteres."
+        if not psicologa_selecionada or psicologa_selecionada == "Nenhuma psicóloga encontrada":
+            return "Por favor, selecione uma psicóloga da lista."
+        return None
+
+    @staticmethod
+    def _novo_registro_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _codificar_cursor(direcao, **posicao):
+        """Cursor opaco para a UI; cada motor decide o que guarda em `posicao`."""
+        bruto = json.dumps({"d": direcao, **posicao}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        """Retorna o dict do cursor, ou None se vier vazio ou corrompido (volta à primeira página)."""
+        if not cursor:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except ValueError:
+            print(f"Cursor de paginação inválido: {cursor!r}")
+            return None
+        return cursor if isinstance(cursor, dict) and cursor.get("d") in ("antes", "depois") else None
+
+    @staticmethod
+    def _montar_linha_checkin(checkin: CheckinFinal, gemini_data: GeminiResponse, paciente_id, psicologa_id, compartilhado, registro_id):
+        """Monta a linha na ordem de CHECKINS_HEADERS."""
+        return [
+            datetime.now().isoformat(), checkin.area, checkin.sentimento,
+            ", ".join(checkin.topicos_selecionados), checkin.diario_texto,
+            *StorageBackend._valores_analise(gemini_data),
+            paciente_id, psicologa_id, compartilhado,
+            registro_id, False
+        ]
+
+    @staticmethod
+    def _valores_analise(gemini_data: GeminiResponse):
+        """As células da análise, na ordem de COLUNAS_ANALISE."""
+        return [gemini_data.insight, gemini_data.acao, gemini_data.sentimento_texto,
+                ", ".join(gemini_data.temas), gemini_data.resumo]
+
+    @staticmethod
+    def _montar_linha_recado(psicologa_id, paciente_id, mensagem):
+        """Monta a linha na ordem de RECADOS_HEADERS."""
+        return [datetime.now().isoformat(), psicologa_id, paciente_id, mensagem]
+
+    @staticmethod
+    def _formatar_diario_para_recado(topicos, diario):
+        """Diário combinado que é enviado à IA para sugerir um recado."""
+        return f"Tópicos: {topicos}\n\nDiário: {diario}"
@@ -0,0 +1,141 @@
+# services/suggestion_cache.py
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+"""
+Cache das sugestões de Nível 1 (gatilhos prováveis).
+O espaço de entrada é pequeno (12 áreas x 5 notas), então guardamos alguns
+conjuntos de sugestões por (area, sentimento) e alternamos entre eles a cada
+leitura, para o paciente não ver sempre a mesma lista. Cada conjunto expira por TTL.
+As perguntas de Nível 2 ficam num LRU à parte, por tópico normalizado.
+Com um CacheCompartilhado (services/shared_cache.py), o que um processo gerou
+serve aos outros workers do host, que não precisam chamar o Gemini de novo. O
+SQLite dele só é usado numa thread (trazer_compartilhado, guardar): as leituras
+do rodízio ficam só na memória.
+"""
+
+SUGGESTIONS_CACHE_TTL_SECONDS = float(os.getenv("SUGGESTIONS_CACHE_TTL", "21600"))
+SUGGESTIONS_SETS_POR_CHAVE = int(os.getenv("SUGGESTIONS_SETS_POR_CHAVE", "3"))
+DRILLDOWN_CACHE_MAX_TOPICOS = int(os.getenv("DRILLDOWN_CACHE_MAX_TOPICOS", "2000"))
+
+class SuggestionCache:
+    def __init__(self, ttl: float = SUGGESTIONS_CACHE_TTL_SECONDS, sets_por_chave: int = SUGGESTIONS_SETS_POR_CHAVE,
+                 compartilhado=None):
+        self.ttl = ttl
+        self.sets_por_chave = max(1, sets_por_chave)
+        self.compartilhado = compartilhado  # CacheCompartilhado, ou None
+        self._conjuntos = {}  # chave -> [(expira_em, [sugestões]), ...], do mais antigo ao mais novo
+        self._rodizio = {}    # chave -> quantas leituras já foram servidas
+
+    @staticmethod
+    def chave(area, sentimento):
+        """O slider anda de 1 em 1, mas o valor chega como float."""
+        return area, int(round(float(sentimento)))
+
+    async def trazer_compartilhado(self, chave):
+        """Sem conjunto vigente na memória, traz os que outro processo guardou (antes de obter/faltam)."""
+        if self.compartilhado is None or self._vigentes(chave):
+            return
+        guardados, _ = await asyncio.to_thread(self.compartilhado.obter_valor, "sugestoes", list(chave))
+        # No compartilhado o prazo é em time.time(): o monotonic de cada processo é outro
+        agora = time.monotonic()
+        desvio = time.time() - agora
+        conjuntos = [(expira_em - desvio, sugestoes) for expira_em, sugestoes in guardados or []
+                     if expira_em - desvio > agora]
+        if conjuntos and not self._vigentes(chave):
+            self._conjuntos[chave] = conjuntos
+
+    def obter(self, chave):
+        """Retorna o próximo conjunto do rodízio, ou None se não houver nenhum válido."""
+        conjuntos = self._vigentes(chave)
+        if not conjuntos:
+            return None
+        vez = self._rodizio.get(chave, 0)
+        self._rodizio[chave] = vez + 1
+        return list(conjuntos[vez % len(conjuntos)][1])
+
+    async def guardar(self, chave, sugestoes):
+        conjuntos = self._vigentes(chave)
+        conjuntos.append((time.monotonic() + self.ttl, list(sugestoes)))
+        # Mantém só os mais novos; os antigos saem primeiro
+        del conjuntos[:-self.sets_por_chave]
+        self._conjuntos[chave] = conjuntos
+        if self.compartilhado is not None:
+            desvio = time.time() - time.monotonic()
+            await asyncio.to_thread(self.compartilhado.guardar_valor, "sugestoes", list(chave),
+                                    [[expira_em + desvio, sugestoes] for expira_em, sugestoes in conjuntos],
+                                    conjuntos[-1][0] + desvio)
+
+    def faltam(self, chave):
+        """Quantos conjuntos ainda cabem na chave (0 = cheia)."""
+        return self.sets_por_chave - len(self._vigentes(chave))
+
+    def __len__(self):
+        return sum(len(self._vigentes(chave)) for chave in list(self._conjuntos))
+
+    def _vigentes(self, chave):
+        agora = time.monotonic()
+        conjuntos = [c for c in self._conjuntos.get(chave, []) if c[0] > agora]
+        if conjuntos:
+            self._conjuntos[chave] = conjuntos
+        else:
+            self._conjuntos.pop(chave, None)
+        return conjuntos
+
+def normalizar_topico(topico: str):
+    """'  Briga no Trabalho! ' e 'briga no trabalho' viram a mesma chave."""
+    sem_acento = unicodedata.normalize("NFKD", str(topico))
+    sem_acento = "".join(c for c in sem_acento if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", sem_acento.lower()).split())
+
+class DrilldownCache:
+    """LRU das perguntas-chave (Nível 2) por tópico normalizado, compartilhado entre usuários."""
+    def __init__(self, max_topicos: int = DRILLDOWN_CACHE_MAX_TOPICOS, compartilhado=None,
+                 ttl_compartilhado: float = SUGGESTIONS_CACHE_TTL_SECONDS):
+        self.max_topicos = max(1, max_topicos)
+        self.compartilhado = compartilhado  # CacheCompartilhado, ou None
+        self.ttl_compartilhado = ttl_compartilhado  # no compartilhado não há LRU: as perguntas expiram
+        self._perguntas = OrderedDict()
+
+    async def trazer_compartilhado(self, topico):
+        """Fora da memória, traz as perguntas que outro processo guardou. Retorna se o tópico ficou no cache."""
+        chave = normalizar_topico(topico)
+        if chave in self._perguntas:
+            return True
+        if self.compartilhado is None:
+            return False
+        perguntas, _ = await asyncio.to_thread(self.compartilhado.obter_valor, "perguntas", chave)
+        if perguntas is not None and chave not in self._perguntas:
+            self._guardar_local(chave, perguntas)
+        return chave in self._perguntas
+
+    def obter(self, topico):
+        chave = normalizar_topico(topico)
+        perguntas = self._perguntas.get(chave)
+        if perguntas is None:
+            return None
+        self._perguntas.move_to_end(chave)
+        return list(perguntas)
+
+    async def guardar(self, topico, perguntas):
+        chave = normalizar_topico(topico)
+        self._guardar_local(chave, perguntas)
+        if self.compartilhado is not None:
+            await asyncio.to_thread(self.compartilhado.guardar_valor, "perguntas", chave, list(perguntas),
+                                    time.time() + self.ttl_compartilhado)
+
+    def __contains__(self, topico):
+        return normalizar_topico(topico) in self._perguntas
+
+    def _guardar_local(self, chave, perguntas):
+        self._perguntas[chave] = list(perguntas)
+        self._perguntas.move_to_end(chave)
+        while len(self._perguntas) > self.max_topicos:
+            self._perguntas.popitem(last=False)
+
+    def __len__(self):
+        return len(self._perguntas)
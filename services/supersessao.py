@@ -0,0 +1,62 @@
+# services/supersessao.py
+import asyncio
+import os
+from services.metrics import PEDIDOS_SUPERADOS
+
+"""
+Pedidos que ficam velhos quando chega um mais novo da mesma sessão.
+Arrastar o slider de 1 a 5 (ou soltar e clicar em "Atualizar Sugestões") dispara
+vários pedidos de sugestões; só o último interessa. Aqui cada sessão tem no
+máximo um pedido vivo: o novo cancela a tarefa do anterior (e, com ela, a chamada
+ao Gemini, se ninguém mais espera por ela no scheduler).
+- Debounce: se havia um pedido vivo, o novo espera uma janela curta antes de
+  chamar o Gemini; se outro chegar nessa janela, este nem chega a chamar.
+- O primeiro pedido de uma rajada não espera (um acerto no cache sai na hora).
+"""
+
+SUGESTOES_DEBOUNCE_SECONDS = float(os.getenv("SUGESTOES_DEBOUNCE_SECONDS", "0.3"))
+
+class PedidoSuperado(Exception):
+    """Um pedido mais novo da mesma sessão tomou o lugar deste."""
+
+class UltimoPedidoPorSessao:
+    def __init__(self, nome: str, debounce: float = SUGESTOES_DEBOUNCE_SECONDS):
+        self.nome = nome
+        self.debounce = debounce
+        self._atuais = {}  # sessao -> Task do pedido vivo
+
+    async def executar(self, sessao, executar):
+        """
+        Roda `executar()` (corrotina sem argumentos) como o pedido vivo da sessão.
+        Levanta PedidoSuperado se um pedido mais novo da sessão chegar antes do fim.
+        Sem sessão (chamada fora do Gradio), só roda.
+        """
+        if sessao is None:
+            return await executar()
+        anterior = self._atuais.get(sessao)
+        espera = 0.0
+        if anterior is not None and not anterior.done():
+            anterior.cancel()
+            espera = self.debounce
+        tarefa = asyncio.ensure_future(self._rodar(espera, executar))
+        self._atuais[sessao] = tarefa
+        try:
+            return await tarefa
+        except asyncio.CancelledError:
+            if tarefa.cancelled() and self._atuais.get(sessao) is not tarefa:
+                PEDIDOS_SUPERADOS.inc(pedido=self.nome)
+                raise PedidoSuperado() from None
+            # O próprio handler foi cancelado (ex: o Gradio cancelou o evento)
+            tarefa.cancel()
+            raise
+        finally:
+            if self._atuais.get(sessao) is tarefa:
+                del self._atuais[sessao]
+
+    def __len__(self):
+        return len(self._atuais)
+
+    async def _rodar(self, espera, executar):
+        if espera > 0:
+            await asyncio.sleep(espera)
+        return await executar()
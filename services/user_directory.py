@@ -0,0 +1,47 @@
+# services/user_directory.py
+
+"""
+Diretório de usuários em memória.
+Troca as varreduras lineares da aba 'Usuarios' por buscas O(1) por username e
+por um índice reverso psicóloga -> pacientes. É montado uma vez a partir das
+linhas da aba e atualizado no lugar a cada novo usuário.
+"""
+
+class UserDirectory:
+    def __init__(self):
+        self.por_username = {}             # username -> [username, password, role, psicologa_id]
+        self.pacientes_por_psicologa = {}  # psicologa_id -> [username, ...] (ordem da planilha)
+        self.psicologas = []
+
+    def carregar(self, rows):
+        """Reconstrói o diretório a partir das linhas da aba (sem o cabeçalho)."""
+        self.por_username = {}
+        self.pacientes_por_psicologa = {}
+        self.psicologas = []
+        for row in rows:
+            self.adicionar(row)
+
+    def adicionar(self, row):
+        """Inclui um usuário. Se o username já existe, mantém o primeiro (como a busca linear fazia)."""
+        row = list(row) + [""] * (4 - len(row))
+        username, _, role, psicologa_id = row[:4]
+        if not username or username in self.por_username:
+            return False
+        self.por_username[username] = row
+        if role == "Psicóloga":
+            self.psicologas.append(username)
+        elif role == "Paciente":
+            self.pacientes_por_psicologa.setdefault(psicologa_id, []).append(username)
+        return True
+
+    def buscar(self, username):
+        return self.por_username.get(username)
+
+    def pacientes_de(self, psicologa_id):
+        return list(self.pacientes_por_psicologa.get(psicologa_id, []))
+
+    def usuarios(self):
+        return list(self.por_username.values())
+
+    def __len__(self):
+        return len(self.por_username)
@@ -0,0 +1,209 @@
+# services/write_queue.py
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from services.metrics import SHEETS_LINHAS_GRAVADAS
+from services.sheets_async import medir_gspread
+
+"""
+Fila de escrita "write-behind" para o Google Sheets.
+1. Cada escrita é gravada primeiro num diário local (append-only, com fsync) e
+   já é considerada confirmada para o usuário.
+2. Uma thread em segundo plano junta as linhas pendentes e envia em lotes com
+   `append_rows`, com novas tentativas e backoff exponencial.
+3. Ao reiniciar, o diário é relido e o que não foi confirmado volta para a fila.
+A entrega é "pelo menos uma vez": se o app cair entre o envio e o registro do
+'ack' no diário, o lote é reenviado no próximo início.
+Com um CacheCompartilhado, as escritas pendentes também ficam visíveis para os
+outros processos do host (cada processo continua com o seu próprio diário).
+O lock da fila é segurado durante o fsync do diário e as transações no SQLite do
+cache (que podem esperar a de outro processo): no event loop, use as versões
+*_async, que rodam numa thread.
+"""
+
+JOURNAL_PATH = os.getenv("SHEETS_JOURNAL_PATH", "sheets_journal.jsonl")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("SHEETS_FLUSH_INTERVAL", "2"))
+MAX_LINHAS_POR_LOTE = 500
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+class WriteBehindQueue:
+    def __init__(self, worksheets: dict, journal_path: str = JOURNAL_PATH,
+                 intervalo: float = FLUSH_INTERVAL_SECONDS, ao_gravar=None, compartilhado=None):
+        self.worksheets = worksheets   # nome da aba -> gspread.Worksheet
+        self.journal_path = journal_path
+        self.intervalo = intervalo
+        self.ao_gravar = ao_gravar     # callback(nome_da_aba) após um lote gravado
+        self.compartilhado = compartilhado  # CacheCompartilhado (outros processos do host), ou None
+        self.pendentes = []            # [{"op": "add", "id", "aba", "row"}] em ordem de chegada
+        self.enviando = set()          # ids do lote que está indo para o Sheets (não podem mais ser cancelados)
+        self.falhas_seguidas = 0
+        self.lock = threading.Lock()
+        self._acordar = threading.Event()
+
+        self._reproduzir_diario()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="sheets-write-behind")
+        self._thread.start()
+
+    # --- API pública ---
+    def enfileirar(self, aba: str, row: list) -> str:
+        """Grava a linha no diário local e devolve o id da escrita pendente."""
+        entrada = {"op": "add", "id": uuid.uuid4().hex, "aba": aba, "row": row, "em": time.time()}
+        with self.lock:
+            self._gravar_no_diario(entrada)
+            self.pendentes.append(entrada)
+            if self.compartilhado is not None:
+                self.compartilhado.publicar_pendente(entrada)
+        self._acordar.set()
+        return entrada["id"]
+
+    def cancelar(self, id_escrita: str) -> bool:
+        """Remove uma escrita que ainda não foi enviada ao Sheets. False se não achou ou se já está indo."""
+        with self.lock:
+            if id_escrita in self.enviando:
+                return False
+            for i, entrada in enumerate(self.pendentes):
+                if entrada["id"] == id_escrita:
+                    self._gravar_no_diario({"op": "cancel", "id": id_escrita})
+                    del self.pendentes[i]
+                    if self.compartilhado is not None:
+                        self.compartilhado.remover_pendente(id_escrita)
+                    return True
+        return False
+
+    # --- Versões para o event loop (sempre numa thread: fsync e lock não bloqueiam o loop) ---
+    async def enfileirar_async(self, aba: str, row: list) -> str:
+        return await self._fora_do_loop(self.enfileirar, aba, row)
+
+    async def cancelar_async(self, id_escrita: str) -> bool:
+        return await self._fora_do_loop(self.cancelar, id_escrita)
+
+    async def pendentes_da_aba_async(self, aba: str):
+        return await self._fora_do_loop(self.pendentes_da_aba, aba)
+
+    async def _fora_do_loop(self, funcao, *args):
+        return await asyncio.to_thread(funcao, *args)
+
+    def pendentes_da_aba(self, aba: str):
+        """
+        Retorna [(id, row), ...] ainda não enviados, do mais antigo ao mais novo. Com cache
+        compartilhado, inclui os da fila dos outros processos (que não podem ser cancelados aqui)
+        e os já gravados que o snapshot compartilhado ainda não trouxe do Sheets.
+        """
+        with self.lock:
+            proprios = [(e.get("em", 0), e["id"], e["row"]) for e in self.pendentes if e["aba"] == aba]
+        if self.compartilhado is None:
+            return [(id_escrita, row) for _, id_escrita, row in proprios]
+        todos = proprios + self.compartilhado.pendentes_de_outros(aba)
+        return [(id_escrita, row) for _, id_escrita, row in sorted(todos, key=lambda e: e[0])]
+
+    def flush(self):
+        """Envia tudo o que está pendente, um lote por aba. Retorna False se algum envio falhou."""
+        with self.lock:
+            por_aba = {}
+            for entrada in self.pendentes:
+                por_aba.setdefault(entrada["aba"], []).append(entrada)
+        for aba, entradas in por_aba.items():
+            for inicio in range(0, len(entradas), MAX_LINHAS_POR_LOTE):
+                lote = entradas[inicio:inicio + MAX_LINHAS_POR_LOTE]
+                if not self._enviar_lote(aba, lote):
+                    return False
+        return True
+
+    # --- Internos ---
+    def _enviar_lote(self, aba, lote):
+        with self.lock:
+            # O que foi cancelado depois da cópia do flush não vai; o que vai não pode mais ser cancelado
+            ainda_pendentes = {e["id"] for e in self.pendentes}
+            lote = [e for e in lote if e["id"] in ainda_pendentes]
+            ids = {e["id"] for e in lote}
+            self.enviando |= ids
+        if not lote:
+            return True
+        try:
+            medir_gspread("append_rows", self.worksheets[aba].append_rows, [e["row"] for e in lote], value_input_option="RAW")
+        except Exception as e:
+            with self.lock:
+                self.enviando -= ids
+            self.falhas_seguidas += 1
+            print(f"Erro ao gravar lote de {len(lote)} linhas em '{aba}' (tentativa {self.falhas_seguidas}): {e}")
+            return False
+        self.falhas_seguidas = 0
+        SHEETS_LINHAS_GRAVADAS.inc(len(lote), aba=aba)
+        with self.lock:
+            self._gravar_no_diario({"op": "ack", "ids": sorted(ids)})
+            self.pendentes = [e for e in self.pendentes if e["id"] not in ids]
+            self.enviando -= ids
+            if self.compartilhado is not None:
+                # Marcadas como gravadas junto com a invalidação da aba, na mesma transação
+                self.compartilhado.concluir_pendentes(aba, ids)
+            if self.ao_gravar:
+                self.ao_gravar(aba)
+            if not self.pendentes:
+                self._compactar_diario()
+        print(f"Lote de {len(lote)} linhas gravado em '{aba}'.")
+        return True
+
+    def _loop(self):
+        while True:
+            # Dorme até chegar uma escrita e espera o intervalo para juntar mais linhas no mesmo lote
+            self._acordar.wait()
+            time.sleep(self.intervalo)
+            self._acordar.clear()
+            while not self.flush():
+                # Backoff exponencial com jitter; escritas novas não encurtam a espera
+                espera = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** self.falhas_seguidas)
+                time.sleep(espera * random.uniform(0.5, 1.5))
+
+    def _gravar_no_diario(self, registro):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _reproduzir_diario(self):
+        if not os.path.exists(self.journal_path):
+            return
+        adicionados, concluidos = [], set()
+        with open(self.journal_path, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue  # linha truncada por uma queda no meio da escrita
+                if registro["op"] == "add":
+                    adicionados.append(registro)
+                elif registro["op"] == "ack":
+                    concluidos.update(registro["ids"])
+                elif registro["op"] == "cancel":
+                    concluidos.add(registro["id"])
+        self.pendentes = [e for e in adicionados if e["id"] not in concluidos]
+        self._compactar_diario()
+        if self.pendentes:
+            print(f"Diário de escrita: {len(self.pendentes)} linhas pendentes recuperadas.")
+            if self.compartilhado is not None:
+                for entrada in self.pendentes:
+                    self.compartilhado.publicar_pendente(entrada)
+            self._acordar.set()
+
+    def _compactar_diario(self):
+        """Reescreve o diário só com as escritas pendentes (troca atômica do arquivo)."""
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entrada in self.pendentes:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+def como_celula(valor):
+    """Formata um valor pendente como o Sheets o devolveria numa leitura."""
+    if isinstance(valor, bool):
+        return "TRUE" if valor else "FALSE"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
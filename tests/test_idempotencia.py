@@ -0,0 +1,59 @@
+# tests/test_idempotencia.py
+import asyncio
+from services.idempotencia import EnviosIdempotentes
+
+def _envio_do_checkin(registro_id, analise_pronta):
+    """Como o fn_submit_checkin_paciente: grava, publica o registro_id e espera a análise."""
+    async def executar(envio):
+        envio.publicar({"registro_id": registro_id})
+        await analise_pronta.wait()
+        return "analise", registro_id
+    return executar
+
+def _descartar(envios, registro_id):
+    """O que o botão de descarte faz com os envios."""
+    envios.esquecer(lambda resultado: resultado[1] == registro_id,
+                    lambda parcial: parcial.get("registro_id") == registro_id)
+
+def test_descartar_durante_a_analise_e_reenviar_grava_de_novo():
+    async def cenario():
+        envios = EnviosIdempotentes()
+        analise_pronta = asyncio.Event()
+        primeiro, repetido = envios.iniciar("sessao:conteudo", _envio_do_checkin("r1", analise_pronta))
+        assert not repetido
+        await asyncio.sleep(0)  # a tarefa grava e publica o registro_id
+        assert primeiro.parcial == {"registro_id": "r1"}
+        _descartar(envios, "r1")
+        # A análise termina depois do descarte: o resultado não pode responder ao reenvio
+        analise_pronta.set()
+        assert await primeiro.resultado() == ("analise", "r1")
+        segundo, repetido = envios.iniciar("sessao:conteudo", _envio_do_checkin("r2", asyncio.Event()))
+        assert not repetido and segundo is not primeiro
+        segundo.tarefa.cancel()
+    asyncio.run(cenario())
+
+def test_descartar_depois_da_analise_e_reenviar_grava_de_novo():
+    async def cenario():
+        envios = EnviosIdempotentes()
+        analise_pronta = asyncio.Event()
+        analise_pronta.set()
+        primeiro, _ = envios.iniciar("sessao:conteudo", _envio_do_checkin("r1", analise_pronta))
+        await primeiro.resultado()
+        _descartar(envios, "r1")
+        segundo, repetido = envios.iniciar("sessao:conteudo", _envio_do_checkin("r2", analise_pronta))
+        assert not repetido and segundo is not primeiro
+        await segundo.resultado()
+    asyncio.run(cenario())
+
+def test_reenvio_sem_descarte_acompanha_o_envio_em_andamento():
+    async def cenario():
+        envios = EnviosIdempotentes()
+        analise_pronta = asyncio.Event()
+        primeiro, _ = envios.iniciar("sessao:conteudo", _envio_do_checkin("r1", analise_pronta))
+        await asyncio.sleep(0)
+        _descartar(envios, "outro-registro")
+        segundo, repetido = envios.iniciar("sessao:conteudo", _envio_do_checkin("r2", analise_pronta))
+        assert repetido and segundo is primeiro
+        analise_pronta.set()
+        assert await segundo.resultado() == ("analise", "r1")
+    asyncio.run(cenario())
@@ -0,0 +1,51 @@
+# tests/test_recados_vistos.py
+import asyncio
+import functools
+import os
+from benchmarks import run
+from benchmarks.fakes import Contador, FakeAsyncSheetsClient, gerar_planilha
+from services import sheets_service
+from services.sqlite_service import SQLiteService
+from services.write_queue import WriteBehindQueue
+
+def _abrir_e_voltar(servico, paciente_id, psicologa_id):
+    """Abre a caixa numa sessão, recebe um recado e confere o aviso de um login novo."""
+    async def cenario():
+        _, _, cursor, nao_lidos = await servico.get_recados_desde(paciente_id, None, limite=20)
+        assert nao_lidos > 0
+        await servico.marcar_recados_vistos(paciente_id, cursor)
+        # Outro login: a sessão nova não tem cursor, o armazenamento tem
+        visto = await servico.get_recados_vistos(paciente_id)
+        assert visto == cursor
+        assert (await servico.get_recados_desde(paciente_id, visto, limite=0))[3] == 0
+        ok, _ = await servico.send_recado(psicologa_id, paciente_id, "recado depois do logout")
+        assert ok
+        assert (await servico.get_recados_desde(paciente_id, visto, limite=0))[3] == 1
+        assert await servico.get_recados_vistos("outro_paciente") is None
+    asyncio.run(cenario())
+
+def test_sqlite_guarda_o_ultimo_recado_visto(tmp_path):
+    servico = SQLiteService(str(tmp_path / "painel.db"))
+    for i in range(3):
+        assert asyncio.run(servico.send_recado("psi", "paciente", f"recado {i}"))[0]
+    _abrir_e_voltar(servico, "paciente", "psi")
+    # O cursor sobrevive ao restart do app
+    servico.conn.close()
+    reaberto = SQLiteService(str(tmp_path / "painel.db"))
+    assert asyncio.run(reaberto.get_recados_vistos("paciente")) is not None
+
+def test_sheets_guarda_o_ultimo_recado_visto(tmp_path, monkeypatch):
+    run._preparar_ambiente(str(tmp_path))
+    monkeypatch.setattr(sheets_service, "cache_compartilhado", lambda: None)
+    monkeypatch.setattr(sheets_service, "RECADOS_VISTOS_PATH", str(tmp_path / "recados_vistos.json"))
+    monkeypatch.setattr(sheets_service, "WriteBehindQueue", functools.partial(
+        WriteBehindQueue, journal_path=str(tmp_path / "journal.jsonl"), intervalo=3600))
+    contador = Contador()
+    planilha, psicologa_de = gerar_planilha(200, 5, 1, 3, contador)
+    paciente_id = next(iter(psicologa_de))
+    servico = sheets_service.SheetsService(planilha, FakeAsyncSheetsClient(planilha, contador))
+    _abrir_e_voltar(servico, paciente_id, psicologa_de[paciente_id])
+    assert os.path.exists(sheets_service.RECADOS_VISTOS_PATH)
+    # Um processo novo (restart) lê o mesmo arquivo
+    outro = sheets_service.SheetsService(planilha, FakeAsyncSheetsClient(planilha, contador))
+    assert asyncio.run(outro.get_recados_vistos(paciente_id)) is not None
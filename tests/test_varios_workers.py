@@ -0,0 +1,121 @@
+# tests/test_varios_workers.py
+import asyncio
+import functools
+import pytest
+from benchmarks import run
+from benchmarks.fakes import Contador, FakeAsyncSheetsClient, gerar_planilha
+from models.schemas import CheckinFinal, GeminiResponse
+from services import sheets_service
+from services.shared_cache import CacheCompartilhado
+from services.storage_base import CHECKINS_HEADERS
+from services.write_queue import WriteBehindQueue
+
+LINHAS = 300
+REGISTRO = CHECKINS_HEADERS.index('registro_id')
+PACIENTE = CHECKINS_HEADERS.index('paciente_id')
+INSIGHT = CHECKINS_HEADERS.index('insight_ia')
+DESCARTADO = CHECKINS_HEADERS.index('descartado')
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Dois workers (A e B) sobre a mesma planilha e o mesmo arquivo de cache compartilhado."""
+    run._preparar_ambiente(str(tmp_path))
+    monkeypatch.setattr(sheets_service, "COMPACTION_INTERVAL_SECONDS", 0)
+    contador = Contador()
+    planilha, psicologa_de = gerar_planilha(LINHAS, 10, 2, 1, contador)
+    servicos = []
+    for processo in ("A", "B"):
+        cache = CacheCompartilhado(str(tmp_path / "cache.db"))
+        cache.processo = processo
+        monkeypatch.setattr(sheets_service, "cache_compartilhado", lambda: cache)
+        monkeypatch.setattr(sheets_service, "WriteBehindQueue", functools.partial(
+            WriteBehindQueue, journal_path=str(tmp_path / f"journal-{processo}.jsonl"), intervalo=3600))
+        # Latência nas chamadas à API para as tarefas concorrentes se intercalarem de fato
+        servicos.append(sheets_service.SheetsService(planilha, FakeAsyncSheetsClient(planilha, contador, latencia=0.005)))
+    return planilha, psicologa_de, servicos[0], servicos[1]
+
+def _na_planilha(planilha):
+    """registro_id -> linha, como está no Sheets (fake)."""
+    return {row[REGISTRO]: row for row in planilha.worksheet("Checkins").rows[1:]}
+
+def _registros(headers, rows):
+    return [row[headers.index('registro_id')] for row in rows]
+
+def test_usuario_e_checkin_pendentes_aparecem_no_outro_worker(workers):
+    planilha, psicologa_de, a, b = workers
+    async def cenario():
+        psicologa = next(iter(psicologa_de.values()))
+        assert (await a.create_user("paciente_novo", "segredo1", psicologa))[0]
+        # Ainda na fila de A: B já enxerga e não deixa criar de novo
+        assert (await b.check_user("paciente_novo", "segredo1"))[0]
+        assert not (await b.create_user("paciente_novo", "outra123", psicologa))[0]
+
+        paciente = next(iter(psicologa_de))
+        checkin = CheckinFinal(sentimento=3, topicos_selecionados=["Sono"], diario_texto="escrito em A")
+        registro_id = await a.write_checkin(checkin, GeminiResponse(), paciente, psicologa_de[paciente], True)
+        assert registro_id not in _na_planilha(planilha)
+        headers, rows = await b.get_all_checkin_data()
+        assert len(rows) == LINHAS + 1 and _registros(headers, rows).count(registro_id) == 1
+        # Depois do envio, nem B nem A mostram o check-in duas vezes (fila + aba)
+        await asyncio.to_thread(a.write_queue.flush)
+        assert registro_id in _na_planilha(planilha)
+        for servico in (a, b):
+            headers, rows = await servico.get_all_checkin_data()
+            assert len(rows) == LINHAS + 1 and _registros(headers, rows).count(registro_id) == 1
+    asyncio.run(cenario())
+
+def test_descarte_e_analise_chegam_ao_outro_worker(workers):
+    planilha, _, a, b = workers
+    async def cenario():
+        linhas = planilha.worksheet("Checkins").rows
+        descartado, analisado = linhas[10], linhas[20]
+        assert await b.discard_checkin(descartado[PACIENTE], descartado[REGISTRO])
+        headers, rows = await a.get_all_checkin_data()
+        assert len(rows) == LINHAS - 1 and descartado[REGISTRO] not in _registros(headers, rows)
+        assert await a.atualizar_analises([(analisado[REGISTRO], "", "", GeminiResponse(insight="NOVO"))]) == 1
+        headers, rows = await b.get_all_checkin_data()
+        por_registro = {row[REGISTRO]: row for row in rows}
+        assert por_registro[analisado[REGISTRO]][INSIGHT] == "NOVO"
+    asyncio.run(cenario())
+
+async def _depois(segundos, tarefa):
+    await asyncio.sleep(segundos)
+    return await tarefa
+
+def test_compactacao_concorrente_com_descarte_e_analise(workers, monkeypatch):
+    planilha, _, a, b = workers
+    # Uma linha por lote: a análise de B fica várias chamadas à API com a reserva na mão
+    monkeypatch.setattr(sheets_service, "REANALISE_LINHAS_POR_CHAMADA", 1)
+    async def cenario():
+        originais = _na_planilha(planilha)
+        registros = list(originais)
+        analisados = registros[150:300:10]
+        # Cada rodada: A descarta linhas do topo (a compactação renumera o resto da aba)
+        # e compacta enquanto B escreve por nº de linha
+        for rodada, escrita_de_b in enumerate((
+            lambda: b.discard_checkin(originais[registros[120]][PACIENTE], registros[120]),
+            lambda: b.atualizar_analises([(r, "", "", GeminiResponse(insight="DE B")) for r in analisados]),
+        )):
+            tombstones = registros[rodada * 60:rodada * 60 + 60:5]
+            for registro_id in tombstones:
+                assert await a.discard_checkin(originais[registro_id][PACIENTE], registro_id)
+            resultado, compactadas = await asyncio.gather(escrita_de_b(), _depois(0.02, a.compactar()))
+            assert resultado and compactadas >= len(tombstones)
+
+        final = _na_planilha(planilha)
+        assert not set(registros[0:120:5]) & set(final)
+        # O descarte de B vira tombstone ou já foi apagado, se chegou antes da compactação
+        if registros[120] in final:
+            assert final[registros[120]][DESCARTADO] == "TRUE"
+        assert sum(row[DESCARTADO] == "TRUE" for row in final.values()) <= 1
+        # Cada análise caiu no registro (e no paciente) certo, e em nenhum outro
+        for registro_id in analisados:
+            assert final[registro_id][INSIGHT] == "DE B"
+            assert final[registro_id][PACIENTE] == originais[registro_id][PACIENTE]
+        assert sum(row[INSIGHT] == "DE B" for row in final.values()) == len(analisados)
+        # Os dois workers terminam vendo a aba como ela está
+        visiveis = {r for r, row in final.items() if row[DESCARTADO] != "TRUE"}
+        for servico in (a, b):
+            headers, rows = await servico.get_all_checkin_data()
+            assert set(_registros(headers, rows)) == visiveis
+    asyncio.run(cenario())
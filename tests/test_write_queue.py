@@ -0,0 +1,38 @@
+# tests/test_write_queue.py
+import asyncio
+import threading
+import time
+from services.write_queue import WriteBehindQueue
+
+class _Aba:
+    title = "Checkins"
+
+def test_enfileirar_async_sem_cache_compartilhado_nao_bloqueia_o_loop(tmp_path):
+    fila = WriteBehindQueue({"Checkins": _Aba()}, journal_path=str(tmp_path / "journal.jsonl"), intervalo=3600)
+    assert fila.compartilhado is None
+    async def cenario():
+        ticks = 0
+        parar = asyncio.Event()
+        async def relogio():
+            nonlocal ticks
+            while not parar.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+        tarefa_relogio = asyncio.create_task(relogio())
+        # A thread de envio (ou um fsync lento) segura o lock da fila
+        segurando = threading.Event()
+        def segurar_lock():
+            with fila.lock:
+                segurando.set()
+                time.sleep(0.3)
+        thread = threading.Thread(target=segurar_lock)
+        thread.start()
+        await asyncio.to_thread(segurando.wait)
+        antes = ticks
+        id_escrita = await fila.enfileirar_async("Checkins", ["linha"])
+        parar.set()
+        await tarefa_relogio
+        thread.join()
+        assert ticks - antes > 10, "o event loop ficou parado esperando o diário"
+        assert [id_ for id_, _ in await fila.pendentes_da_aba_async("Checkins")] == [id_escrita]
+    asyncio.run(cenario())